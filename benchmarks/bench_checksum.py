@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of the checksum computation of SDS files.
+
+Computes the checksums of a temporary file in fresh interpreters, and reports
+the throughput and the peak RSS of the process (measured by the kernel, so it
+includes the interpreter) for the Adler-32 checksum alone, and for the Adler-32
+and iRODS (SHA-256) checksums together when the code supports it.
+
+Usage: python3 benchmarks/bench_checksum.py [--size MB] [--runs N] [--repo PATH]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+
+
+def child(repo, archive, filename, irods):
+    """Computes the checksums in this process and prints the measurements as JSON."""
+
+    sys.path.insert(0, repo)
+    from sds.sdsfile import SDSFile
+
+    sds_file = SDSFile(filename, archive)
+    start = time.perf_counter()
+    sds_file.checksum
+    if irods:
+        sds_file.irods_checksum
+    elapsed = time.perf_counter() - start
+
+    # Kilobytes on Linux
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"elapsed": elapsed, "max_rss": max_rss}))
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=512, help="size of the file in MB")
+    parser.add_argument("--runs", type=int, default=3, help="number of runs of each mode")
+    parser.add_argument("--repo", default=os.path.join(os.path.dirname(__file__), ".."),
+                        help="path of the rule manager code to benchmark")
+    parser.add_argument("--child", nargs=3, metavar=("ARCHIVE", "FILENAME", "IRODS"),
+                        help=argparse.SUPPRESS)
+    parsedargs = parser.parse_args()
+
+    repo = os.path.abspath(parsedargs.repo)
+
+    if parsedargs.child is not None:
+        archive, filename, irods = parsedargs.child
+        return child(repo, archive, filename, irods == "1")
+
+    # Create the file in a temporary archive
+    tmp_dir = tempfile.mkdtemp()
+    filename = "NL.HGN.02.BHZ.D.2019.001"
+    archive = os.path.join(tmp_dir, "SDS")
+    directory = os.path.join(archive, "2019", "NL", "HGN", "BHZ.D")
+    os.makedirs(directory)
+    with open(os.path.join(directory, filename), "wb") as f:
+        for _ in range(parsedargs.size):
+            f.write(os.urandom(1024 * 1024))
+
+    # The iRODS checksum is only measured if the code has it
+    sys.path.insert(0, repo)
+    from sds.sdsfile import SDSFile
+    modes = [("adler32", "0")]
+    if hasattr(SDSFile, "irods_checksum"):
+        modes.append(("adler32+sha256", "1"))
+
+    for name, irods in modes:
+        results = []
+        for _ in range(parsedargs.runs):
+            output = subprocess.check_output([
+                sys.executable, os.path.abspath(__file__), "--repo", repo,
+                "--child", archive, filename, irods])
+            results.append(json.loads(output.decode().splitlines()[-1]))
+        elapsed = min(result["elapsed"] for result in results)
+        max_rss = max(result["max_rss"] for result in results)
+        print("%-15s %8.1f MB/s  peak RSS %8.1f MB" % (
+            name, parsedargs.size / elapsed, max_rss / 1024))
+
+
+if __name__ == "__main__":
+    main()
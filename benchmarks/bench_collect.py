@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of the collection of the files of an SDS archive.
+
+Creates a temporary archive of empty files (several years, networks, stations
+and channels), and collects the files with some typical filters, reporting the
+time, the number of directories listed and the number of `os.stat` calls of
+the collection, including the stat of the collected files by the rules. The
+stat taken with `os.scandir` while walking the archive is not counted.
+
+Usage: python3 benchmarks/bench_collect.py [--stations N] [--days N] [--repo PATH]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stations", type=int, default=20, help="number of stations per network")
+    parser.add_argument("--days", type=int, default=30, help="number of days per year")
+    parser.add_argument("--repo", default=os.path.join(os.path.dirname(__file__), ".."),
+                        help="path of the rule manager code to benchmark")
+    parsedargs = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(parsedargs.repo))
+
+    from sds.sdsfile import SDSFile, sds_file_registry
+    from sds.sdscollector import SDSFileCollector
+
+    # Create the files in the archive
+    archive = os.path.join(tempfile.mkdtemp(), "SDS")
+    n_files = 0
+    for year in range(2020, 2025):
+        for network in ["NL", "NA", "NR"]:
+            for i in range(parsedargs.stations):
+                for channel in ["BHZ", "BHN", "BHE", "HHZ", "HHN", "HHE"]:
+                    for day in range(1, parsedargs.days + 1):
+                        sds_file = SDSFile("%s.S%03d.02.%s.D.%d.%03d"
+                                           % (network, i, channel, year, day), archive)
+                        if day == 1:
+                            os.makedirs(sds_file.directory, exist_ok=True)
+                        open(sds_file.filepath, "wb").close()
+                        n_files += 1
+    print("archive    %8d files" % n_files)
+
+    # Count the directory listings and stat calls
+    counts = {"list": 0, "stat": 0}
+    original = {"scandir": os.scandir, "listdir": os.listdir, "stat": os.stat}
+
+    def counting(name, function):
+        def wrapper(*args, **kwargs):
+            counts[name] += 1
+            return function(*args, **kwargs)
+        return wrapper
+
+    os.scandir = counting("list", original["scandir"])
+    os.listdir = counting("list", original["listdir"])
+    os.stat = counting("stat", original["stat"])
+
+    queries = [
+        ("all", []),
+        ("wildcard", [("filter_from_wildcards_array", (["NL.S001.*.BH?.D.2024.*"],))]),
+        ("days", [("filter_from_date_range", ("2024-01-01", 7))]),
+        ("file list", [("filter_from_file_list", (["NA.S002.02.HHZ.D.2022.%03d" % day
+                                                     for day in range(1, 11)],))])
+    ]
+
+    for name, filters in queries:
+
+        sds_file_registry.clear()
+        counts["list"] = counts["stat"] = 0
+
+        start = time.perf_counter()
+        collector = SDSFileCollector(archive)
+        for method, args in filters:
+            getattr(collector, method)(*args)
+        files = collector.files
+
+        # The stat the rules take of every collected file
+        [sds_file.modified for sds_file in files]
+        elapsed = time.perf_counter() - start
+
+        print("%-10s %8d files %8.1f ms %8d listed %8d stat" % (
+            name, len(files), 1e3 * elapsed, counts["list"], counts["stat"]))
+
+    os.scandir = original["scandir"]
+    os.listdir = original["listdir"]
+    os.stat = original["stat"]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of the collection of the files of a list written by the collector, as
+done by `sdsmanager.py --from_file`.
+
+Creates a temporary archive of empty files (several networks, stations and
+channels), writes the list of the files of some stations in every format, and
+collects the listed files: looking up the filenames in the archive, or taking
+the paths as they are (and taking their stat). A latency is added to every
+directory listing (`os.scandir`) and every stat (`os.stat` and `DirEntry.stat`)
+to simulate the round trips of a shared filesystem. Reports the time to write
+and collect every format and the numbers of listings and stats, and checks that
+the files are the same.
+
+Usage: python3 benchmarks/bench_filelist.py [--latency MS] [--workers N] [--repo PATH]
+"""
+
+import io
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=2, help="latency per listing and stat in ms")
+    parser.add_argument("--workers", type=int, default=16, help="number of threads")
+    parser.add_argument("--stations", type=int, default=20, help="number of stations per network")
+    parser.add_argument("--repo", default=os.path.join(os.path.dirname(__file__), ".."),
+                        help="path of the rule manager code to benchmark")
+    parsedargs = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(parsedargs.repo))
+
+    from sds.sdsfile import SDSFile, sds_file_registry
+    from sds.sdscollector import SDSFileCollector
+
+    try:
+        from sds.filelist import write_file_list, read_file_list
+    except ImportError:
+        write_file_list = read_file_list = None
+
+    directory = tempfile.mkdtemp()
+    archive = os.path.join(directory, "SDS")
+
+    for network in ["NL", "NA", "NR"]:
+        for i in range(parsedargs.stations):
+            for channel in ["BHZ", "BHN", "BHE", "HHZ", "HHN", "HHE"]:
+                for day in range(1, 31):
+                    sds_file = SDSFile("%s.S%03d.02.%s.D.2024.%03d" % (network, i, channel, day),
+                                       archive)
+                    os.makedirs(sds_file.directory, exist_ok=True)
+                    open(sds_file.filepath, "wb").close()
+
+    # The list of the files of every other station
+    collector = SDSFileCollector(archive, manifest=False)
+    collector.filter_from_wildcards_array(["*.S??[02468].*.*.*.*.*"])
+    collector.files
+    expected = sorted(sds_file.filename for sds_file in collector.iter_files())
+
+    # Every listing and stat is a round trip
+    original_scandir = os.scandir
+    original_stat = os.stat
+    listings = [0]
+    stats = [0]
+
+    class SlowEntry():
+
+        def __init__(self, entry):
+            self.entry = entry
+            self.name = entry.name
+            self.path = entry.path
+            self._stat = None
+
+        def is_dir(self):
+            return self.entry.is_dir()
+
+        def is_file(self):
+            return self.entry.is_file()
+
+        # Cached, as by DirEntry
+        def stat(self):
+            if self._stat is None:
+                self._stat = slow_stat(self.path)
+            return self._stat
+
+    class SlowScandir():
+
+        def __init__(self, path):
+            listings[0] += 1
+            time.sleep(parsedargs.latency / 1e3)
+            self.entries = [SlowEntry(entry) for entry in original_scandir(path)]
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            return False
+
+        def __iter__(self):
+            return iter(self.entries)
+
+    def slow_stat(*args, **kwargs):
+        stats[0] += 1
+        time.sleep(parsedargs.latency / 1e3)
+        return original_stat(*args, **kwargs)
+
+    print("%d files listed, %d threads, %.1f ms per round trip"
+          % (len(expected), parsedargs.workers, parsedargs.latency))
+
+    for list_format in ["names", "nul", "jsonl"]:
+
+        if write_file_list is None and list_format != "names":
+            continue
+
+        # Written from the collected files
+        begin = time.perf_counter()
+        list_file = io.StringIO()
+        if write_file_list is not None:
+            write_file_list(collector.iter_file_sets(), [list_file], list_format)
+        else:
+            for sds_file in collector.iter_files():
+                list_file.write(sds_file.filename + "\n")
+        written = time.perf_counter() - begin
+
+        sds_file_registry.clear()
+        os.scandir = SlowScandir
+        os.stat = slow_stat
+        listings[0] = 0
+        stats[0] = 0
+
+        begin = time.perf_counter()
+        listed = SDSFileCollector(archive, workers=parsedargs.workers, manifest=False)
+        list_file.seek(0)
+        if read_file_list is not None:
+            read_format, file_set = read_file_list(list_file, archive)
+            if read_format == "names":
+                listed.filter_from_file_list(file_set.filenames)
+            else:
+                listed.filter_from_file_set(file_set)
+        else:
+            listed.filter_from_file_list([line.strip() for line in list_file])
+        files = sorted(sds_file.filename for sds_file in listed.files)
+        elapsed = time.perf_counter() - begin
+
+        os.scandir = original_scandir
+        os.stat = original_stat
+
+        print("%-6s write %7.1f ms, collect %8.1f ms, %5d listings %6d stats %s" % (
+            list_format, 1e3 * written, 1e3 * elapsed, listings[0], stats[0],
+            "ok" if files == expected else "DIFFERENT"))
+
+    shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of the representation of the collected files, and of the filters of
+the SDSFileCollector on them.
+
+Creates the collected files of a synthetic archive in memory (with a stat
+snapshot each, as taken while walking), as the collector of the given code keeps
+them (an SDSFileSet in columns, or a list of SDSFiles), and reports the memory
+they take, and the time to build them, to filter them (with the filters given
+after collecting the files, and by the day of their name, one day at a time), to
+sort them, and to iterate them as SDSFiles.
+
+Usage: python3 benchmarks/bench_fileset.py [--files N] [--repo PATH]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+from datetime import datetime, timedelta
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=500000, help="number of files")
+    parser.add_argument("--repo", default=os.path.join(os.path.dirname(__file__), ".."),
+                        help="path of the rule manager code to benchmark")
+    parsedargs = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(parsedargs.repo))
+
+    from sds.sdsfile import sds_file_registry
+    from sds.sdscollector import SDSFileCollector
+
+    try:
+        from sds.fileset import SDSFileSet
+    except ImportError:
+        SDSFileSet = None
+
+    # One year of files of every stream, modified on the following day
+    n_streams = max(1, parsedargs.files // 365)
+    start = datetime(2020, 1, 1)
+    files = []
+    for i in range(n_streams):
+        for day in range(365):
+            mtime = (start + timedelta(days=day + 1, seconds=i)).timestamp()
+            stat = os.stat_result((0o100644, i * 365 + day, 1, 1, 0, 0, 4096 * 100,
+                                   int(mtime), int(mtime), int(mtime),
+                                   mtime, mtime, mtime, int(mtime * 1e9), int(mtime * 1e9),
+                                   int(mtime * 1e9)))
+            files.append(("NL.S%05d.02.HHZ.D.2020.%03d" % (i, day + 1), stat))
+
+    def build():
+        if SDSFileSet is not None:
+            return SDSFileSet.from_rows("/archive", [SDSFileSet.stat_row(filename, stat)
+                                                     for filename, stat in files])
+        built = []
+        for filename, stat in files:
+            sds_file = sds_file_registry.get(filename, "/archive")
+            sds_file.set_stats(stat)
+            built.append(sds_file)
+        return built
+
+    begin = time.perf_counter()
+    collected = build()
+    elapsed = time.perf_counter() - begin
+
+    # Built again for the memory, as tracing is slow
+    del collected
+    sds_file_registry.clear()
+    tracemalloc.start()
+    collected = build()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print("%s, %d files" % ("columns" if SDSFileSet is not None else "list of SDSFiles",
+                            len(collected)))
+    print("%-16s %8.1f ms %8.1f MB" % ("build", 1e3 * elapsed, memory / 1024 ** 2))
+
+    changes = [("NL.S%05d.02.HHZ" % i, datetime(2020, 3, 1, 12), datetime(2020, 3, 8))
+               for i in range(0, n_streams, 10)]
+    file_list = [filename for filename, _ in files[::100]]
+
+    filters = [
+        ("finished", lambda c: c.filter_finished_files(0)),
+        ("modified", lambda c: c.filter_from_date_range(datetime(2020, 6, 1), 30,
+                                                        mode="mod_time")),
+        ("file name date", lambda c: c.filter_from_date_range(datetime(2020, 6, 1), 30)),
+        ("file list", lambda c: c.filter_from_file_list(file_list)),
+        ("metadata", lambda c: c.filter_from_metadata_changes(changes)),
+        ("sort", lambda c: c.sort_files("desc"))
+    ]
+
+    for name, function in filters:
+
+        collector = SDSFileCollector("/archive", manifest=False)
+        collector.files = collected
+
+        begin = time.perf_counter()
+        function(collector)
+        elapsed = time.perf_counter() - begin
+
+        print("%-16s %8.1f ms %8d files" % (name, 1e3 * elapsed, len(collector.files)))
+
+    # The same files, day by day
+    collector = SDSFileCollector("/archive", manifest=False)
+    begin = time.perf_counter()
+    n_files = 0
+    for day in range(30):
+        collector.files = collected
+        collector.filter_from_date_range(datetime(2020, 6, 1) + timedelta(days=day), 1)
+        n_files += len(collector.files)
+    elapsed = time.perf_counter() - begin
+    print("%-16s %8.1f ms %8d files" % ("30 single days", 1e3 * elapsed, n_files))
+
+    begin = time.perf_counter()
+    for sds_file in collected:
+        pass
+    print("%-16s %8.1f ms" % ("iterate", 1e3 * (time.perf_counter() - begin)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of the logging overhead of the rule manager per item.
+
+Runs a sequence of rules that do nothing on SDS files of a temporary archive,
+logging to a temporary file, and reports the time and the number of `os.stat`
+calls per item, at the INFO level (every rule logs a record) and at the WARNING
+level (all the records of the sequence are filtered out).
+
+Usage: python3 benchmarks/bench_logging.py [--items N] [--rules N] [--repo PATH]
+"""
+
+import os
+import sys
+import json
+import time
+import types
+import argparse
+import tempfile
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=2000, help="number of SDS files")
+    parser.add_argument("--rules", type=int, default=10, help="number of rules in the sequence")
+    parser.add_argument("--repo", default=os.path.join(os.path.dirname(__file__), ".."),
+                        help="path of the rule manager code to benchmark")
+    parsedargs = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(parsedargs.repo))
+    tmp_dir = tempfile.mkdtemp()
+
+    # Log to a file, like in production
+    from configuration import config
+    config["LOGGING"] = {"LEVEL": "INFO", "FILENAME": os.path.join(tmp_dir, "bench.log")}
+    config["RULE_TIMING_DB"] = os.path.join(tmp_dir, "rule_timing.db")
+
+    import logging
+    import core.logger
+    from core.rulemanager import RuleManager
+    from sds.sdsfile import SDSFile
+
+    # Rules and conditions that do nothing
+    rules = types.ModuleType("rules")
+    rules.pass_rule = lambda options, sds_file: None
+    conditions = types.ModuleType("conditions")
+    conditions.true_condition = lambda options, sds_file: True
+
+    rule_map = {"RULE_%d" % i: {"function_name": "pass_rule", "options": {},
+                                "conditions": [{"function_name": "true_condition",
+                                                "options": {}}]}
+                for i in range(parsedargs.rules)}
+    with open(os.path.join(tmp_dir, "rule_map.json"), "w") as rule_map_file:
+        json.dump(rule_map, rule_map_file)
+    with open(os.path.join(tmp_dir, "rule_seq.json"), "w") as rule_seq_file:
+        json.dump({"rule_map": os.path.join(tmp_dir, "rule_map.json"),
+                   "sequence": sorted(rule_map)}, rule_seq_file)
+
+    # Create the files in the archive
+    archive = os.path.join(tmp_dir, "SDS")
+    items = []
+    for i in range(parsedargs.items):
+        sds_file = SDSFile("NL.HGN.02.BHZ.D.2019.%03d" % (i % 365 + 1), archive)
+        os.makedirs(sds_file.directory, exist_ok=True)
+        open(sds_file.filepath, "w").close()
+        items.append(sds_file)
+
+    RM = RuleManager()
+    RM.load_rules(rules, conditions, os.path.join(tmp_dir, "rule_seq.json"))
+
+    # Count the stat calls
+    n_stat = [0]
+    original_stat = os.stat
+
+    def counting_stat(*args, **kwargs):
+        n_stat[0] += 1
+        return original_stat(*args, **kwargs)
+
+    os.stat = counting_stat
+
+    for level in ("INFO", "WARNING"):
+        logging.getLogger("RuleManager").setLevel(level)
+        n_stat[0] = 0
+        start = time.perf_counter()
+        RM.sequence(items)
+        elapsed = time.perf_counter() - start
+        print("%-7s %8.1f us/item %6.1f stat/item" % (
+            level, 1e6 * elapsed / len(items), n_stat[0] / len(items)))
+
+    os.stat = original_stat
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of the collection of an SDS archive from its manifest, against a walk.
+
+Creates a temporary archive of empty files (several years, networks, stations
+and channels), dated some days back, and collects the finished files, or the
+files of a wildcard (which prunes the walk), with a walk of the archive, and
+from the manifest: after the first (full) refresh, after a refresh without
+changes, and after a refresh with a new day of files in some channels. A
+latency is added to every directory listing (`os.scandir`) and every stat
+(`os.stat` and `DirEntry.stat`) to simulate the round trips of a shared
+filesystem. Reports the time and the numbers of listings and stats, and checks
+that the files are the same as the walk.
+
+Usage: python3 benchmarks/bench_manifest.py [--latency MS] [--workers N] [--repo PATH]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=5, help="latency per listing and stat in ms")
+    parser.add_argument("--workers", type=int, default=16, help="number of threads")
+    parser.add_argument("--stations", type=int, default=10, help="number of stations per network")
+    parser.add_argument("--repo", default=os.path.join(os.path.dirname(__file__), ".."),
+                        help="path of the rule manager code to benchmark")
+    parsedargs = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(parsedargs.repo))
+
+    from sds.sdsfile import SDSFile, sds_file_registry
+    from sds.sdscollector import SDSFileCollector
+    from sds.manifest import ArchiveManifest
+    from core.database import ManifestDatabase
+    import sds.manifest
+    import sds.sdscollector
+
+    directory = tempfile.mkdtemp()
+    archive = os.path.join(directory, "SDS")
+
+    # The manifest of the benchmark only
+    database = ManifestDatabase()
+    database.filename = os.path.join(directory, "manifest.db")
+    sds.manifest.manifest_database = database
+    sds.sdscollector.archive_manifest = ArchiveManifest(2 * 86400)
+
+    def create(filename):
+        sds_file = SDSFile(filename, archive)
+        os.makedirs(sds_file.directory, exist_ok=True)
+        open(sds_file.filepath, "wb").close()
+        return sds_file
+
+    # Create the files in the archive, modified 10 days ago
+    past = time.time() - 10 * 86400
+    for year in range(2022, 2025):
+        for network in ["NL", "NA", "NR"]:
+            for i in range(parsedargs.stations):
+                for channel in ["BHZ", "BHN", "BHE", "HHZ", "HHN", "HHE"]:
+                    for day in range(1, 11):
+                        sds_file = create("%s.S%03d.02.%s.D.%d.%03d"
+                                          % (network, i, channel, year, day))
+                        os.utime(sds_file.filepath, (past, past))
+    for path, _, _ in os.walk(archive):
+        os.utime(path, (past, past))
+
+    # Every listing and stat is a round trip
+    original_scandir = os.scandir
+    original_stat = os.stat
+    listings = [0]
+    stats = [0]
+
+    class SlowEntry():
+
+        def __init__(self, entry):
+            self.entry = entry
+            self.name = entry.name
+            self.path = entry.path
+            self._stat = None
+
+        def is_dir(self):
+            return self.entry.is_dir()
+
+        def is_file(self):
+            return self.entry.is_file()
+
+        # Cached, as by DirEntry
+        def stat(self):
+            if self._stat is None:
+                self._stat = slow_stat(self.path)
+            return self._stat
+
+    class SlowScandir():
+
+        def __init__(self, path):
+            listings[0] += 1
+            time.sleep(parsedargs.latency / 1e3)
+            self.entries = [SlowEntry(entry) for entry in original_scandir(path)]
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            return False
+
+        def __iter__(self):
+            return iter(self.entries)
+
+    def slow_scandir(path):
+        return SlowScandir(path)
+
+    def slow_stat(*args, **kwargs):
+        stats[0] += 1
+        time.sleep(parsedargs.latency / 1e3)
+        return original_stat(*args, **kwargs)
+
+    def collect(manifest, wildcards):
+        sds_file_registry.clear()
+        listings[0] = 0
+        stats[0] = 0
+        collector = SDSFileCollector(archive, workers=parsedargs.workers, manifest=manifest)
+        if wildcards:
+            collector.filter_from_wildcards_array(["NL.*.*.BH?.D.2024.*"])
+        else:
+            collector.filter_finished_files(0)
+        start = time.perf_counter()
+        files = sorted(x.filename for x in collector.files)
+        return files, time.perf_counter() - start, listings[0], stats[0]
+
+    os.scandir = slow_scandir
+    os.stat = slow_stat
+
+    print("%d threads, %.1f ms per round trip" % (parsedargs.workers, parsedargs.latency))
+
+    for name, change in [("walk", None), ("first refresh", None), ("no change", None),
+                         ("new day", 11)]:
+
+        # A new day of files in some channels
+        if change is not None:
+            os.scandir = original_scandir
+            os.stat = original_stat
+            for i in range(0, parsedargs.stations, 2):
+                create("NL.S%03d.02.BHZ.D.2024.%03d" % (i, change))
+            os.scandir = slow_scandir
+            os.stat = slow_stat
+
+        for wildcards in [False, True]:
+
+            files, elapsed, listed, statted = collect(name != "walk", wildcards)
+
+            # Same files as a walk of the archive at this point
+            os.scandir = original_scandir
+            os.stat = original_stat
+            expected = collect(False, wildcards)[0]
+            os.scandir = slow_scandir
+            os.stat = slow_stat
+
+            print("%-14s %-9s %6d files %5d listings %6d stats %8.1f ms %s" % (
+                name, "wildcard" if wildcards else "finished", len(files), listed, statted,
+                1e3 * elapsed, "ok" if files == expected else "DIFFERENT"))
+
+    os.scandir = original_scandir
+    os.stat = original_stat
+    database.disconnect()
+
+
+if __name__ == "__main__":
+    main()
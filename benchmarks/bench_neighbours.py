@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of the reads of the neighbouring files by the PPSD and WFCatalog rules.
+
+Creates a temporary archive with consecutive days of one stream (records of 512
+bytes, crossing the day boundaries as in a real archive), and runs the WFCatalog
+metadata extraction and the PSD data reading on every day that has neighbours
+on both sides, reporting the time and the bytes read from the disk per file.
+The page cache of the archive is dropped before every file (with
+`posix_fadvise`), so that the bytes read (`read_bytes` of /proc/self/io)
+include the pages of memory-mapped files. The days are processed in order, so
+that the waveform cache (if enabled with --cache) holds the neighbours.
+
+Usage: python3 benchmarks/bench_neighbours.py [--days N] [--cache MB] [--repo PATH]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+
+def bytes_read():
+    """Returns the bytes read from the disk by this process."""
+
+    with open("/proc/self/io") as f:
+        for line in f:
+            if line.startswith("read_bytes:"):
+                return int(line.split()[1])
+
+
+def drop_page_cache(sds_files):
+    """Drops the pages of the files from the page cache."""
+
+    for sds_file in sds_files:
+        fd = os.open(sds_file.filepath, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=5, help="number of days in the archive")
+    parser.add_argument("--cache", type=int, default=0,
+                        help="size of the waveform cache in MB (default 0, disabled)")
+    parser.add_argument("--repo", default=os.path.join(os.path.dirname(__file__), ".."),
+                        help="path of the rule manager code to benchmark")
+    parsedargs = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(parsedargs.repo))
+
+    from configuration import config
+    config["WAVEFORM_CACHE_BYTES"] = parsedargs.cache * 1024 ** 2
+
+    import numpy as np
+    from obspy import Trace, UTCDateTime
+    from sds.sdsfile import SDSFile
+    if parsedargs.cache > 0:
+        from sds.sdsfile import waveform_cache
+    from modules.wfcatalog import get_wf_metadata
+    from modules.psd2.psd import PSDCollector
+
+    # One day of 40 Hz data per file, with some minutes of the adjacent days
+    archive = os.path.join(tempfile.mkdtemp(), "SDS")
+    rng = np.random.default_rng(0)
+    sds_files = []
+    for day in range(1, parsedargs.days + 1):
+        sds_file = SDSFile("NL.HGN.02.BHZ.D.2019.%03d" % day, archive)
+        start = UTCDateTime(sds_file.start) - 60
+        trace = Trace(np.cumsum(rng.integers(-50, 50, (86400 + 180) * 40)).astype(np.int32),
+                      header={"network": "NL", "station": "HGN", "location": "02",
+                              "channel": "BHZ", "sampling_rate": 40.0, "starttime": start})
+        os.makedirs(sds_file.directory, exist_ok=True)
+        trace.write(sds_file.filepath, format="MSEED", reclen=512)
+        sds_files.append(sds_file)
+
+    middle = sds_files[1:-1]
+    collector = PSDCollector(connect_sql=False)
+    steps = [
+        ("wfcatalog", lambda sds_file: get_wf_metadata(sds_file)),
+        ("psd read", lambda sds_file: collector.readData(sds_file))
+    ]
+
+    size = sum(sds_file.size for sds_file in middle) / len(middle)
+    print("file size %8.1f MB" % (size / 1024 ** 2))
+    for name, step in steps:
+        if parsedargs.cache > 0:
+            waveform_cache.clear()
+        elapsed = 0
+        read = 0
+        for sds_file in middle:
+            drop_page_cache(sds_files)
+            read_start = bytes_read()
+            start = time.perf_counter()
+            step(sds_file)
+            elapsed += time.perf_counter() - start
+            read += bytes_read() - read_start
+        print("%-10s %8.1f ms/file %8.1f MB read/file" % (
+            name, 1e3 * elapsed / len(middle), read / 1024 ** 2 / len(middle)))
+        if parsedargs.cache > 0:
+            print(waveform_cache.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark and cross-validation of the pruning engines of SDSFile.
+
+Prunes every D file of a copy of an archive with each available engine
+("dataselect", if the IRIS tools are in $PATH, and "obspy"), and reports the
+time per file. The pruned files are checked against each other (same trace
+summary and same samples), or, without the IRIS tools, against the trace
+summary of the original file.
+
+Usage: python3 benchmarks/bench_prune.py [--archive PATH] [--repack] [--repo PATH]
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repo", default=os.path.join(os.path.dirname(__file__), ".."),
+                        help="path of the rule manager code to benchmark")
+    parser.add_argument("--archive", default=os.path.join(os.path.dirname(__file__), "..",
+                                                          "test", "data", "SDS"),
+                        help="SDS archive with the files to prune (it is not modified)")
+    parser.add_argument("--repack", action="store_true", help="repack to 4096 byte records")
+    parsedargs = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(parsedargs.repo))
+
+    import numpy as np
+    from datetime import timedelta
+    from obspy import read
+    from sds.sdsfile import sds_file_registry
+    from sds.mseed import scan_traces
+
+    engines = ["obspy"]
+    if shutil.which("dataselect") is not None and shutil.which("msrepack") is not None:
+        engines.insert(0, "dataselect")
+
+    filenames = sorted(filename for _, _, files in os.walk(parsedargs.archive)
+                       for filename in files if filename.split(".")[4:5] == ["D"])
+
+    pruned = {}
+    for engine in engines:
+
+        # Every engine prunes its own copy of the archive
+        archive = os.path.join(tempfile.mkdtemp(), "SDS")
+        shutil.copytree(parsedargs.archive, archive)
+        sds_file_registry.clear()
+
+        start = time.perf_counter()
+        for filename in filenames:
+            sds_file = sds_file_registry.get(filename, archive)
+            pruned[engine, filename] = sds_file.prune(remove_overlap=True,
+                                                      repack=parsedargs.repack,
+                                                      engine=engine)
+        elapsed = time.perf_counter() - start
+        print("%-10s %8.1f ms/file" % (engine, 1e3 * elapsed / len(filenames)))
+
+    n_errors = 0
+    for filename in filenames:
+
+        quality_files = [pruned[engine, filename] for engine in engines]
+
+        if len(engines) > 1:
+            # Both engines must give the same traces and samples
+            streams = [read(quality_file.filepath).merge(method=1).split()
+                       for quality_file in quality_files]
+            same = (quality_files[0].traces == quality_files[1].traces
+                    and len(streams[0]) == len(streams[1])
+                    and all(np.array_equal(a.data, b.data)
+                            for a, b in zip(streams[0], streams[1])))
+        else:
+            # The pruned file must have the traces of the original files in the day
+            sds_file = sds_file_registry.get(filename, parsedargs.archive)
+            expected = scan_traces([neighbour.filepath for neighbour in sds_file.neighbours],
+                                   sds_file.start, sds_file.end - timedelta(microseconds=1))
+            same = quality_files[0].traces == expected
+
+        if not same:
+            n_errors += 1
+            print("Different result for %s" % filename)
+
+    print("%d of %d files validated" % (len(filenames) - n_errors, len(filenames)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of the parallel scan of an SDS archive on a high-latency filesystem.
+
+Creates a temporary archive of empty files (several years, networks, stations
+and channels), and collects its files with a number of scanner threads, with a
+latency added to every directory listing (`os.scandir`) to simulate the round
+trips of a shared filesystem. Reports the time to the first file and to the
+last file, and checks that the files are the same as the serial scan, and, when
+the scan is ordered, in the same order as the ordered serial scan.
+
+Usage: python3 benchmarks/bench_scan.py [--latency MS] [--workers N ...] [--repo PATH]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=5, help="latency per listing in ms")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16, 64],
+                        help="numbers of scanner threads to compare")
+    parser.add_argument("--stations", type=int, default=10, help="number of stations per network")
+    parser.add_argument("--repo", default=os.path.join(os.path.dirname(__file__), ".."),
+                        help="path of the rule manager code to benchmark")
+    parsedargs = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(parsedargs.repo))
+
+    from sds.sdsfile import SDSFile, sds_file_registry
+    from sds.sdscollector import SDSFileCollector
+
+    # Create the files in the archive
+    archive = os.path.join(tempfile.mkdtemp(), "SDS")
+    for year in range(2022, 2025):
+        for network in ["NL", "NA", "NR"]:
+            for i in range(parsedargs.stations):
+                for channel in ["BHZ", "BHN", "BHE", "HHZ", "HHN", "HHE"]:
+                    for day in range(1, 11):
+                        sds_file = SDSFile("%s.S%03d.02.%s.D.%d.%03d"
+                                           % (network, i, channel, year, day), archive)
+                        if day == 1:
+                            os.makedirs(sds_file.directory, exist_ok=True)
+                        open(sds_file.filepath, "wb").close()
+
+    # Every listing is a round trip
+    original_scandir = os.scandir
+
+    def slow_scandir(*args, **kwargs):
+        time.sleep(parsedargs.latency / 1e3)
+        return original_scandir(*args, **kwargs)
+
+    os.scandir = slow_scandir
+
+    for ordered in [False, True]:
+        reference = None
+        for workers in parsedargs.workers:
+
+            sds_file_registry.clear()
+            collector = SDSFileCollector(archive, workers=workers, ordered=ordered)
+
+            start = time.perf_counter()
+            first = None
+            files = []
+            for sds_file in collector.iter_files():
+                if first is None:
+                    first = time.perf_counter() - start
+                files.append(sds_file.filename)
+            elapsed = time.perf_counter() - start
+
+            # Same files as the first scan, in the same order if ordered
+            if reference is None:
+                reference = files
+            same = (files == reference) if ordered else (sorted(files) == sorted(reference))
+
+            print("%-9s %3d threads %6d files %8.1f ms first %8.1f ms total %s" % (
+                "ordered" if ordered else "unordered", workers, len(files), 1e3 * first,
+                1e3 * elapsed, "ok" if same else "DIFFERENT"))
+
+    os.scandir = original_scandir
+
+
+if __name__ == "__main__":
+    main()
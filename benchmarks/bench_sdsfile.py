@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of the construction cost and memory of SDSFile objects.
+
+Creates SDS file objects from a list of filenames (without touching the disk),
+and reports the construction time per object, the memory held by one million
+objects (measured with `tracemalloc`, excluding the filenames themselves), and
+the time to access the `start` and `end` of every object.
+
+Usage: python3 benchmarks/bench_sdsfile.py [--items N] [--repo PATH]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=1000000, help="number of SDS files")
+    parser.add_argument("--repo", default=os.path.join(os.path.dirname(__file__), ".."),
+                        help="path of the rule manager code to benchmark")
+    parsedargs = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(parsedargs.repo))
+
+    from sds.sdsfile import SDSFile
+
+    # 100 stations with 3 channels, as many days as needed
+    filenames = ["NL.S%03d.02.BH%s.D.%04d.%03d" % (i % 100, "ZNE"[(i // 100) % 3],
+                                                   2000 + i // 109500, (i // 300) % 365 + 1)
+                 for i in range(parsedargs.items)]
+
+    start = time.perf_counter()
+    sds_files = [SDSFile(filename, "/data/archive") for filename in filenames]
+    elapsed = time.perf_counter() - start
+    print("construct %8.2f us/object" % (1e6 * elapsed / parsedargs.items))
+
+    start = time.perf_counter()
+    for sds_file in sds_files:
+        sds_file.start
+        sds_file.end
+    elapsed = time.perf_counter() - start
+    print("start+end %8.2f us/object" % (1e6 * elapsed / parsedargs.items))
+
+    del sds_files
+
+    tracemalloc.start()
+    sds_files = [SDSFile(filename, "/data/archive") for filename in filenames]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("memory    %8.1f MB/million objects" % (size / 1024 ** 2 * 1e6 / parsedargs.items))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of the cold start time of the SDS manager.
+
+Runs `sdsmanager.py --help`, and `sdsmanager.py` with a trivial sequence (a
+single dry run rule on a single file) in fresh interpreters, and reports the
+best and median wall time of each over several runs.
+
+Usage: python3 benchmarks/bench_startup.py [--runs N] [--repo PATH]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+
+def measure(command, runs, cwd, stdin=None):
+    """Returns the wall times of running `command` `runs` times, in seconds."""
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=cwd, input=stdin, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+
+    return timings
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10, help="number of runs of each command")
+    parser.add_argument("--repo", default=os.path.join(os.path.dirname(__file__), ".."),
+                        help="path of the rule manager code to benchmark")
+    parsedargs = parser.parse_args()
+
+    sdsmanager = os.path.join(os.path.abspath(parsedargs.repo), "sdsmanager.py")
+
+    # Run in a temporary directory, where the databases are created if needed
+    tmp_dir = tempfile.mkdtemp()
+
+    # A sequence with a single rule that needs no backend
+    rule_map = {"DELETE_DC": {"function_name": "delete_dc_metadata_rule",
+                              "options": {"dry_run": True},
+                              "conditions": []}}
+    with open(os.path.join(tmp_dir, "rule_map.json"), "w") as rule_map_file:
+        json.dump(rule_map, rule_map_file)
+    with open(os.path.join(tmp_dir, "rule_seq.json"), "w") as rule_seq_file:
+        json.dump({"rule_map": os.path.join(tmp_dir, "rule_map.json"),
+                   "sequence": ["DELETE_DC"]}, rule_seq_file)
+
+    # A single file in the archive
+    filename = "NL.HGN.02.BHZ.D.2019.001"
+    archive = os.path.join(tmp_dir, "SDS")
+    directory = os.path.join(archive, "2019", "NL", "HGN", "BHZ.D")
+    os.makedirs(directory)
+    open(os.path.join(directory, filename), "w").close()
+
+    commands = [
+        ("--help", [sys.executable, sdsmanager, "--help"], None),
+        ("sequence", [sys.executable, sdsmanager, "--dir", archive,
+                      "--ruleseq", os.path.join(tmp_dir, "rule_seq.json"),
+                      "--from_file", "-"], filename.encode())
+    ]
+
+    for name, command, stdin in commands:
+        timings = measure(command, parsedargs.runs, tmp_dir, stdin=stdin)
+        print("%-9s best %7.1f ms  median %7.1f ms" % (
+            name, 1e3 * min(timings), 1e3 * statistics.median(timings)))
+
+
+if __name__ == "__main__":
+    main()
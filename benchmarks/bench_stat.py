@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of the number of `os.stat` calls per SDS file.
+
+Collects the files of a temporary archive, filters the finished ones, and
+accesses the properties that the rules and conditions commonly use (the log
+label, size, modification time, checksum and neighbours), reporting the time
+and the number of `os.stat` calls per file for each step.
+
+Usage: python3 benchmarks/bench_stat.py [--items N] [--repo PATH]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=5000, help="number of SDS files")
+    parser.add_argument("--repo", default=os.path.join(os.path.dirname(__file__), ".."),
+                        help="path of the rule manager code to benchmark")
+    parsedargs = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(parsedargs.repo))
+    tmp_dir = tempfile.mkdtemp()
+
+    from configuration import config
+    config["LOGGING"] = {"LEVEL": "WARNING", "FILENAME": os.path.join(tmp_dir, "bench.log")}
+
+    import core.logger
+    from sds.sdsfile import SDSFile
+    from sds.sdscollector import SDSFileCollector
+
+    # Create the files in the archive, one stream per year of files
+    archive = os.path.join(tmp_dir, "SDS")
+    for i in range(parsedargs.items):
+        sds_file = SDSFile("NL.S%04d.02.BHZ.D.2019.%03d" % (i // 365, i % 365 + 1), archive)
+        os.makedirs(sds_file.directory, exist_ok=True)
+        with open(sds_file.filepath, "wb") as f:
+            f.write(b"\0" * 512)
+
+    # Count the stat calls
+    n_stat = [0]
+    original_stat = os.stat
+
+    def counting_stat(*args, **kwargs):
+        n_stat[0] += 1
+        return original_stat(*args, **kwargs)
+
+    os.stat = counting_stat
+
+    state = {}
+
+    def collect():
+        state["collector"] = SDSFileCollector(archive)
+        state["collector"].filter_finished_files(2 * 24 * 60)
+
+    steps = [
+        ("collect", collect),
+        ("label", lambda: [str(f) for f in state["collector"].files]),
+        ("size", lambda: [f.size for f in state["collector"].files]),
+        ("modified", lambda: [f.modified for f in state["collector"].files]),
+        ("checksum", lambda: [f.checksum for f in state["collector"].files]),
+        ("neighbours", lambda: [list(f.neighbours) for f in state["collector"].files])
+    ]
+
+    total_stat = 0
+    for name, step in steps:
+        n_stat[0] = 0
+        start = time.perf_counter()
+        step()
+        elapsed = time.perf_counter() - start
+        total_stat += n_stat[0]
+        print("%-10s %8.1f us/item %6.1f stat/item" % (
+            name, 1e6 * elapsed / parsedargs.items, n_stat[0] / parsedargs.items))
+    print("%-10s %24.1f stat/item" % ("total", total_stat / parsedargs.items))
+
+    os.stat = original_stat
+
+
+if __name__ == "__main__":
+    main()
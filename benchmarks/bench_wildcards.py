@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of the matching of many wildcards (e.g., one per station) against the
+directories and files of an SDS archive.
+
+Builds the SDSPathFilter of the given code for a number of wildcards, one per
+station of a synthetic archive (the networks share the station codes), and
+reports the time to match all the filenames, the time to walk the directories
+of the archive with the filter, and the number of directories that the walk
+lists (the directories that may hold a matching file).
+
+Usage: python3 benchmarks/bench_wildcards.py [--patterns N ...] [--repo PATH]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--patterns", type=int, nargs="+", default=[1, 10, 100, 500],
+                        help="numbers of wildcards to compare")
+    parser.add_argument("--stations", type=int, default=500, help="number of stations per network")
+    parser.add_argument("--repo", default=os.path.join(os.path.dirname(__file__), ".."),
+                        help="path of the rule manager code to benchmark")
+    parsedargs = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(parsedargs.repo))
+
+    from sds.sdscollector import SDSPathFilter
+
+    # Directories are matched with their parents since the trie
+    with_parents = hasattr(SDSPathFilter, "FIELDS")
+
+    years = ["2023", "2024"]
+    networks = ["NL", "NA", "NR"]
+    stations = ["S%04d" % i for i in range(parsedargs.stations)]
+    channels = ["HHZ.D", "HHN.D", "HHE.D"]
+    filenames = ["%s.%s.02.%s.%s.%03d" % (network, station, channel, year, day)
+                 for year in years for network in networks for station in stations
+                 for channel in channels for day in range(1, 31)]
+
+    print("%d files" % len(filenames))
+
+    for n_patterns in parsedargs.patterns:
+
+        # A station of every network, in turn
+        wildcards = ["%s.%s.*.*.D.2024.*" % (networks[i % len(networks)], stations[i])
+                     for i in range(n_patterns)]
+
+        begin = time.perf_counter()
+        path_filter = SDSPathFilter(wildcards)
+        compiled = time.perf_counter() - begin
+
+        begin = time.perf_counter()
+        matched = sum(1 for filename in filenames if path_filter.match_file(filename))
+        elapsed = time.perf_counter() - begin
+
+        def match_directory(parents, name):
+            if with_parents:
+                return path_filter.match_directory(parents, name)
+            return path_filter.match_directory(len(parents), name)
+
+        # The directories a walk lists
+        begin = time.perf_counter()
+        listed = 0
+        for year in years:
+            if not match_directory((), year):
+                continue
+            for network in networks:
+                if not match_directory((year,), network):
+                    continue
+                for station in stations:
+                    if not match_directory((year, network), station):
+                        continue
+                    listed += 1
+                    listed += sum(1 for channel in channels
+                                  if match_directory((year, network, station), channel))
+        walked = time.perf_counter() - begin
+
+        print("%4d wildcards: compile %7.1f ms, match files %8.1f ms (%6d files), "
+              "match directories %6.1f ms (%5d listed)"
+              % (n_patterns, 1e3 * compiled, 1e3 * elapsed, matched, 1e3 * walked, listed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+import argparse
+
+from core.database import checksum_database
+
+if __name__ == "__main__":
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description="Tool to maintain the ChecksumDatabase.")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--count",
+                       help="Counts how many files there are in the table",
+                       action="store_true")
+    group.add_argument("--sweep",
+                       help="Removes the files that were deleted or changed since they were cached",
+                       action="store_true")
+    group.add_argument("--clear", help="Clears the table", action="store_true")
+    parsedargs = parser.parse_args()
+
+    if not checksum_database.enabled:
+        parser.error("The checksum database is not configured (CHECKSUM_DB).")
+
+    if parsedargs.count:
+        print(checksum_database.count())
+
+    if parsedargs.sweep:
+        print(checksum_database.sweep())
+
+    if parsedargs.clear:
+        checksum_database.clear()
@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 
 """
-Script that collects files and outputs their names.
+Script that collects files and outputs their names, or a list of their paths
+and stats to be read by the SDS manager.
 """
 
 import sys
@@ -10,6 +11,7 @@ import argparse
 
 import core.logger
 from sds.sdscollector import SDSFileCollector
+from sds.filelist import FORMATS, write_file_list
 
 from configuration import config
 
@@ -34,9 +36,33 @@ def main():
                             help=("collect all files with modification date older that last "
                                   "midnight plus the given number of minutes"),
                             type=int)
+        parser.add_argument("--scan_workers",
+                            help=("number of threads listing the directories of the archive "
+                                  "(defaults to the value in configuration.py, or 1)"),
+                            type=int)
+        parser.add_argument("--manifest",
+                            help=("how to find the files of the archive: walk it, or query its "
+                                  "manifest after refreshing the changed directories, or all "
+                                  "of them with 'full' (defaults to the manifest if "
+                                  "MANIFEST_DB is set in configuration.py)"),
+                            choices=["walk", "manifest", "full"])
+        parser.add_argument("--ordered",
+                            help=("write the files in a deterministic order (directory by "
+                                  "directory) as they are found, without sorting them all"),
+                            action="store_true")
         parser.add_argument("-o", "--output",
-                            help="output, a file name or stdout if not provided",
-                            type=argparse.FileType("w"), default=sys.stdout)
+                            help=("output, a file name or stdout if not provided (with --shards, "
+                                  "the prefix of the names of the shard files)"))
+        parser.add_argument("--format",
+                            help=("format of the output: the filenames one per line, the paths "
+                                  "of the files delimited by NUL characters, or JSON lines with "
+                                  "the path, size, modification time and cached checksum of the "
+                                  "files (defaults to names)"),
+                            choices=FORMATS, default="names")
+        parser.add_argument("--shards",
+                            help=("split the output into the given number of files "
+                                  "(OUTPUT.0, OUTPUT.1, ...), by the hash of the streams"),
+                            type=int, default=1)
         parser.add_argument("--sort",
                             help=("whether (and how) to sort collected files "
                                   "by name before processing them "
@@ -50,8 +76,15 @@ def main():
             return print("Files to collect need to be specified using "
                          "--collect_wildcards and/or --collect_finished")
 
+        if parsedargs.shards > 1 and parsedargs.output is None:
+            return print("The shards need a name of the output given with --output")
+
         # Collect files
-        file_collector = SDSFileCollector(parsedargs.dir)
+        manifest = parsedargs.manifest
+        file_collector = SDSFileCollector(parsedargs.dir, workers=parsedargs.scan_workers,
+                                          ordered=parsedargs.ordered,
+                                          manifest=None if manifest is None else manifest != "walk",
+                                          full_refresh=manifest == "full")
 
         if parsedargs.collect_wildcards is not None:
             file_collector.filter_from_wildcards_array(parsedargs.collect_wildcards)
@@ -62,12 +95,25 @@ def main():
         if parsedargs.sort != "none":
             file_collector.sort_files(parsedargs.sort)
 
-        # Write to output (file or stdout)
-        with parsedargs.output as list_file:
-            for sds_file in file_collector.files:
-                list_file.write(sds_file.filename + "\n")
-        logger.info("Finished SDS File Collector execution. Output to '%s'.",
-                    parsedargs.output.name)
+        # Write to output (file(s) or stdout), as the files are found if not sorted
+        if parsedargs.output is None:
+            list_files = [sys.stdout]
+        elif parsedargs.shards > 1:
+            list_files = [open("%s.%d" % (parsedargs.output, i), "w")
+                          for i in range(parsedargs.shards)]
+        else:
+            list_files = [open(parsedargs.output, "w")]
+
+        try:
+            n_files = write_file_list(file_collector.iter_file_sets(), list_files,
+                                      parsedargs.format)
+        finally:
+            for list_file in list_files:
+                if list_file is not sys.stdout:
+                    list_file.close()
+
+        logger.info("Finished SDS File Collector execution. Output %d files to '%s'.",
+                    n_files, parsedargs.output or sys.stdout.name)
 
     except Exception as e:
         logger.error("General error!: '%s'" % e, exc_info=True)
@@ -5,9 +5,10 @@ depending on whether conditions are met
 
 import logging
 from datetime import datetime, timedelta
-import os
 
-from sds.sdsfile import SDSFile
+from sds.sdsfile import sds_file_registry
+from core.context import current_context
+from core.database import metadata_change_database
 
 import modules.s3manager as s3manager
 from modules.irodsmanager import irods_session
@@ -32,6 +33,32 @@ def assert_quality_condition(options, sds_file):
     return sds_file.quality in options["qualities"]
 
 
+def _get_neighbour_checksum(sds_file, neighbour):
+    """Get the checksum of the "previous" or "next" SDSFile, shared with the
+    other rules and conditions on the same file."""
+
+    return current_context().get_or_compute(
+        "checksum_%s" % neighbour, lambda: getattr(sds_file, neighbour).checksum)
+
+
+def _get_pid(sds_file):
+    """Get the PID of the SDSFile in iRODS, shared with the other rules and
+    conditions on the same file."""
+
+    return current_context().get_or_compute("pid", lambda: irods_session.get_pid(sds_file))
+
+
+def _metadata_changed_since(sds_file, created):
+    """Whether the response of the stream of the SDSFile changed, on its day, after
+    `created` (a `datetime`, or `None` if unknown)."""
+
+    changed = metadata_change_database.get_last_change(sds_file.id, sds_file.start, sds_file.end)
+    if changed is None:
+        return False
+
+    return created is None or created.timestamp() < changed
+
+
 def assert_irods_exists_condition(options, sds_file):
     return irods_session.exists(sds_file)
 
@@ -48,13 +75,15 @@ def assert_s3_exists_condition(options, sds_file):
         The file being processed.
 
     """
-    if "check_checksum" in options:
-        if options["check_checksum"]:
-            return (s3manager.exists(sds_file)
-                    and s3manager.get_checksum(sds_file) == sds_file.checksum)
-        else:
-            return s3manager.exists(sds_file)
-    return s3manager.exists(sds_file)
+    context = current_context()
+    exists = context.get_or_compute("s3_exists", lambda: s3manager.exists(sds_file))
+
+    if "check_checksum" in options and options["check_checksum"]:
+        return (exists
+                and context.get_or_compute("s3_checksum",
+                                           lambda: s3manager.get_checksum(sds_file))
+                == sds_file.checksum)
+    return exists
 
 
 def _assert_exists_and_hashes_in_document(sds_file, document, db_name="mongoDB",
@@ -86,31 +115,35 @@ def _assert_exists_and_hashes_in_document(sds_file, document, db_name="mongoDB",
         # Document exists and has the same hash: it exists
         exists = True
         if document["checksum"] == sds_file.checksum:
+            # Neighbours' checksums, only computed when compared
+            checksum_prev = _get_neighbour_checksum(sds_file, "previous") if use_checksum_prev else None
             if (use_checksum_prev
-                    and sds_file.previous.checksum is not None
-                    and document["checksum_prev"] != sds_file.previous.checksum):
+                    and checksum_prev is not None
+                    and document["checksum_prev"] != checksum_prev):
                 same_hash = False
                 msg = ("File %s does exist in %s, but the previous file has a "
                        "different checksum (%s vs %s).") % (
                        sds_file.filename, db_name, document["checksum_prev"],
-                       sds_file.previous.checksum)
-            elif (use_checksum_next
-                  and sds_file.next.checksum is not None
-                  and document["checksum_next"] != sds_file.next.checksum):
-                same_hash = False
-                msg = ("File %s does exist in %s, but the next file has a "
-                       "different checksum (%s vs %s).") % (
-                       sds_file.filename, db_name, document["checksum_next"],
-                       sds_file.next.checksum)
+                       checksum_prev)
             else:
-                same_hash = True
-                checksums_str = "self: %s" % (sds_file.checksum)
-                if use_checksum_prev:
-                    checksums_str += ", prev: %s" % (sds_file.previous.checksum)
-                if use_checksum_next:
-                    checksums_str += ", next: %s" % (sds_file.next.checksum)
-                msg = "File %s does exist in %s, with same checksums (%s)." % (
-                                sds_file.filename, db_name, checksums_str)
+                checksum_next = _get_neighbour_checksum(sds_file, "next") if use_checksum_next else None
+                if (use_checksum_next
+                        and checksum_next is not None
+                        and document["checksum_next"] != checksum_next):
+                    same_hash = False
+                    msg = ("File %s does exist in %s, but the next file has a "
+                           "different checksum (%s vs %s).") % (
+                           sds_file.filename, db_name, document["checksum_next"],
+                           checksum_next)
+                else:
+                    same_hash = True
+                    checksums_str = "self: %s" % (sds_file.checksum)
+                    if use_checksum_prev:
+                        checksums_str += ", prev: %s" % (checksum_prev)
+                    if use_checksum_next:
+                        checksums_str += ", next: %s" % (checksum_next)
+                    msg = "File %s does exist in %s, with same checksums (%s)." % (
+                                    sds_file.filename, db_name, checksums_str)
         else:
             same_hash = False
             msg = ("File %s does exist in %s, but with a different checksum "
@@ -135,6 +168,8 @@ def assert_wfcatalog_exists_condition(options, sds_file):
     options : `dict`
         The rule's options.
         - ``check_checksum``: Whether or not to compare checksums (`bool`, default `True`)
+        - ``check_metadata``: Whether or not the metadata is missing if the
+          response of the stream changed after it was computed (`bool`, default `False`)
     sds_file : `SDSFile`
         The file being processed.
 
@@ -142,6 +177,14 @@ def assert_wfcatalog_exists_condition(options, sds_file):
     # Extract the current metadata object from the database
     metadata_object = mongo_pool.get_wfcatalog_daily_document(sds_file)
 
+    # Invalidated by a change of the station metadata
+    if (options.get("check_metadata", False)
+            and metadata_object is not None
+            and _metadata_changed_since(sds_file, metadata_object.get("created"))):
+        logger.debug("File %s exists in WFCatalog, but the metadata of the stream changed."
+                     % (sds_file.filename))
+        return False
+
     # In case we don't care about the hashes, we can exit here
     if ("check_checksum" in options
             and options["check_checksum"] is False
@@ -173,7 +216,7 @@ def _get_neighbor(sds_file, neighbor):
     elif neighbor == "previous":
         queried_file = sds_file.previous
 
-    if os.path.isfile(queried_file.filepath):
+    if queried_file.stats is not None:
         return queried_file
     else:
         return None
@@ -290,6 +333,8 @@ def assert_ppsd_metadata_exists_condition(options, sds_file):
     options : `dict`
         The rule's options.
         - ``check_checksum``: Whether or not to compare checksums (`bool`, default `True`)
+        - ``check_metadata``: Whether or not the metadata is missing if the
+          response of the stream changed after it was computed (`bool`, default `False`)
     sds_file : `SDSFile`
         The file being processed.
 
@@ -309,6 +354,14 @@ def assert_ppsd_metadata_exists_condition(options, sds_file):
 
     # Document exists and has the same hash: it exists
     if ppsd_documents:
+        # Invalidated by a change of the station metadata
+        if options.get("check_metadata", False):
+            created = [doc.get("created") for doc in ppsd_documents]
+            if _metadata_changed_since(sds_file, None if None in created else min(created)):
+                logger.debug("PPSD data exists for file %s, but the metadata of the stream "
+                             "changed." % (sds_file.filename))
+                return False
+
         # In case we don't care about the hashes, we can exit here
         if "check_checksum" in options and options["check_checksum"] is False:
             logger.debug("PPSD data exists for file %s, checksum not verified."
@@ -334,12 +387,8 @@ def assert_ppsd_metadata_exists_condition(options, sds_file):
         checksum_next = checksum_next.pop()
 
         # Get checksums of the neighboring files if they exist
-        sds_checksum_prev = sds_file.previous
-        if sds_checksum_prev is not None:
-            sds_checksum_prev = sds_checksum_prev.checksum
-        sds_checksum_next = sds_file.next
-        if sds_checksum_next is not None:
-            sds_checksum_next = sds_checksum_next.checksum
+        sds_checksum_prev = _get_neighbour_checksum(sds_file, "previous")
+        sds_checksum_next = _get_neighbour_checksum(sds_file, "next")
 
         # Detect if any one of the checksums is different
         if checksum != sds_file.checksum:
@@ -368,15 +417,15 @@ def assert_ppsd_metadata_exists_condition(options, sds_file):
 
 def assert_pruned_file_exists_condition(options, sds_file):
     """Assert that the pruned version of the SDS file is in the temporary archive."""
-    # Create a phantom SDSFile with a different quality idenfier
-    quality_file = SDSFile(sds_file.filename, sds_file.archive_root)
-    quality_file.quality = "Q"
-    return os.path.exists(quality_file.filepath)
+    # The SDSFile with a different quality idenfier
+    quality_file = sds_file_registry.get(sds_file.custom_quality_filename("Q"),
+                                         sds_file.archive_root)
+    return quality_file.stats is not None
 
 
 def assert_temp_archive_exist_condition(options, sds_file):
     """Assert that the file exists in the temporary archive."""
-    return os.path.isfile(sds_file.filepath)
+    return sds_file.stats is not None
 
 
 def assert_file_replicated_condition(options, sds_file):
@@ -398,7 +447,7 @@ def assert_file_replicated_condition(options, sds_file):
 
 def assert_pid_condition(options, sds_file):
     """Assert that a PID was assigned to the file on iRODS."""
-    return irods_session.get_pid(sds_file) is not None
+    return _get_pid(sds_file) is not None
 
 
 def assert_replica_pid_condition(options, sds_file):
@@ -46,8 +46,36 @@ config = {
     },
     "LOGGING": {
         "LEVEL": "INFO",
-        "FILENAME": "~/log/sdsmanager.log" # use None for stdout
+        "FILENAME": "~/log/sdsmanager.log", # use None for stdout
+        "FORMAT": "text" # or "json" for JSON lines
     },
     "DEFAULT_RULE_TIMEOUT" : 10,
-    "DELETION_DB": "./deletion.db"
+    "DELETION_DB": "./deletion.db",
+    "RULE_TIMING_DB": "./rule_timing.db",
+    "CHECKSUM_DB": "./checksum.db", # use None to disable the checksum cache
+    "CHECKSUM_DB_BATCH": 1000,
+    "ITEM_CONTEXT_MAX_BYTES": 268435456,
+    "SDS_FILE_REGISTRY_SIZE": 1024,
+    "WAVEFORM_CACHE_BYTES": 0, # e.g. 134217728 for runs sorted by name (--sort asc or desc)
+    "INVENTORY_DB": "./inventory.db", # use None to keep the inventories in memory only
+    "INVENTORY_CACHE_SIZE": 64,
+    "INVENTORY_TTL": 86400,
+
+    # Cache of the stream coordinates (Dublin Core)
+    "LOCATION_DB": "./location.db", # use None to keep the coordinates in memory only
+    "LOCATION_BATCH_SIZE": 500,
+    "LOCATION_TTL": 604800,
+    "LOCATION_RETRY_TTL": 600,
+
+    # Source of the station metadata: "fdsnws" or "stationxml" (local files)
+    "METADATA_BACKEND": "fdsnws",
+    "STATIONXML_DIRECTORY": "/data/metadata/",
+    "METADATA_CHANGE_DB": "./metadata_change.db",
+
+    # Threads listing the directories of the archive (e.g., more on network filesystems)
+    "COLLECTOR_WORKERS": 1,
+
+    # Manifest of the archive, queried instead of walking it
+    "MANIFEST_DB": None, # e.g. "./manifest.db"
+    "MANIFEST_RESTAT_DAYS": 2
 }
@@ -0,0 +1,161 @@
+"""
+This module implements a per-item context, that the rules and conditions of a
+sequence use to share intermediate results on the item being processed (e.g.,
+checksums of neighbouring files, or PIDs), instead of computing them again.
+
+The `RuleManager` owns the context: it opens a new one before running the
+sequence on an item, and frees it as soon as the item is finished. The context
+has a memory limit: when it is exceeded, the oldest entries are dropped, and a
+value larger than the limit is not stored at all. Outside of a rule manager run,
+the current context never stores anything, so results are always computed.
+
+Example
+-------
+
+```
+from core.context import current_context
+...
+pid = current_context().get_or_compute("pid", lambda: irods_session.get_pid(sds_file))
+```
+"""
+
+import sys
+import logging
+from collections import OrderedDict
+
+
+class ItemContext():
+    """Container for the results shared by the rules running on one item.
+
+    Parameters
+    ----------
+    max_bytes : `int`
+        Maximum (estimated) size of the stored values, in bytes.
+    """
+
+    def __init__(self, max_bytes):
+
+        self.max_bytes = max_bytes
+        self.size = 0
+
+        # Key -> (value, size), oldest first
+        self._entries = OrderedDict()
+
+        # Initialize logger
+        self.logger = logging.getLogger("RuleManager")
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """Returns the value stored for `key`, or `default` if there is none."""
+
+        if key not in self._entries:
+            return default
+        return self._entries[key][0]
+
+    def set(self, key, value, size=None):
+        """Stores a value, dropping the oldest ones if the memory limit is exceeded.
+
+        Parameters
+        ----------
+        key : `str`
+            The name of the value.
+        value : `object`
+            The value to store.
+        size : `int`, optional
+            Size of the value in bytes. Estimated if not given.
+        """
+
+        if size is None:
+            size = self._estimate_size(value)
+
+        self.remove(key)
+
+        # Too large to be kept at all
+        if size > self.max_bytes:
+            self.logger.debug("Value '%s' (%d bytes) exceeds the context limit of %d bytes."
+                              % (key, size, self.max_bytes))
+            return
+
+        # Drop the oldest values until the new one fits
+        while self.size + size > self.max_bytes:
+            _, (_, old_size) = self._entries.popitem(last=False)
+            self.size -= old_size
+
+        self._entries[key] = (value, size)
+        self.size += size
+
+    def get_or_compute(self, key, compute, size=None):
+        """Returns the value stored for `key`, computing and storing it if needed.
+
+        Parameters
+        ----------
+        key : `str`
+            The name of the value.
+        compute : callable
+            Function without arguments that computes the value.
+        size : `int`, optional
+            Size of the value in bytes. Estimated if not given.
+        """
+
+        if key in self._entries:
+            return self._entries[key][0]
+
+        value = compute()
+        self.set(key, value, size=size)
+        return value
+
+    def remove(self, key):
+        """Removes a value from the context, e.g. after a rule changed it. Does
+        nothing if there is no value stored for `key`."""
+
+        if key in self._entries:
+            _, size = self._entries.pop(key)
+            self.size -= size
+
+    def clear(self):
+        """Frees all the values in the context."""
+
+        self._entries.clear()
+        self.size = 0
+
+    @staticmethod
+    def _estimate_size(value):
+        """Estimates the memory used by a value, in bytes."""
+
+        # NumPy arrays
+        if hasattr(value, "nbytes"):
+            return value.nbytes
+
+        # ObsPy streams
+        if hasattr(value, "traces"):
+            return sum(trace.data.nbytes for trace in value.traces)
+
+        return sys.getsizeof(value)
+
+
+# Context used outside of a rule manager run: it never stores anything
+_default_context = ItemContext(0)
+_current_context = _default_context
+
+
+def current_context():
+    """Returns the context of the item being processed."""
+    return _current_context
+
+
+def open_context(max_bytes):
+    """Opens a new context for an item, and makes it the current one."""
+
+    global _current_context
+    _current_context = ItemContext(max_bytes)
+    return _current_context
+
+
+def close_context():
+    """Frees the current context."""
+
+    global _current_context
+    _current_context.clear()
+    _current_context = _default_context
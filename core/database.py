@@ -1,30 +1,55 @@
+import os
+import atexit
 import logging
 import sqlite3
 
+from abc import ABC, abstractmethod
 from configuration import config
 from datetime import datetime
 
 
-class DeletionDatabase():
+class LazyDatabase(ABC):
 
     """
-    Class DeletionDatabase
-    Manages an embedded database to keep track of deletion status of files
+    Class LazyDatabase
+    Base class of the embedded databases, connected on first use. Subclasses give
+    the `name` of the database (for the logs) and create their tables in
+    `_create_table`. A database without a file name is disabled.
     """
 
-    def __init__(self):
+    name = "embedded"
+
+    def __init__(self, filename):
 
         # Initialize logger
         self.logger = logging.getLogger("RuleManager")
-        self.logger.debug("Initializing the Deletion Database.")
+        self.logger.debug("Initializing the %s database." % self.name)
+
+        self.filename = filename
+
+        # Connected on first use
+        self._conn = None
 
-        # Connect to (file) database
-        self.logger.debug("Connecting to deletion database stored at '%s'" % config["DELETION_DB"])
-        self.conn = sqlite3.connect(config["DELETION_DB"])
-        self.conn.row_factory = sqlite3.Row
+    @property
+    def enabled(self):
+        return self.filename is not None
 
-        # Create table if not exists
-        self._create_table()
+    @property
+    def conn(self):
+        """The connection to the database, opened on first use."""
+
+        if self._conn is None:
+
+            # Connect to (file) database
+            self.logger.debug("Connecting to %s database stored at '%s'"
+                              % (self.name, self.filename))
+            self._conn = sqlite3.connect(self.filename)
+            self._conn.row_factory = sqlite3.Row
+
+            # Create table if not exists
+            self._create_table()
+
+        return self._conn
 
     def __del__(self):
         """
@@ -33,11 +58,32 @@ class DeletionDatabase():
         self.disconnect()
 
     def disconnect(self):
-        """Closes the connection to the database."""
+        """Closes the connection to the database, if it was opened."""
+
+        if self._conn is None:
+            return
 
         # Close the connection
-        self.logger.debug("Disconnecting from deletion database")
-        self.conn.close()
+        self.logger.debug("Disconnecting from %s database" % self.name)
+        self._conn.close()
+        self._conn = None
+
+    @abstractmethod
+    def _create_table(self):
+        """Creates the tables of the database if they don't exist."""
+
+
+class DeletionDatabase(LazyDatabase):
+
+    """
+    Class DeletionDatabase
+    Manages an embedded database to keep track of deletion status of files
+    """
+
+    name = "deletion"
+
+    def __init__(self):
+        super().__init__(config.get("DELETION_DB"))
 
     def _create_table(self):
         """
@@ -134,4 +180,774 @@ class DeletionDatabase():
         return [row["file"] for row in c.fetchall()]
 
 
+class RuleTimingDatabase(LazyDatabase):
+
+    """
+    Class RuleTimingDatabase
+    Manages an embedded database to keep track of historical rule execution timings
+    """
+
+    name = "rule timing"
+
+    def __init__(self):
+        super().__init__(config.get("RULE_TIMING_DB", "./rule_timing.db"))
+
+    def _create_table(self):
+        """
+        Creates the rule timing table if it doesn't exist
+        """
+
+        c = self.conn.cursor()
+
+        # Create table
+        c.execute('''CREATE TABLE IF NOT EXISTS rule_timing
+                     (function_name TEXT PRIMARY KEY,
+                      count INTEGER,
+                      total REAL,
+                      updated TEXT
+                     )''')
+
+        # Save (commit) the changes
+        self.conn.commit()
+
+    def add_timings(self, timings):
+        """Add a batch of rule execution timings to the table.
+
+        Parameters
+        ----------
+        timings : `dict` (`str` -> (`int`, `float`))
+            For each rule function name, the number of executions and their
+            total duration in seconds.
+        """
+
+        c = self.conn.cursor()
+        now = datetime.now().isoformat()
+
+        # Accumulate on top of the existing rows, all in one transaction (without
+        # an upsert, which needs SQLite 3.24)
+        c.executemany("INSERT OR IGNORE INTO rule_timing (function_name, count, total, updated) "
+                      "VALUES (?,0,0,?)",
+                      [(name, now) for name in timings])
+        c.executemany("UPDATE rule_timing SET count = count + ?, total = total + ?, updated = ? "
+                      "WHERE function_name = ?",
+                      [(count, total, now, name) for name, (count, total) in timings.items()])
+
+        # Save (commit) the changes
+        self.conn.commit()
+
+    def get_mean_timings(self):
+        """Returns the mean execution time in seconds of every rule function
+        in the table, as a `dict` (`str` -> `float`)."""
+
+        c = self.conn.cursor()
+        c.execute("SELECT function_name, count, total FROM rule_timing WHERE count > 0")
+
+        return {row["function_name"]: row["total"] / row["count"] for row in c.fetchall()}
+
+
+class ChecksumDatabase(LazyDatabase):
+
+    """
+    Class ChecksumDatabase
+    Manages an embedded database that caches the checksums of files, so that they
+    are not computed again while the files do not change. An entry is only valid
+    for the same path, inode, size and modification time (in nanoseconds).
+
+    New entries are written in batches of `CHECKSUM_DB_BATCH` (and when the
+    program exits). The cache is disabled when `CHECKSUM_DB` is not configured.
+    """
+
+    name = "checksum"
+
+    def __init__(self):
+
+        super().__init__(config.get("CHECKSUM_DB"))
+        self.batch_size = config.get("CHECKSUM_DB_BATCH", 1000)
+
+        # Entries not written yet, path -> row
+        self._pending = dict()
+        atexit.register(self.flush)
+
+        # Entries read from file lists, path -> row, never written
+        self._listed = dict()
+
+    def disconnect(self):
+        """Writes the pending entries and closes the connection to the database,
+        if it was opened."""
+
+        if self._conn is not None:
+            self.flush()
+
+        super().disconnect()
+
+    def _create_table(self):
+        """
+        Creates the checksum table if it doesn't exist
+        """
+
+        c = self.conn.cursor()
+
+        # Create table
+        c.execute('''CREATE TABLE IF NOT EXISTS checksum
+                     (path TEXT PRIMARY KEY,
+                      inode INTEGER,
+                      size INTEGER,
+                      mtime_ns INTEGER,
+                      checksum INTEGER,
+                      irods_checksum TEXT
+                     )''')
+
+        # Save (commit) the changes
+        self.conn.commit()
+
+    def get(self, path, stats):
+        """Returns the cached checksums of a file.
+
+        Parameters
+        ----------
+        path : `str`
+            Path of the file.
+        stats : `os.stat_result`
+            The current stat of the file.
+
+        Returns
+        -------
+        checksum : `int` or `None`
+            The Adler-32 checksum, or `None` if it is not cached.
+        irods_checksum : `str` or `None`
+            The iRODS (SHA-256) checksum, or `None` if it is not cached.
+        """
+
+        row = None
+        if self.enabled:
+            row = self._pending.get(path)
+            if row is None:
+                c = self.conn.cursor()
+                c.execute("SELECT * FROM checksum WHERE path=?", (path,))
+                row = c.fetchone()
+
+        # Not cached, or the file changed since
+        if not self._same_file(row, stats):
+            row = self._listed.get(path)
+            if not self._same_file(row, stats):
+                return None, None
+
+        return row["checksum"], row["irods_checksum"]
+
+    def add_listed(self, path, inode, size, mtime_ns, checksum, irods_checksum=None):
+        """Keeps in memory the checksums of a file given in a file list (see
+        `sds.filelist`). They are returned by `get` while the file has the same
+        inode, size and modification time as in the list, even when the cache is
+        disabled, and are not written to the database."""
+
+        self._listed[path] = {
+            "inode": inode,
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "checksum": checksum,
+            "irods_checksum": irods_checksum
+        }
+
+    @staticmethod
+    def _same_file(row, stats):
+        """Whether an entry is for the file with the given stat."""
+
+        return (row is not None
+                and row["inode"] == stats.st_ino
+                and row["size"] == stats.st_size
+                and row["mtime_ns"] == stats.st_mtime_ns)
+
+    def add(self, path, stats, checksum, irods_checksum=None):
+        """Caches the checksums of a file. The entry is written with the next batch.
+
+        Parameters
+        ----------
+        path : `str`
+            Path of the file.
+        stats : `os.stat_result`
+            The stat of the file when the checksums were computed.
+        checksum : `int`
+            The Adler-32 checksum.
+        irods_checksum : `str`, optional
+            The iRODS (SHA-256) checksum.
+        """
+
+        if not self.enabled:
+            return
+
+        self._pending[path] = {
+            "path": path,
+            "inode": stats.st_ino,
+            "size": stats.st_size,
+            "mtime_ns": stats.st_mtime_ns,
+            "checksum": checksum,
+            "irods_checksum": irods_checksum
+        }
+
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Writes the pending entries, all in one transaction."""
+
+        if not self._pending:
+            return
+
+        c = self.conn.cursor()
+        c.executemany('''INSERT OR REPLACE INTO checksum
+                         (path, inode, size, mtime_ns, checksum, irods_checksum)
+                         VALUES (:path, :inode, :size, :mtime_ns, :checksum, :irods_checksum)''',
+                      list(self._pending.values()))
+
+        # Save (commit) the changes
+        self.conn.commit()
+        self._pending.clear()
+
+    def count(self):
+        """Returns the number of entries in the cache."""
+
+        self.flush()
+
+        c = self.conn.cursor()
+        c.execute("SELECT COUNT(*) FROM checksum")
+
+        return c.fetchone()[0]
+
+    def sweep(self):
+        """Removes the entries of files that were deleted or changed since they
+        were cached. Returns the number of removed entries."""
+
+        self.flush()
+
+        c = self.conn.cursor()
+        c.execute("SELECT path, inode, size, mtime_ns FROM checksum")
+
+        stale = []
+        for row in c.fetchall():
+            try:
+                stats = os.stat(row["path"])
+            except FileNotFoundError:
+                stale.append((row["path"],))
+                continue
+            if (row["inode"] != stats.st_ino
+                    or row["size"] != stats.st_size
+                    or row["mtime_ns"] != stats.st_mtime_ns):
+                stale.append((row["path"],))
+
+        c.executemany("DELETE FROM checksum WHERE path=?", stale)
+
+        # Save (commit) the changes
+        self.conn.commit()
+
+        self.logger.debug("Removed %d stale entries from the checksum database" % len(stale))
+        return len(stale)
+
+    def clear(self):
+        """Removes all the entries from the cache."""
+
+        self._pending.clear()
+
+        c = self.conn.cursor()
+        c.execute("DELETE FROM checksum")
+
+        # Save (commit) the changes
+        self.conn.commit()
+
+
+class InventoryDatabase(LazyDatabase):
+
+    """
+    Class InventoryDatabase
+    Manages an embedded database that stores the StationXML inventory of each
+    station, at response level and with all its channel epochs, as fetched from
+    FDSNWS, with the time of the fetch and the validators of the response
+    (ETag and Last-Modified) to revalidate it.
+
+    The store is disabled when `INVENTORY_DB` is not configured.
+    """
+
+    name = "inventory"
+
+    def __init__(self):
+        super().__init__(config.get("INVENTORY_DB"))
+
+    def _create_table(self):
+        """
+        Creates the inventory table if it doesn't exist
+        """
+
+        c = self.conn.cursor()
+
+        # Create table
+        c.execute('''CREATE TABLE IF NOT EXISTS inventory
+                     (network TEXT,
+                      station TEXT,
+                      fetched REAL,
+                      etag TEXT,
+                      last_modified TEXT,
+                      stationxml BLOB,
+                      PRIMARY KEY (network, station)
+                     )''')
+
+        # Save (commit) the changes
+        self.conn.commit()
+
+    def get(self, network, station):
+        """Returns the stored inventory of a station, as a `dict` with the
+        ``fetched`` time (seconds since the epoch), the ``etag`` and
+        ``last_modified`` validators (or `None`), and the ``stationxml``
+        document (`bytes`), or `None` if it is not stored."""
+
+        if not self.enabled:
+            return None
+
+        c = self.conn.cursor()
+        c.execute("SELECT * FROM inventory WHERE network=? AND station=?", (network, station))
+        row = c.fetchone()
+
+        return dict(row) if row is not None else None
+
+    def put(self, network, station, fetched, etag, last_modified, stationxml):
+        """Stores the inventory of a station, replacing the previous one."""
+
+        if not self.enabled:
+            return
+
+        c = self.conn.cursor()
+        c.execute('''INSERT OR REPLACE INTO inventory
+                     (network, station, fetched, etag, last_modified, stationxml)
+                     VALUES (?,?,?,?,?,?)''',
+                  (network, station, fetched, etag, last_modified, stationxml))
+
+        # Save (commit) the changes
+        self.conn.commit()
+
+    def touch(self, network, station, fetched):
+        """Updates the fetch time of a stored inventory that was revalidated."""
+
+        if not self.enabled:
+            return
+
+        c = self.conn.cursor()
+        c.execute("UPDATE inventory SET fetched=? WHERE network=? AND station=?",
+                  (fetched, network, station))
+
+        # Save (commit) the changes
+        self.conn.commit()
+
+    def count(self):
+        """Returns the number of stations stored."""
+
+        c = self.conn.cursor()
+        c.execute("SELECT COUNT(*) FROM inventory")
+
+        return c.fetchone()[0]
+
+    def clear(self):
+        """Removes all the stations from the store."""
+
+        c = self.conn.cursor()
+        c.execute("DELETE FROM inventory")
+
+        # Save (commit) the changes
+        self.conn.commit()
+
+
+class LocationDatabase(LazyDatabase):
+
+    """
+    Class LocationDatabase
+    Manages an embedded database that stores the coordinates of the epochs of
+    each stream (network.station.location.channel), as fetched from FDSNWS.
+
+    The store is disabled when `LOCATION_DB` is not configured.
+    """
+
+    name = "location"
+
+    def __init__(self):
+        super().__init__(config.get("LOCATION_DB"))
+
+    def _create_table(self):
+        """
+        Creates the location table if it doesn't exist
+        """
+
+        c = self.conn.cursor()
+
+        # Create table
+        c.execute('''CREATE TABLE IF NOT EXISTS location
+                     (stream TEXT PRIMARY KEY,
+                      fetched REAL,
+                      epochs TEXT
+                     )''')
+
+        # Save (commit) the changes
+        self.conn.commit()
+
+    def get(self, streams):
+        """Returns the stored epochs of the given streams, as a `dict` of stream ->
+        (fetch time in seconds since the epoch, epochs as a JSON `str`). The
+        streams that are not stored are left out."""
+
+        if not self.enabled:
+            return dict()
+
+        streams = list(streams)
+        rows = dict()
+
+        # Few enough parameters per query for any SQLite version
+        c = self.conn.cursor()
+        for i in range(0, len(streams), 500):
+            chunk = streams[i:i + 500]
+            c.execute("SELECT * FROM location WHERE stream IN (%s)" % ",".join("?" * len(chunk)),
+                      chunk)
+            rows.update((row["stream"], (row["fetched"], row["epochs"])) for row in c.fetchall())
+
+        return rows
+
+    def put(self, rows):
+        """Stores the epochs of streams, given as (stream, fetch time, epochs as
+        a JSON `str`) tuples, all in one transaction."""
+
+        if not self.enabled:
+            return
+
+        c = self.conn.cursor()
+        c.executemany("INSERT OR REPLACE INTO location (stream, fetched, epochs) VALUES (?,?,?)",
+                      rows)
+
+        # Save (commit) the changes
+        self.conn.commit()
+
+    def count(self):
+        """Returns the number of streams stored."""
+
+        c = self.conn.cursor()
+        c.execute("SELECT COUNT(*) FROM location")
+
+        return c.fetchone()[0]
+
+    def clear(self):
+        """Removes all the streams from the store."""
+
+        c = self.conn.cursor()
+        c.execute("DELETE FROM location")
+
+        # Save (commit) the changes
+        self.conn.commit()
+
+
+class MetadataChangeDatabase(LazyDatabase):
+
+    """
+    Class MetadataChangeDatabase
+    Manages an embedded database that stores the hashes of the channel epochs
+    last seen in the StationXML files, and the changes of their responses, so
+    that the metadata derived from the affected files can be computed again.
+
+    The times of the epochs are stored as ISO 8601 strings of the same length,
+    so that they compare in order. The store is disabled when
+    `METADATA_CHANGE_DB` is not configured.
+    """
+
+    TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+    name = "metadata change"
+
+    def __init__(self):
+        super().__init__(config.get("METADATA_CHANGE_DB"))
+
+    def _create_table(self):
+        """
+        Creates the channel and change tables if they don't exist
+        """
+
+        c = self.conn.cursor()
+
+        # Create tables
+        c.execute('''CREATE TABLE IF NOT EXISTS channel
+                     (stream TEXT,
+                      start TEXT,
+                      end TEXT,
+                      hash TEXT,
+                      response_hash TEXT,
+                      file TEXT,
+                      PRIMARY KEY (stream, start)
+                     )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS change
+                     (stream TEXT,
+                      start TEXT,
+                      end TEXT,
+                      changed REAL
+                     )''')
+        c.execute("CREATE INDEX IF NOT EXISTS change_stream ON change (stream, start)")
+
+        # Save (commit) the changes
+        self.conn.commit()
+
+    def format_time(self, time):
+        """Returns a `datetime` (or `None`) as stored."""
+
+        return time.strftime(self.TIME_FORMAT) if time is not None else None
+
+    def parse_time(self, value):
+        """Returns a stored time as a `datetime` (or `None`)."""
+
+        return datetime.strptime(value, self.TIME_FORMAT) if value is not None else None
+
+    def get_channels(self):
+        """Returns the stored channel epochs, as a `dict` of (stream, start) ->
+        `sqlite3.Row` with the ``end``, ``hash``, ``response_hash`` and ``file``."""
+
+        c = self.conn.cursor()
+        c.execute("SELECT * FROM channel")
+
+        return {(row["stream"], row["start"]): row for row in c.fetchall()}
+
+    def update_channels(self, channels, removed):
+        """Stores the given channel epochs, as (stream, start, end, hash, response
+        hash, file) tuples with `datetime` times, and removes the epochs with the
+        given (stream, start) keys, all in one transaction."""
+
+        c = self.conn.cursor()
+        c.executemany("INSERT OR REPLACE INTO channel "
+                      "(stream, start, end, hash, response_hash, file) VALUES (?,?,?,?,?,?)",
+                      [(stream, self.format_time(start), self.format_time(end),
+                        channel_hash, response_hash, filepath)
+                       for stream, start, end, channel_hash, response_hash, filepath in channels])
+        c.executemany("DELETE FROM channel WHERE stream = ? AND start = ?", removed)
+
+        # Save (commit) the changes
+        self.conn.commit()
+
+    def add_changes(self, changes, changed):
+        """Stores the changes of the channel epochs given as (stream, start, end)
+        tuples, with `datetime` times (end may be `None`), detected at `changed`
+        seconds since the epoch."""
+
+        c = self.conn.cursor()
+        c.executemany("INSERT INTO change (stream, start, end, changed) VALUES (?,?,?,?)",
+                      [(stream, self.format_time(start), self.format_time(end), changed)
+                       for stream, start, end in changes])
+
+        # Save (commit) the changes
+        self.conn.commit()
+
+    def get_last_change(self, stream, start, end):
+        """Returns the time, in seconds since the epoch, of the last change of the
+        stream between `start` and `end`, or `None` if it never changed."""
+
+        if not self.enabled:
+            return None
+
+        c = self.conn.cursor()
+        c.execute("SELECT MAX(changed) FROM change WHERE stream = ? AND start < ? "
+                  "AND (end IS NULL OR end > ?)",
+                  (stream, self.format_time(end), self.format_time(start)))
+
+        return c.fetchone()[0]
+
+    def get_changes(self, since):
+        """Returns the changes detected since `since` seconds since the epoch, as
+        (stream, start, end) tuples with `datetime` times (end may be `None`)."""
+
+        if not self.enabled:
+            return []
+
+        c = self.conn.cursor()
+        c.execute("SELECT stream, start, end FROM change WHERE changed >= ?", (since,))
+
+        return [(row["stream"], self.parse_time(row["start"]), self.parse_time(row["end"]))
+                for row in c.fetchall()]
+
+    def count(self):
+        """Returns the number of channel epochs stored."""
+
+        c = self.conn.cursor()
+        c.execute("SELECT COUNT(*) FROM channel")
+
+        return c.fetchone()[0]
+
+    def clear(self):
+        """Removes all the channel epochs and changes from the store."""
+
+        c = self.conn.cursor()
+        c.execute("DELETE FROM channel")
+        c.execute("DELETE FROM change")
+
+        # Save (commit) the changes
+        self.conn.commit()
+
+
+class ManifestDatabase(LazyDatabase):
+
+    """
+    Class ManifestDatabase
+    Manages an embedded database that stores the files of SDS archives, with
+    their size, modification time and inode, and the modification times of the
+    directories they were listed from.
+
+    The store is disabled when `MANIFEST_DB` is not configured.
+    """
+
+    name = "manifest"
+
+    def __init__(self):
+        super().__init__(config.get("MANIFEST_DB"))
+
+    def _create_table(self):
+        """
+        Creates the directory and file tables if they don't exist
+        """
+
+        c = self.conn.cursor()
+
+        # Create tables
+        c.execute('''CREATE TABLE IF NOT EXISTS directory
+                     (archive TEXT,
+                      path TEXT,
+                      mtime_ns INTEGER,
+                      PRIMARY KEY (archive, path)
+                     )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS file
+                     (archive TEXT,
+                      filename TEXT,
+                      directory TEXT,
+                      stream TEXT,
+                      ordinal INTEGER,
+                      size INTEGER,
+                      mtime REAL,
+                      inode INTEGER,
+                      PRIMARY KEY (archive, filename)
+                     )''')
+        c.execute("CREATE INDEX IF NOT EXISTS file_directory ON file (archive, directory)")
+        c.execute("CREATE INDEX IF NOT EXISTS file_stream ON file (archive, stream)")
+        c.execute("CREATE INDEX IF NOT EXISTS file_ordinal ON file (archive, ordinal)")
+        c.execute("CREATE INDEX IF NOT EXISTS file_mtime ON file (archive, mtime)")
+
+        # Save (commit) the changes
+        self.conn.commit()
+
+    def get_directories(self, archive):
+        """Returns the directories of an archive, as a `dict` of path (relative to
+        the archive) -> modification time in ns (`None` if it must be listed again)."""
+
+        c = self.conn.cursor()
+        c.execute("SELECT path, mtime_ns FROM directory WHERE archive = ?", (archive,))
+
+        return {row["path"]: row["mtime_ns"] for row in c.fetchall()}
+
+    def get_files(self, archive, directory):
+        """Returns the files of a directory of an archive, as a `dict` of filename ->
+        (size, modification time, inode)."""
+
+        c = self.conn.cursor()
+        c.execute("SELECT filename, size, mtime, inode FROM file "
+                  "WHERE archive = ? AND directory = ?", (archive, directory))
+
+        return {row["filename"]: (row["size"], row["mtime"], row["inode"])
+                for row in c.fetchall()}
+
+    def update(self, archive, directories, removed_directories, files, removed_files):
+        """Stores the (path, modification time in ns) of directories and the (filename,
+        directory, stream, ordinal, size, modification time, inode) of files of an
+        archive, and removes the directories (with all the directories and files
+        under them) and the files with the given paths and filenames, all in one
+        transaction."""
+
+        c = self.conn.cursor()
+        for path in removed_directories:
+            prefix = path + "/"
+            c.execute("DELETE FROM directory WHERE archive = ? "
+                      "AND (path = ? OR substr(path, 1, ?) = ?)",
+                      (archive, path, len(prefix), prefix))
+            c.execute("DELETE FROM file WHERE archive = ? "
+                      "AND (directory = ? OR substr(directory, 1, ?) = ?)",
+                      (archive, path, len(prefix), prefix))
+        c.executemany("DELETE FROM file WHERE archive = ? AND filename = ?",
+                      [(archive, filename) for filename in removed_files])
+        c.executemany("INSERT OR REPLACE INTO directory (archive, path, mtime_ns) VALUES (?,?,?)",
+                      [(archive,) + tuple(directory) for directory in directories])
+        c.executemany("INSERT OR REPLACE INTO file (archive, filename, directory, stream, "
+                      "ordinal, size, mtime, inode) VALUES (?,?,?,?,?,?,?,?)",
+                      [(archive,) + tuple(row) for row in files])
+
+        # Save (commit) the changes
+        self.conn.commit()
+
+    def get_recent_files(self, archive, since):
+        """Returns the files of an archive modified after `since` (seconds since the
+        epoch), as a `dict` of directory -> `set` of filenames."""
+
+        c = self.conn.cursor()
+        c.execute("SELECT directory, filename FROM file WHERE archive = ? AND mtime > ?",
+                  (archive, since))
+
+        directories = dict()
+        for row in c.fetchall():
+            directories.setdefault(row["directory"], set()).add(row["filename"])
+
+        return directories
+
+    def query(self, archive, clauses, ordered=False):
+        """Returns the (filename, inode, size, modification time) of the files of an
+        archive that match all the given (SQL condition, parameters, values) clauses
+        on the columns of the file table.
+        If a clause has a `list` of values (or `None`), its condition refers to them as
+        the table ``{values}`` with a ``value`` column."""
+
+        c = self.conn.cursor()
+
+        conditions = ["archive = ?"]
+        parameters = [archive]
+        for i, (clause, clause_parameters, values) in enumerate(clauses):
+
+            # Any number of values, without a parameter for each
+            if values is not None:
+                table = "temp.manifest_values_%d" % i
+                c.execute("CREATE TEMP TABLE IF NOT EXISTS manifest_values_%d "
+                          "(value TEXT PRIMARY KEY)" % i)
+                c.execute("DELETE FROM %s" % table)
+                c.executemany("INSERT OR IGNORE INTO %s (value) VALUES (?)" % table,
+                              [(value,) for value in values])
+                clause = clause.format(values=table)
+
+            conditions.append("(%s)" % clause)
+            parameters.extend(clause_parameters)
+
+        c.execute("SELECT filename, inode, size, mtime FROM file WHERE %s%s" % (
+            " AND ".join(conditions), " ORDER BY directory, filename" if ordered else ""),
+            parameters)
+
+        return [tuple(row) for row in c.fetchall()]
+
+    def count(self, archive=None):
+        """Returns the number of files stored (of an archive, if given)."""
+
+        c = self.conn.cursor()
+        if archive is None:
+            c.execute("SELECT COUNT(*) FROM file")
+        else:
+            c.execute("SELECT COUNT(*) FROM file WHERE archive = ?", (archive,))
+
+        return c.fetchone()[0]
+
+    def clear(self):
+        """Removes all the directories and files from the store."""
+
+        c = self.conn.cursor()
+        c.execute("DELETE FROM directory")
+        c.execute("DELETE FROM file")
+
+        # Save (commit) the changes
+        self.conn.commit()
+
+
 deletion_database = DeletionDatabase()
+rule_timing_database = RuleTimingDatabase()
+checksum_database = ChecksumDatabase()
+inventory_database = InventoryDatabase()
+location_database = LocationDatabase()
+metadata_change_database = MetadataChangeDatabase()
+manifest_database = ManifestDatabase()
@@ -4,6 +4,11 @@ This module configures the main/root logger for the rule Manager.
 Because several modules are implemented as a _fake singleton_, this module has
 to act in the same way and be imported before the others.
 
+Records are put in a queue by the logging calls, and written to the stream or
+file by a background thread, so that the workers do not block on slow writes.
+They can be written as text lines or as JSON lines, with the structured fields
+passed in `extra` (e.g., the item and rule of the `RuleManager`).
+
 Example
 -------
 
@@ -13,14 +18,66 @@ import core.logger
 ...
 logger = logging.getLogger("RuleManager")
 logger.info("Running SDS Manager.")
+logger.debug("%s - %s - Executing", item, rule.name, extra={"item": item, "rule": rule.name})
 ```
 """
 
 import os
+import json
+import queue
+import atexit
 import logging
+import logging.handlers
 from configuration import config
 
 
+# Structured fields that can be passed to the logging calls in `extra`
+STRUCTURED_FIELDS = ("item", "rule", "event")
+
+
+class JSONLinesFormatter(logging.Formatter):
+    """Formats a log record as a JSON object in a single line."""
+
+    def format(self, record):
+
+        document = {
+            "time": self.formatTime(record),
+            "module": record.module,
+            "level": record.levelname,
+            "message": record.getMessage()
+        }
+
+        # Add the structured fields
+        for field in STRUCTURED_FIELDS:
+            if hasattr(record, field):
+                document[field] = str(getattr(record, field))
+
+        if record.exc_info:
+            document["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(document)
+
+
+class LazyLabel():
+    """Label of an object for the logs, computed only the first time it is needed.
+
+    The `str` of an item may be costly (e.g., `SDSFile` gets the modification
+    time of the file), so it is only computed once per item, and only if a
+    record with the item is actually emitted.
+    """
+
+    __slots__ = ("_object", "_label")
+
+    def __init__(self, obj):
+        self._object = obj
+        self._label = None
+
+    def __str__(self):
+        if self._label is None:
+            self._label = str(self._object)
+        return self._label
+
+
 def ini_logger():
     """ Initialize logger """
 
@@ -31,11 +88,30 @@ def ini_logger():
     filename = config["LOGGING"].get("FILENAME")
     if filename is not None:
         filename = os.path.expandvars(os.path.expanduser(filename))
+        handler = logging.FileHandler(filename)
+    else:
+        handler = logging.StreamHandler()
+
+    # Text (default) or JSON lines
+    if config["LOGGING"].get("FORMAT", "text") == "json":
+        handler.setFormatter(JSONLinesFormatter())
+    else:
+        handler.setFormatter(
+            logging.Formatter("%(asctime)s - %(module)s - %(levelname)s - %(message)s"))
+
+    # Write the records from a background thread
+    log_queue = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    listener.start()
+
+    # Flush the queue before exiting
+    atexit.register(listener.stop)
+
+    # The queued records only carry the message, they are formatted by the listener
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter("%(message)s"))
 
-    logging.basicConfig(
-        format="%(asctime)s - %(module)s - %(levelname)s - %(message)s",
-        filename=filename
-    )
+    logging.basicConfig(handlers=[queue_handler])
     logger = logging.getLogger("RuleManager")
     logger.setLevel(level)
 
@@ -0,0 +1,78 @@
+"""
+Reading and writing of rule execution plans.
+
+A plan is written as JSON lines, one line per item, with the name of the item,
+the rules that would be executed on it, and their expected cost in seconds.
+
+Example
+-------
+
+```
+{"item": "NL.HGN.02.BHZ.D.2019.022", "rules": ["PRUNE", "PURGE_RAW"], "cost": 1.52}
+```
+"""
+
+import json
+
+
+def write_plan(plan, plan_file):
+    """Writes a plan to a file.
+
+    Parameters
+    ----------
+    plan
+        An iterable of `dict`, as returned by `RuleManager.plan`. Items are
+        identified by their `filename` attribute.
+    plan_file : file object
+        An open text file to write to.
+
+    Returns
+    -------
+    n_items : `int`
+        The number of items in the plan.
+    total_cost : `float`
+        The sum of the expected costs of all items, in seconds.
+    """
+
+    n_items = 0
+    total_cost = 0.0
+
+    for entry in plan:
+        plan_file.write(json.dumps({
+            "item": entry["item"].filename,
+            "rules": entry["rules"],
+            "cost": entry["cost"]
+        }) + "\n")
+
+        n_items += 1
+        total_cost += entry["cost"] or 0.0
+
+    return n_items, total_cost
+
+
+def read_plan(plan_file, item_factory):
+    """Reads a plan from a file.
+
+    Parameters
+    ----------
+    plan_file : file object
+        An open text file with a plan written by `write_plan`.
+    item_factory : callable
+        Function that creates an item from its name, e.g. a `SDSFile` from its filename.
+
+    Returns
+    -------
+    `list` of `dict`
+        The plan, that can be passed to `RuleManager.execute_plan`.
+    """
+
+    plan = list()
+
+    for line in plan_file:
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        entry["item"] = item_factory(entry["item"])
+        plan.append(entry)
+
+    return plan
@@ -1,3 +1,4 @@
+import json
 import logging
 
 
@@ -19,29 +20,55 @@ class Rule():
         # Initialize logger
         self.logger = logging.getLogger("RuleManager")
 
-    def apply(self, SDSFile):
+    @property
+    def function_name(self):
+        """Name of the Python function implementing the rule."""
+        return self.call.func.__name__
+
+    def apply(self, SDSFile, check_conditions=True):
         """
         Rule.apply
-        Applies a given rule and conditions to a file
+        Applies a given rule and conditions to a file, and returns the
+        derived items emitted by the rule, if any
         """
 
-        # Assert the conditions
-        self.assert_policies(SDSFile)
+        # Assert the conditions, unless they were already checked (e.g. in a plan)
+        if check_conditions:
+            self.assert_policies(SDSFile)
 
         # Call the rule
-        self.call(SDSFile)
+        return self.call(SDSFile)
+
+    def assert_policies(self, sds_file, cache=None):
+        """Assert whether all conditions evaluate to True.
 
-    def assert_policies(self, sds_file):
-        """Assert whether all conditions evaluate to True."""
+        Parameters
+        ----------
+        sds_file
+            The item the conditions are evaluated on.
+        cache : `dict`, optional
+            Results of the conditions already evaluated on the same item, keyed
+            by condition name and options. It is updated in place, so that a
+            condition shared by several rules is only evaluated once.
+        """
 
         # Go over each configured condition and assert the condition evaluates to True
         for condition in self.conditions:
-            self.logger.debug("%s: Asserting condition '%s'." % (sds_file.filename,
-                                                                 condition.func.__name__))
-            if not condition(sds_file):
-
-                # If a __wrapped__ attribute exists the function was inverted
-                if "__wrapped__" in dir(condition.func):
-                    raise AssertionError("!%s" % condition.func.__name__)
-                else:
-                    raise AssertionError(condition.func.__name__)
+
+            # If a __wrapped__ attribute exists the function was inverted
+            if "__wrapped__" in dir(condition.func):
+                condition_name = "!%s" % condition.func.__name__
+            else:
+                condition_name = condition.func.__name__
+
+            self.logger.debug("%s: Asserting condition '%s'.", sds_file.filename, condition_name)
+            if cache is None:
+                result = condition(sds_file)
+            else:
+                key = (condition_name, json.dumps(condition.args[0], sort_keys=True))
+                if key not in cache:
+                    cache[key] = condition(sds_file)
+                result = cache[key]
+
+            if not result:
+                raise AssertionError(condition_name)
@@ -1,10 +1,13 @@
 import logging
 import signal
+import time
 import json
-import jsonschema
 
+from collections import OrderedDict
 from functools import partial, wraps
 from core.rule import Rule
+from core.context import open_context, close_context
+from core.logger import LazyLabel
 from core.exceptions import ExitPipelineException
 from configuration import config
 from schema import JSON_RULE_SCHEMA
@@ -27,6 +30,12 @@ class RuleManager():
         self.conditions = None
         self.rule_sequence = None
 
+        # Execution timings of the rules: function name -> (count, total seconds)
+        self.timings = dict()
+
+        # Memory limit of the context shared by the rules on each item
+        self.context_max_bytes = config.get("ITEM_CONTEXT_MAX_BYTES", 256 * 1024 * 1024)
+
     def __signal_handler(self, signum, frame):
         """Raise an exception when a signal SIGALRM was received."""
 
@@ -68,7 +77,8 @@ class RuleManager():
         except IOError:
             raise IOError("The rulemap %s could not be found." % rule_map_file)
 
-        # Confirm rule map against the schema
+        # Confirm rule map against the schema, jsonschema is slow to import
+        import jsonschema
         try:
             jsonschema.validate(rule_desc, JSON_RULE_SCHEMA)
         except jsonschema.exceptions.ValidationError:
@@ -129,7 +139,7 @@ class RuleManager():
         # There may be multiple conditions defined per rule
         rule_obj = Rule(
             self.bind_options(self.rules, rule),
-            map(lambda x: self.bind_options(self.conditions, x), rule["conditions"]),
+            [self.bind_options(self.conditions, x) for x in rule["conditions"]],
             name=rule["rule_name"]
         )
 
@@ -138,26 +148,225 @@ class RuleManager():
 
         return (rule_obj, timeout)
 
-    def sequence(self, items):
+    def sequence(self, items, process_derived=False, max_depth=1):
         """
         Def RuleManager.sequence
         Runs the sequence of rules on the given file list.
 
+        A rule may return a list of items derived from the one it processed
+        (e.g., the pruned Q file of a D file). When `process_derived` is set,
+        derived items are processed in the same run by the rules that follow
+        the one that emitted them, after all the given items, in the order
+        they were emitted.
+
         Parameters
         ----------
         items
             An iterable collection of objects that can be processed by the loaded rules.
+        process_derived : `bool`
+            Whether or not to process the items emitted by the rules (default `False`).
+        max_depth : `int`
+            Maximum number of generations of derived items, to protect against
+            rules emitting items indefinitely (default 1, i.e. items derived
+            from derived items are ignored).
         """
 
+        rules = [self.get_rule(rule) for rule in self.rule_sequence]
         total = len(items)
 
+        # Given items that still have to be processed, so they are not derived twice
+        pending = {item.filename for item in items} if process_derived else set()
+
+        # Derived items to process: filename -> (item, index of first rule, depth)
+        derived = OrderedDict()
+        processed = set()
+
+        def queue_derived(emitted, depth):
+            for derived_item, first_rule in emitted:
+                key = derived_item.filename
+                if not process_derived or key in pending:
+                    continue
+                if depth > max_depth:
+                    self._log(logging.WARNING, key, None, "ignored",
+                              "Derived item ignored, maximum depth %d reached", max_depth)
+                    continue
+                if (key, first_rule) in processed:
+                    self._log(logging.WARNING, key, None, "ignored",
+                              "Derived item ignored, already processed")
+                    continue
+                # An item derived twice is processed once, from the earliest rule
+                if key in derived:
+                    first_rule = min(first_rule, derived[key][1])
+                    depth = min(depth, derived[key][2])
+                derived[key] = (derived_item, first_rule, depth)
+
         # Items can be SDSFiles or metadata (XML) files
         for i, item in enumerate(items):
 
-            self.logger.info("%s - Item %d of %d" % (str(item), i+1, total))
+            label = LazyLabel(item)
+            self._log(logging.INFO, label, None, "item", "Item %d of %d", i+1, total)
+            pending.discard(item.filename)
 
             # Get the sequence of rules to be applied
-            for rule, timeout in map(self.get_rule, self.rule_sequence):
+            queue_derived(self._apply_rules(item, rules, label=label), 1)
+
+        # Process derived items in the order they were emitted
+        while derived:
+            key, (item, first_rule, depth) = derived.popitem(last=False)
+            processed.add((key, first_rule))
+
+            label = LazyLabel(item)
+            self._log(logging.INFO, label, None, "derived",
+                      "Derived item (%d remaining)", len(derived))
+            emitted = self._apply_rules(item, rules[first_rule:], label=label)
+            queue_derived([(derived_item, first_rule + next_rule)
+                           for derived_item, next_rule in emitted], depth + 1)
+
+        self._save_timings()
+
+    def plan(self, items):
+        """Evaluates the conditions of the sequence of rules on the given items,
+        without running any of the rules.
+
+        Conditions are evaluated on the current state of the items, and each
+        condition shared by several rules of the sequence is evaluated only
+        once per item. Since no rule runs, the plan cannot foresee the effect
+        of a rule on the conditions of the following ones, nor a rule exiting
+        the pipeline.
+
+        Parameters
+        ----------
+        items
+            An iterable collection of objects that can be processed by the loaded rules.
+
+        Yields
+        ------
+        `dict`
+            For each item with at least one rule to be executed:
+            - ``item``: The item (`object`)
+            - ``rules``: Names of the rules that would be executed (`list` of `str`)
+            - ``cost``: Expected execution time in seconds, from the historical
+                        timings (`float`, or `None` if no rule has been timed before)
+        """
+
+        from core.database import rule_timing_database
+        mean_timings = rule_timing_database.get_mean_timings()
+
+        total = len(items)
+
+        for i, item in enumerate(items):
+
+            label = LazyLabel(item)
+            self._log(logging.DEBUG, label, None, "item", "Item %d of %d", i+1, total)
+
+            # Results of the conditions evaluated on this item
+            cache = dict()
+            rule_names = list()
+            cost = None
+
+            open_context(self.context_max_bytes)
+
+            # Free the context of the item, even if the plan is not consumed further
+            try:
+                for rule, timeout in map(self.get_rule, self.rule_sequence):
+
+                    # Set a signal
+                    signal.signal(signal.SIGALRM, self.__signal_handler)
+                    signal.alarm(timeout)
+
+                    try:
+                        rule.assert_policies(item, cache=cache)
+                    except TimeoutError:
+                        self._log(logging.WARNING, label, rule.name, "timeout", "Timeout")
+                        continue
+                    except AssertionError as e:
+                        self._log(logging.DEBUG, label, rule.name, "condition",
+                                  "Did not pass condition '%s'.", e)
+                        continue
+                    except Exception as e:
+                        self._log(logging.ERROR, label, rule.name, "failure", "Failure: %s", e)
+                        continue
+                    finally:
+                        signal.alarm(0)
+
+                    rule_names.append(rule.name)
+                    if rule.function_name in mean_timings:
+                        cost = (cost or 0.0) + mean_timings[rule.function_name]
+            finally:
+                close_context()
+
+            if rule_names:
+                yield {"item": item, "rules": rule_names, "cost": cost}
+
+    def execute_plan(self, plan):
+        """Runs the rules listed in a plan, without checking their conditions again.
+
+        Parameters
+        ----------
+        plan
+            An iterable collection of `dict`, as returned by `RuleManager.plan`.
+
+        Raises
+        ------
+        `ValueError`
+            Raised if the plan refers to a rule that is not in the loaded sequence.
+        """
+
+        rule_names = [rule["rule_name"] for rule in self.rule_sequence]
+
+        # Check all planned rules are known before running any of them
+        for entry in plan:
+            for rule_name in entry["rules"]:
+                if rule_name not in rule_names:
+                    raise ValueError("The planned rule %s is not in the loaded rule sequence."
+                                     % rule_name)
+
+        total = len(plan)
+
+        try:
+            for i, entry in enumerate(plan):
+
+                item = entry["item"]
+                label = LazyLabel(item)
+                self._log(logging.INFO, label, None, "item", "Item %d of %d", i+1, total)
+
+                # Keep the order of the sequence
+                rules = [self.get_rule(rule) for rule in self.rule_sequence
+                         if rule["rule_name"] in entry["rules"]]
+                self._apply_rules(item, rules, check_conditions=False, label=label)
+        finally:
+            self._save_timings()
+
+    def _apply_rules(self, item, rules, check_conditions=True, label=None):
+        """Applies the given rules to a single item. The rules share a new
+        context, that is freed when they are finished.
+
+        Parameters
+        ----------
+        item
+            An object that can be processed by the loaded rules.
+        rules
+            An iterable of (`Rule`, timeout) pairs, as returned by `RuleManager.get_rule`.
+        check_conditions : `bool`
+            Whether or not to assert the rule conditions before executing them (default `True`).
+        label : `LazyLabel`, optional
+            Label of the item in the logs.
+
+        Returns
+        -------
+        `list` of (`object`, `int`)
+            The items derived by the executed rules, each paired with the
+            position in `rules` of the rule following the one that emitted it.
+        """
+
+        emitted = list()
+        if label is None:
+            label = LazyLabel(item)
+
+        open_context(self.context_max_bytes)
+
+        try:
+            for i, (rule, timeout) in enumerate(rules):
 
                 # Set a signal
                 signal.signal(signal.SIGALRM, self.__signal_handler)
@@ -165,43 +374,97 @@ class RuleManager():
 
                 # Rule options are bound to the call
                 try:
-                    self.logger.debug("%s - %s - Executing" % (str(item), rule.name))
-                    rule.apply(item)
-                    self.logger.info("%s - %s - Success"
-                                     % (str(item), rule.name))
+                    if check_conditions:
+                        rule.assert_policies(item)
+                    self._log(logging.DEBUG, label, rule.name, "executing", "Executing")
+                    start = time.monotonic()
+                    derived_items = rule.apply(item, check_conditions=False)
+                    self._add_timing(rule, time.monotonic() - start)
+                    if derived_items:
+                        emitted.extend((derived_item, i + 1) for derived_item in derived_items)
+                    self._log(logging.INFO, label, rule.name, "success", "Success")
 
                 # A rule called for the pipeline to be exited for this file
                 except ExitPipelineException as e:
                     if e.is_error:
                         # The exception came from an error
-                        self.logger.error("%s - %s - Failure: %s"
-                                          % (str(item), rule.name, e.message))
+                        self._log(logging.ERROR, label, rule.name, "failure",
+                                  "Failure: %s", e.message)
                     else:
                         # A rule executed successfully and called for an exit
-                        self.logger.info("%s - %s - Success"
-                                         % (str(item), rule.name))
+                        self._add_timing(rule, time.monotonic() - start)
+                        self._log(logging.INFO, label, rule.name, "success", "Success")
 
-                    self.logger.info("%s - Exit" % (str(item)))
+                    self._log(logging.INFO, label, None, "exit", "Exit")
 
                     # The "finally" block WILL be executed even after breaking
                     break
 
                 # The rule was timed out
                 except TimeoutError:
-                    self.logger.warning("%s - %s - Timeout"
-                                        % (str(item), rule.name))
+                    self._log(logging.WARNING, label, rule.name, "timeout", "Timeout")
 
                 # Condition assertion errors
                 except AssertionError as e:
-                    self.logger.info(
-                        "%s - %s - Did not pass condition '%s'."
-                        % (str(item), rule.name, e))
+                    self._log(logging.INFO, label, rule.name, "condition",
+                              "Did not pass condition '%s'.", e)
 
                 # Other exceptions
                 except Exception as e:
-                    self.logger.error("%s - %s - Failure: %s"
-                                      % (str(item), rule.name, e), exc_info=False)
+                    self._log(logging.ERROR, label, rule.name, "failure", "Failure: %s", e)
 
                 # Disable the alarm
                 finally:
                     signal.alarm(0)
+
+        # Free the context of the item
+        finally:
+            close_context()
+
+        return emitted
+
+    def _log(self, level, label, rule_name, event, message, *args):
+        """Logs an event of the sequence on an item.
+
+        Arguments are only formatted if the record is emitted, and the item, rule
+        and event are attached to the record as structured fields.
+
+        Parameters
+        ----------
+        level : `int`
+            The logging level.
+        label : `LazyLabel` or `str`
+            Label of the item.
+        rule_name : `str` or `None`
+            Name of the rule, if the event is related to one.
+        event : `str`
+            Type of event, e.g. "success" or "failure".
+        message : `str`
+            Message, with `%` placeholders for `args`.
+        """
+
+        if not self.logger.isEnabledFor(level):
+            return
+
+        if rule_name is None:
+            self.logger.log(level, "%s - " + message, label, *args,
+                            extra={"item": label, "event": event})
+        else:
+            self.logger.log(level, "%s - %s - " + message, label, rule_name, *args,
+                            extra={"item": label, "rule": rule_name, "event": event})
+
+    def _add_timing(self, rule, duration):
+        """Accumulates the duration of a successful rule execution, conditions excluded."""
+
+        count, total = self.timings.get(rule.function_name, (0, 0.0))
+        self.timings[rule.function_name] = (count + 1, total + duration)
+
+    def _save_timings(self):
+        """Saves the accumulated rule timings to the rule timing database."""
+
+        if not self.timings:
+            return
+
+        from core.database import rule_timing_database
+        rule_timing_database.add_timings(self.timings)
+        self.timings = dict()
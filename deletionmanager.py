@@ -9,7 +9,8 @@ import argparse
 
 import core.logger
 from core.rulemanager import RuleManager
-from sds.sdsfile import SDSFile
+from core.plan import write_plan, read_plan
+from sds.sdsfile import sds_file_registry
 from core.database import deletion_database
 import rules.sdsrules as sdsrules
 import conditions.sdsconditions as sdsconditions
@@ -31,24 +32,61 @@ def main():
         parser.add_argument("--ruleseq", help="rule sequence file", required=True)
         parser.add_argument("--from_file",
                             help="files to delete, listed in a text file or stdin '-'",
-                            type=argparse.FileType("r"), required=True)
+                            type=argparse.FileType("r"))
+        plan_group = parser.add_mutually_exclusive_group()
+        plan_group.add_argument("--plan",
+                                help=("only evaluate the rule conditions and write the plan of "
+                                      "rules that would be executed, with their expected cost, "
+                                      "to a file or stdout '-' (files are not added to the "
+                                      "deletion database)"),
+                                type=argparse.FileType("w"))
+        plan_group.add_argument("--execute-plan",
+                                help=("execute the rules listed in a plan file, without "
+                                      "checking conditions again"),
+                                type=argparse.FileType("r"))
         parsedargs = vars(parser.parse_args())
 
+        # Check collection parameters
+        if parsedargs["from_file"] is None and parsedargs["execute_plan"] is None:
+            return print("Files to delete need to be specified using --from_file")
+
         # Set up rules
         RM = RuleManager()
         RM.load_rules(sdsrules, sdsconditions, parsedargs["ruleseq"])
 
+        # Execute a previously written plan
+        if parsedargs["execute_plan"] is not None:
+            with parsedargs["execute_plan"] as plan_file:
+                plan = read_plan(plan_file,
+                                 lambda filename: sds_file_registry.get(filename, parsedargs["dir"]))
+            RM.execute_plan(plan)
+            return logger.info("Finished Deletion Manager execution.")
+
         # Collect new files to delete
         with parsedargs["from_file"] as del_list:
-            for line in del_list:
-                deletion_database.add_filename(line.strip())
+            new_filenames = [line.strip() for line in del_list]
 
-        # Get all files from database
-        files = [SDSFile(filename, parsedargs["dir"])
+        # Get all files from database (new files are not stored when only planning)
+        if parsedargs["plan"] is None:
+            for filename in new_filenames:
+                deletion_database.add_filename(filename)
+            filenames = deletion_database.get_all_filenames()
+        else:
+            filenames = deletion_database.get_all_filenames()
+            filenames += [filename for filename in new_filenames if filename not in filenames]
+        files = [sds_file_registry.get(filename, parsedargs["dir"])
                  for filename
-                 in deletion_database.get_all_filenames()]
+                 in filenames]
         logger.debug("Collected %d files for deletion" % len(files))
 
+        # Only write the plan of the sequence of rules
+        if parsedargs["plan"] is not None:
+            with parsedargs["plan"] as plan_file:
+                n_items, total_cost = write_plan(RM.plan(files), plan_file)
+            logger.info("Planned rules for %d of %d files, expected cost %.1f s."
+                        % (n_items, len(files), total_cost))
+            return logger.info("Finished Deletion Manager execution.")
+
         # Apply the sequence of rules on files
         RM.sequence(files)
 
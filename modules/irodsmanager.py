@@ -2,8 +2,9 @@
 This module implements an iRODS session manager as a _fake singleton_.
 
 Instead of calling the IRODSManager() constructor, use the
-irods_session variable, that is already created and connected to iRODS
-when the module is loaded.
+irods_session variable, that is already created when the module is loaded.
+The connection to iRODS is only opened the first time it is needed, so
+importing this module is cheap for sequences that do not use iRODS.
 
 Example
 -------
@@ -18,13 +19,6 @@ irods_session.create_data_object(sds_file)
 import os
 import logging
 
-# Lots of iRODS imports
-from irods.session import iRODSSession
-from irods.models import Collection, DataObject, DataObjectMeta
-from irods.exception import DataObjectDoesNotExist, CollectionDoesNotExist, MultipleResultsFound
-from irods.rule import Rule
-import irods.keywords as kw
-
 from configuration import config
 
 
@@ -40,10 +34,14 @@ class IRODSManager():
 
         # Initialize logger
         self.logger = logging.getLogger("RuleManager")
-        self.logger.debug("Initializing a new iRODS Session.")
 
-        self.session = None
+        self._session = None
+
+    @property
+    def session(self):
+        """The iRODSSession, connected on first use."""
         self.connect()
+        return self._session
 
     def connect(self):
         """
@@ -51,11 +49,15 @@ class IRODSManager():
         Creates a iRODSSession to connect to iRODS
         """
 
-        if self.session is not None:
+        if self._session is not None:
             return
 
+        from irods.session import iRODSSession
+
+        self.logger.debug("Initializing a new iRODS Session.")
+
         # Open a session
-        self.session = iRODSSession(
+        self._session = iRODSSession(
             host=config["IRODS"]["HOST"],
             port=config["IRODS"]["PORT"],
             user=config["IRODS"]["USER"],
@@ -72,10 +74,11 @@ class IRODSManager():
 
         self.logger.debug("Disconnecting the iRODS Session.")
 
-        if self.session is None:
+        if self._session is None:
             return
 
-        self.session.cleanup()
+        self._session.cleanup()
+        self._session = None
 
     def get_collection(self, path):
         """Returns the collection named by `path`."""
@@ -94,6 +97,8 @@ class IRODSManager():
         Executes a rule from given file path with input parameters
         """
 
+        from irods.rule import Rule
+
         rule = Rule(self.session, rule_path, params=input_parameters, output="ruleExecOut")
 
         output = rule.execute()
@@ -182,6 +187,7 @@ class IRODSManager():
             success = True
 
         # Trim cache
+        import irods.keywords as kw
         data_object = self.get_data_object(sds_file)
         options = {kw.REPL_NUM_KW: str(data_object.replicas[-1].number)}
         data_object.unlink(**options)
@@ -215,11 +221,12 @@ class IRODSManager():
         if data_object is not None:
 
             # Checksum of file did not change vs. iRODS checksum
-            if data_object.checksum == sds_file.checksum:
+            if data_object.checksum == sds_file.irods_checksum:
                 self.logger.debug("File already registered, cancelling ingestion.")
                 return
 
         # Some put options
+        import irods.keywords as kw
         options = {
             kw.RESC_NAME_KW: resc_name,
             kw.PURGE_CACHE_KW: purge_cache,
@@ -274,6 +281,7 @@ class IRODSManager():
         self.create_collection(sds_file.custom_directory(root_collection))
 
         # Some put options
+        import irods.keywords as kw
         options = {
             kw.RESC_NAME_KW: resc_name,
             kw.PURGE_CACHE_KW: purge_cache,
@@ -300,6 +308,8 @@ class IRODSManager():
             The archive's root collection.
         """
 
+        from irods.exception import CollectionDoesNotExist
+
         # Get collection
         try:
             fed_col = self.get_collection(sds_file.custom_directory(root_collection))
@@ -328,6 +338,9 @@ class IRODSManager():
         MultipleResultsFound
             Raised if more than one different versions of the file exist in remote location.
         """
+        from irods.models import Collection, DataObject
+        from irods.exception import MultipleResultsFound
+
         # Query iRODS
         q = (irods_session.session.query(Collection.name, DataObject.name, DataObject.checksum)
              .filter(Collection.name == sds_file.custom_directory(root_collection))
@@ -348,14 +361,14 @@ class IRODSManager():
         remote_checksum = checksum_set.pop()
 
         # Compare checksums
-        if sds_file.checksum == remote_checksum:
+        if sds_file.irods_checksum == remote_checksum:
             self.logger.debug("File %s does exist in iRODS, with same checksum (%s)."
-                              % (sds_file.filename, sds_file.checksum))
+                              % (sds_file.filename, sds_file.irods_checksum))
             return True
 
         self.logger.debug(
             "File %s does exist in iRODS, but with a different checksum (%s vs %s)."
-            % (sds_file.filename, remote_checksum, sds_file.checksum))
+            % (sds_file.filename, remote_checksum, sds_file.irods_checksum))
         return False
 
     def get_federated_pid(self, sds_file, root_collection):
@@ -378,6 +391,9 @@ class IRODSManager():
         MultipleResultsFound
             Raised if file has more than one different PID assigned to it.
         """
+        from irods.models import Collection, DataObject, DataObjectMeta
+        from irods.exception import MultipleResultsFound
+
         # Query iRODS
         q = (irods_session.session
              .query(Collection.name, DataObject.name, DataObjectMeta.value)
@@ -415,6 +431,8 @@ class IRODSManager():
             The archive's root collection.
         """
 
+        from irods.exception import DataObjectDoesNotExist, CollectionDoesNotExist
+
         # Attempt to get the file from iRODS
         # If it does not exists an exception is raised and we return None
         try:
@@ -443,14 +461,14 @@ class IRODSManager():
             return False
         else:
             # Compare checksum
-            if data_object.checksum == sds_file.checksum:
+            if data_object.checksum == sds_file.irods_checksum:
                 self.logger.debug("File %s does exist in iRODS, with same checksum (%s)." % (
-                    sds_file.filename, sds_file.checksum))
+                    sds_file.filename, sds_file.irods_checksum))
                 return True
             else:
                 self.logger.debug(
                     "File %s does exist in iRODS, but with a different checksum (%s vs %s)."
-                    % (sds_file.filename, data_object.checksum, sds_file.checksum))
+                    % (sds_file.filename, data_object.checksum, sds_file.irods_checksum))
                 return False
 
     def get_pid(self, sds_file, root_collection=None):
@@ -482,4 +500,3 @@ class IRODSManager():
 
 
 irods_session = IRODSManager()
-irods_session.connect()
@@ -3,8 +3,8 @@ This module implements a MongoDB session manager as a `dict`
 holding one session to each collection in `config`.
 
 Instead of calling the MongoManager() constructor, use the
-mongo_pool variable, that is already created and connected to Mongo
-when the module is loaded.
+mongo_pool variable, that is already created when the module is loaded.
+Each session only connects to Mongo the first time its collection is used.
 
 Example
 -------
@@ -19,12 +19,10 @@ mongo_pool.set_wfcatalog_daily_document("collection_name", document)
 import logging
 from configuration import config
 
-# MongoDB driver for Python
-from pymongo import MongoClient
-
 
 class MongoSession():
-    """Container for a MongoDB session. It is plugged to a single collection.
+    """Container for a MongoDB session. It is plugged to a single collection,
+    and connects to the database the first time one of the attributes is used.
 
     Attributes
     ----------
@@ -48,9 +46,9 @@ class MongoSession():
 
     def __init__(self, config_dict):
         # Session will not be initialized yet
-        self.client = None
-        self.database = None
-        self.collection = None
+        self._client = None
+        self._database = None
+        self._collection = None
 
         # DB location
         self._host = config_dict["HOST"]
@@ -68,21 +66,41 @@ class MongoSession():
         self._logger.debug("Initializing a new Mongo Session on %s:%s." % (
                                                         self._host, self._port))
 
+    @property
+    def client(self):
+        self.connect()
+        return self._client
+
+    @property
+    def database(self):
+        self.connect()
+        return self._database
+
+    @property
+    def collection(self):
+        self.connect()
+        return self._collection
+
     def connect(self):
         """Creates a connection to the database. If the object already has a
         connection, does nothing."""
 
-        if self.client is not None:
+        if self._client is not None:
             return
 
+        # MongoDB driver for Python
+        from pymongo import MongoClient
+
+        self._logger.debug("Connecting to Mongo collection '%s'." % self._collection_name)
+
         # Create a connection
-        self.client = MongoClient(self._host, self._port, retryWrites=False)
-        self.database = self.client[self._db_name]
-        self.collection = self.database[self._collection_name]
+        self._client = MongoClient(self._host, self._port, retryWrites=False)
+        self._database = self._client[self._db_name]
+        self._collection = self._database[self._collection_name]
 
         # Authenticate against the database
         if self._authenticate:
-            self.database.authenticate(self._user, self._pass)
+            self._database.authenticate(self._user, self._pass)
 
     def find_one(self, query):
         """Finds a single document in the collection."""
@@ -140,8 +158,8 @@ class MongoSession():
 
 class MongoManager():
     """Stores all the MongoDB sessions from the configuration. Reads all
-    MongoDB information from config and connects to all sessions at
-    load time.
+    MongoDB information from config at load time, but each session only
+    connects when it is first used.
 
     Attributes
     ----------
@@ -153,10 +171,6 @@ class MongoManager():
         self.sessions = {db_info["NAME"]: MongoSession(db_info)
                          for db_info in config["MONGO"]}
 
-        # TODO: connect later
-        for session_name in self.sessions:
-            self.sessions[session_name].connect()
-
     def save_dc_document(self, document):
         """Saves a Dublin Core document."""
         self.sessions["Dublin Core"].save(document)
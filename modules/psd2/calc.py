@@ -1,10 +1,9 @@
 import numpy as np
 import os
 import json
-from matplotlib import mlab
-import matplotlib.pyplot as plt
 from dateutil.parser import parse
-from scipy.signal import detrend, welch, tukey
+from scipy.signal import detrend, welch
+from scipy.signal.windows import tukey
 import logging
 
 
@@ -191,7 +190,8 @@ def psdWelchMlab(signal, fs, resp, nfft=1024, overlap=0.5, reference=1.0):
 
     overlap = int(nfft * overlap)
 
-    # Use mlab
+    # Use mlab, matplotlib is only imported when this method is used
+    from matplotlib import mlab
     Pxx, _ = mlab.psd(
         signal,
         NFFT=nfft,
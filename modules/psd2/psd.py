@@ -1,9 +1,11 @@
 import numpy as np
 from obspy import read, UTCDateTime, Stream
 from zlib import adler32
+from datetime import datetime, timedelta
 import logging
 import ctypes
 
+from core.context import current_context
 from .calc import compressSpectrum, smoothSpectrum, getInstrumentResponse, psdWelch
 from .constants import (DB_REFERENCE, MINIMUM_PERIOD, NUMBER_OF_FREQUENCIES,
                         OCTAVE_PERIOD_STEP, SEGMENT_LENGTH)
@@ -92,13 +94,16 @@ class PSDCollector():
         # Create an empty stream to fill
         ObspyStream = Stream()
 
-        # Read neighbouring files
-        for neighbour in SDSFile.neighbours:
+        # Read this file, and the records of the neighbouring files
+        # until half an hour in the next day [psd segment end]
+        end = SDSFile.end + timedelta(seconds=0.5 * SEGMENT_LENGTH)
+        for source in SDSFile.neighbour_sources(end=end):
 
             # Read from 0h of this day, most likely in the previous day file,
             # until half an hour in the next day [psd segment end]
             st = read(
-                neighbour.filepath,
+                source,
+                format="MSEED",
                 starttime=UTCDateTime(SDSFile.start),
                 endtime=UTCDateTime(SDSFile.end) + 0.5 * SEGMENT_LENGTH,
                 nearest_sample=False
@@ -327,6 +332,7 @@ class PSDCollector():
             # Save all metadata in a record
             psd_record = {
                 "fileId": SDSFile.filename,
+                "created": datetime.now(),
                 "checksum": SDSFile.checksum,
                 "checksumInventory": resp_checksum,
                 "net": SDSFile.net,
@@ -354,8 +360,11 @@ class PSDCollector():
         # no matter if they are at the beggining of the day or not. This way,
         # we can check if the file needs to be processed when previous/next
         # files are added/modified, in all possible cases.
-        psdObjects[0]["checksum_prev"] = SDSFile.previous.checksum
-        psdObjects[-1]["checksum_next"] = SDSFile.next.checksum
+        context = current_context()
+        psdObjects[0]["checksum_prev"] = context.get_or_compute(
+            "checksum_previous", lambda: SDSFile.previous.checksum)
+        psdObjects[-1]["checksum_next"] = context.get_or_compute(
+            "checksum_next", lambda: SDSFile.next.checksum)
 
         return psdObjects
 
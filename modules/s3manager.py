@@ -1,22 +1,29 @@
-import boto3
-from botocore.exceptions import ClientError
-
 from configuration import config
 
 
 BUCKET_NAME = config["S3"]["BUCKET_NAME"]
 PROFILE = config["S3"]["PROFILE"]
 
+# Created on first use, boto3 is slow to import and to set up a session
+_bucket = None
+
 
 def _get_bucket():
     """Returns the Bucket resource object for the SDS archive."""
-    session = boto3.session.Session(profile_name=PROFILE)
-    s3_resource = session.resource("s3")
-    return s3_resource.Bucket(name=BUCKET_NAME)
+
+    global _bucket
+    if _bucket is None:
+        import boto3
+        session = boto3.session.Session(profile_name=PROFILE)
+        s3_resource = session.resource("s3")
+        _bucket = s3_resource.Bucket(name=BUCKET_NAME)
+
+    return _bucket
 
 
 def exists(sds_file):
     """Check whether a file is present in S3."""
+    from botocore.exceptions import ClientError
     bucket = _get_bucket()
 
     try:
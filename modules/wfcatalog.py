@@ -3,6 +3,8 @@ from datetime import datetime
 
 from obspy.signal.quality_control import MSEEDMetadata
 
+from core.context import current_context
+
 # Version of the WFCatalog collector (saved in the DB)
 WCATALOG_COLLECTOR_VERSION = "1.0.0"
 
@@ -18,7 +20,8 @@ def get_wf_metadata(SDSFile):
         # Catch warnings raised by ObsPy
         warnings.simplefilter("always")
 
-        metadata = MSEEDMetadata([sdsfile.filepath for sdsfile in SDSFile.neighbours],
+        # Only the records of the neighbours that overlap with the day are read
+        metadata = MSEEDMetadata(SDSFile.neighbour_sources(),
                                  starttime=SDSFile.start,
                                  endtime=SDSFile.end,
                                  add_flags=True,
@@ -41,7 +44,8 @@ def extract_daily_document(sds_file, trace):
     source = {
         "created": datetime.now(),
         "checksum": sds_file.checksum,
-        "checksum_prev": sds_file.previous.checksum,
+        "checksum_prev": current_context().get_or_compute(
+            "checksum_previous", lambda: sds_file.previous.checksum),
         "collector": WCATALOG_COLLECTOR_VERSION,
         "warnings": trace["warnings"],
         "status": "open",
@@ -4,23 +4,27 @@ Module that houses all the rule handlers for SDS daily files.
 Every rule should be implemented as a module function with exactly two arguments:
 1) a `dict` that holds the options for the rule, and
 2) the item that is subject to the rule, in this case, a `SDSFile` object.
+
+A rule may return a list of new items derived from the one it processed, which
+the `RuleManager` can pass through the rest of the sequence in the same run.
+
+Heavy dependencies (ObsPy, boto3) are imported inside the rules that need them,
+so that loading this module stays cheap for sequences that do not use them.
 """
 
 import logging
 import os
 import shutil
 
-from botocore.exceptions import CredentialRetrievalError
-from boto3.exceptions import S3UploadFailedError
 from core.exceptions import ExitPipelineException
+from core.context import current_context
+from sds.sdsfile import sds_file_registry
 
-from modules.wfcatalog import get_wf_metadata
 from modules.dublincore import extract_dc_metadata
 
 import modules.s3manager as s3manager
 from modules.irodsmanager import irods_session
 from modules.mongomanager import mongo_pool
-from modules.psd2.psd import PSDCollector
 
 logger = logging.getLogger("RuleManager")
 
@@ -39,6 +43,7 @@ def ppsd_metadata_rule(options, sds_file):
     logger.debug("Computing PPSD metadata for %s." % sds_file.filename)
 
     # Process PPSD
+    from modules.psd2.psd import PSDCollector
     documents = PSDCollector(connect_sql=False).process(sds_file, cache_response=False)
 
     # Save to the database
@@ -68,7 +73,8 @@ def prune_rule(options, sds_file):
 
     Due to the way `SDSFile.prune()` runs `dataselect` as its first step, always sorts
     the records, independently of other options configured. On the other hand, `msrepack`
-    only runs when `repack` is set to True.
+    only runs when `repack` is set to True. With the "obspy" engine, the file is pruned
+    in this process instead, and all records are written again.
 
     Parameters
     ----------
@@ -78,20 +84,29 @@ def prune_rule(options, sds_file):
         - ``repack``: Whether or not to repack records (`bool`)
         - ``repack_record_size``: The new record size if `repack` is `True` (`int`)
         - ``remove_overlap``: Whether or not to remove overlaps (`bool`)
+        - ``engine``: "dataselect" or "obspy" (`str`, default "dataselect")
     sds_file : `SDSFile`
         The file to be processed.
+
+    Returns
+    -------
+    `list` of `SDSFile`
+        The pruned Q file, as a derived item.
     """
 
     logger.debug("Pruning file %s." % sds_file.filename)
 
     # Prune the file to a .Q quality file in the temporary archive
-    sds_file.prune(cut_boundaries=options["cut_boundaries"],
-                   repack=options["repack"],
-                   record_length=options["repack_record_size"],
-                   remove_overlap=options["remove_overlap"])
+    quality_file = sds_file.prune(cut_boundaries=options["cut_boundaries"],
+                                  repack=options["repack"],
+                                  record_length=options["repack_record_size"],
+                                  remove_overlap=options["remove_overlap"],
+                                  engine=options.get("engine", "dataselect"))
 
     logger.debug("Pruned file %s." % sds_file.filename)
 
+    return [quality_file]
+
 
 def ingestion_irods_rule(options, sds_file):
     """Handler for the ingestion rule.
@@ -136,8 +151,15 @@ def ingestion_s3_rule(options, sds_file):
     `ExitPipelineException`
         Raised when upload fails and `exitOnFailure` is `True`.
     """
+    from botocore.exceptions import CredentialRetrievalError
+    from boto3.exceptions import S3UploadFailedError
+
     logger.debug("Ingesting file %s." % sds_file.filename)
 
+    # The file in S3 changes, even if the upload fails
+    current_context().remove("s3_exists")
+    current_context().remove("s3_checksum")
+
     try:
         # Upload file to S3
         s3manager.put(sds_file)
@@ -171,6 +193,7 @@ def delete_s3_rule(options, sds_file):
 
         # Attempt to delete from S3
         s3manager.delete(sds_file)
+        current_context().set("s3_exists", False)
 
         logger.debug("Deleted file %s from S3." % sds_file.filename)
 
@@ -193,7 +216,12 @@ def pid_rule(options, sds_file):
 
     if is_new is None:
         logger.error("Error while assigning PID to file %s." % sds_file.filename)
-    elif is_new:
+        return
+
+    # Share the PID with the following rules
+    current_context().set("pid", pid)
+
+    if is_new:
         logger.info("Assigned PID %s to file %s." % (pid, sds_file.filename))
     elif not is_new:
         logger.info("File %s was already previously assigned PID %s." % (sds_file.filename, pid))
@@ -212,7 +240,7 @@ def add_pid_to_wfcatalog_rule(options, sds_file):
 
     logger.debug("Updating WFCatalog with the PID of file %s." % sds_file.filename)
 
-    pid = irods_session.get_pid(sds_file)
+    pid = current_context().get_or_compute("pid", lambda: irods_session.get_pid(sds_file))
 
     if pid is not None:
         mongo_pool.update_many({"fileId": sds_file.filename},
@@ -309,6 +337,8 @@ def purge_rule(options, sds_file):
         logger.debug("Purged file %s from temporary archive." % sds_file.filename)
     except FileNotFoundError:
         logger.debug("File %s not present in temporary archive." % sds_file.filename)
+    finally:
+        sds_file.invalidate()
 
 
 def dc_metadata_rule(options, sds_file):
@@ -326,7 +356,8 @@ def dc_metadata_rule(options, sds_file):
     logger.debug("Saving Dublin Core metadata for %s." % sds_file.filename)
 
     # Get the existing Dublin Core Object
-    document = extract_dc_metadata(sds_file, irods_session.get_pid(sds_file).upper())
+    pid = current_context().get_or_compute("pid", lambda: irods_session.get_pid(sds_file))
+    document = extract_dc_metadata(sds_file, pid.upper())
 
     # Save to the database
     if document:
@@ -367,6 +398,7 @@ def waveform_metadata_rule(options, sds_file):
     """
 
     # Get waveform metadata
+    from modules.wfcatalog import get_wf_metadata
     (doc_daily, docs_segments) = get_wf_metadata(sds_file)
 
     logger.debug("Saving waveform metadata for %s." % sds_file.filename)
@@ -461,6 +493,7 @@ def quarantine_raw_file_rule(options, sds_file):
         else:
             os.makedirs(dest_dir, exist_ok=True)
             shutil.move(source_path, dest_dir)
+            sds_file.invalidate()
             logger.info("Moved %s to %s/", source_path, dest_dir)
 
         # TODO: Report
@@ -505,6 +538,8 @@ def quarantine_pruned_file_rule(options, sds_file):
         else:
             os.makedirs(dest_dir, exist_ok=True)
             shutil.move(d_file_path, dest_dir)
+            sds_file_registry.get(sds_file.custom_quality_filename("D"),
+                                  sds_file.archive_root).invalidate()
             logger.info("Moved %s to %s/", d_file_path, dest_dir)
 
         # Delete the .Q file
@@ -513,6 +548,7 @@ def quarantine_pruned_file_rule(options, sds_file):
             logger.info("Would remove %s", q_file_path)
         else:
             os.remove(q_file_path)
+            sds_file.invalidate()
             logger.info("Removed %s", q_file_path)
 
         # TODO: Report
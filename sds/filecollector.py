@@ -4,6 +4,160 @@
 import os
 import logging
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+class DirectoryScanner():
+
+    """
+    Class DirectoryScanner
+    Lists a directory tree, concurrently on `workers` threads if more than one,
+    so that the round trips of the listings on a shared filesystem overlap.
+
+    The files are yielded as the listings arrive, or, if `ordered`, in the
+    order of a depth-first walk with the entries sorted by name (the listings
+    are still done concurrently, ahead of the walk).
+    """
+
+    def __init__(self, workers=1, ordered=False):
+
+        self.logger = logging.getLogger("RuleManager")
+        self.workers = workers
+        self.ordered = ordered
+
+    def scan(self, root, accept_directory=None, accept_file=None, file_depth=None, stat=False):
+        """Yields the files under `root`, as (names of the parent directories, `os.DirEntry`).
+
+        Parameters
+        ----------
+        `root` : `str`
+            The directory to scan.
+        `accept_directory` : `callable`
+            Called with the names of the parent directories (under `root`) and the name
+            of a directory, whether to list it (default all).
+        `accept_file` : `callable`
+            Called with the names of the parent directories and the name of a file,
+            whether to yield it (default all).
+        `file_depth` : `int`
+            Only the files at this depth (0 for the files in `root`) are yielded, and no
+            deeper directories are listed (default any depth).
+        `stat` : `bool`
+            Whether to take the stat of the yielded files while listing, so that
+            `DirEntry.stat` does not need another call (default `False`).
+        """
+
+        self._accept_directory = accept_directory or (lambda parents, name: True)
+        self._accept_file = accept_file or (lambda parents, name: True)
+        self._file_depth = file_depth
+        self._stat = stat
+        self._stopped = False
+
+        if self.workers <= 1:
+            return self._scan_serial(root, ())
+
+        return self._scan_parallel(root)
+
+    def _list(self, path, parents, submit=None):
+        """Lists a directory, returning its accepted files and subdirectories. If
+        `submit` is given, the listing of the subdirectories is started with it, and
+        they are returned as (name, future) tuples."""
+
+        # The consumer stopped, skip the listings still queued
+        if self._stopped:
+            return [], []
+
+        try:
+            with os.scandir(path) as iterator:
+                entries = list(iterator)
+        except OSError as e:
+            self.logger.warning("Unable to list directory '%s': '%s'" % (path, str(e)))
+            entries = []
+
+        if self.ordered:
+            entries.sort(key=lambda entry: entry.name)
+
+        depth = len(parents)
+        files = []
+        directories = []
+        for entry in entries:
+
+            if entry.is_dir():
+                if self._file_depth is not None and depth >= self._file_depth:
+                    continue
+                if self._accept_directory(parents, entry.name):
+                    directories.append(entry)
+
+            elif self._file_depth is None or depth == self._file_depth:
+                if self._accept_file(parents, entry.name):
+                    # Cached by the entry
+                    if self._stat:
+                        try:
+                            entry.stat()
+                        except OSError:
+                            continue
+                    files.append(entry)
+
+        if submit is not None:
+            directories = [(entry.name, submit(entry.path, parents + (entry.name,)))
+                           for entry in directories]
+
+        return files, directories
+
+    def _scan_serial(self, path, parents):
+
+        files, directories = self._list(path, parents)
+
+        for entry in files:
+            yield parents, entry
+
+        for entry in directories:
+            yield from self._scan_serial(entry.path, parents + (entry.name,))
+
+    def _scan_parallel(self, root):
+
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+
+        def submit(path, parents):
+            return executor.submit(self._list, path, parents, submit)
+
+        try:
+            if self.ordered:
+                yield from self._walk_ordered(((), submit(root, ())))
+            else:
+                yield from self._walk_unordered(((), submit(root, ())))
+
+        # Also when the consumer stops early
+        finally:
+            self._stopped = True
+            executor.shutdown(wait=True)
+
+    def _walk_ordered(self, listing):
+
+        parents, future = listing
+        files, directories = future.result()
+
+        for entry in files:
+            yield parents, entry
+
+        for name, directory in directories:
+            yield from self._walk_ordered((parents + (name,), directory))
+
+    def _walk_unordered(self, listing):
+
+        pending = {listing[1]: listing[0]}
+        while pending:
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+
+                parents = pending.pop(future)
+                files, directories = future.result()
+
+                for entry in files:
+                    yield parents, entry
+
+                for name, directory in directories:
+                    pending[directory] = parents + (name,)
 
 
 class FileCollector:
@@ -13,7 +167,7 @@ class FileCollector:
     Used for collecting files from a directory
     """
 
-    def __init__(self, archive_dir):
+    def __init__(self, archive_dir, workers=1):
         """Initialize a file collector class."""
 
         # Initialize logger
@@ -22,6 +176,7 @@ class FileCollector:
 
         self._initialized = datetime.now()
         self.archive_dir = archive_dir
+        self.workers = workers
 
         # During initialization collect all files in the archive
         # This may be optimized when required
@@ -33,11 +188,8 @@ class FileCollector:
         collected_files = list()
 
         # Walk over the directory and find all files
-        for subdir, dirs, files in os.walk(self.archive_dir):
-            for file in files:
-                try:
-                    collected_files.append(file)
-                except ValueError:
-                    pass
+        scanner = DirectoryScanner(workers=self.workers)
+        for _, entry in scanner.scan(self.archive_dir):
+            collected_files.append(entry.name)
 
         return collected_files
@@ -0,0 +1,203 @@
+"""
+Reading and writing of lists of collected SDS files, e.g. written by
+`collector.py` and read by `sdsmanager.py --from_file`.
+
+A list is written in one of three formats:
+
+* `names`: the filenames, one per line.
+* `nul`: the absolute paths of the files, each followed by a NUL character
+  (e.g., for `xargs -0`).
+* `jsonl`: JSON lines with the absolute path of every file, and its filename,
+  inode, size, modification time (in s and ns) and change time if they are
+  known, and its checksums if they are cached in the checksum database.
+
+A list can be split into shards by the hash of the streams of the files, so
+that all the files of a stream are in the same shard.
+
+Example
+-------
+
+```
+{"path": "/data/SDS/2019/NL/HGN/BHZ.D/NL.HGN.02.BHZ.D.2019.022", "filename": "NL.HGN.02.BHZ.D.2019.022",
+ "inode": 1234, "size": 4096, "mtime": 1548201600.0, "mtime_ns": 1548201600000000000, "ctime": 1548201600.0,
+ "checksum": 12345678}
+```
+"""
+
+import os
+import json
+import math
+import zlib
+import logging
+
+from core.database import checksum_database
+from sds.fileset import SDSFileSet, FileStat
+
+FORMATS = ("names", "nul", "jsonl")
+
+logger = logging.getLogger("RuleManager")
+
+
+def shard_of(stream, n_shards):
+    """Returns the shard (from 0 to `n_shards` - 1) of the files of a stream
+    (NET.STA.LOC.CHA), the same in every run."""
+
+    return zlib.crc32(stream.encode()) % n_shards
+
+
+def write_file_list(file_sets, list_files, list_format="names"):
+    """Writes the files of one or more sets to a list, or to shards of a list.
+
+    Parameters
+    ----------
+    file_sets
+        An iterable of `SDSFileSet`, e.g. as yielded by `SDSFileCollector.iter_file_sets`.
+    list_files : `list` of file object
+        The open text files to write to, one per shard.
+    list_format : `str`
+        One of `FORMATS`.
+
+    Returns
+    -------
+    n_files : `int`
+        The number of files written.
+    """
+
+    if list_format not in FORMATS:
+        raise ValueError("Unknown file list format '%s'." % list_format)
+
+    n_files = 0
+    shards = dict()
+
+    for file_set in file_sets:
+
+        archive = os.path.abspath(file_set.archive_dir)
+
+        for filename, stream, inode, size, mtime, mtime_ns, ctime in zip(
+                file_set.filenames, file_set.streams.tolist(), *[
+                    getattr(file_set, name).tolist()
+                    for name in ("inode", "size", "mtime", "mtime_ns", "ctime")]):
+
+            # All the files of a stream go to the same shard
+            shard = shards.get(stream)
+            if shard is None:
+                shard = shards[stream] = list_files[shard_of(stream, len(list_files))]
+
+            n_files += 1
+
+            if list_format == "names":
+                shard.write(filename + "\n")
+                continue
+
+            net, sta, _, cha, quality, year, _ = filename.split(".")
+            path = os.path.join(archive, year, net, sta, ".".join([cha, quality]), filename)
+
+            if list_format == "nul":
+                shard.write(path + "\0")
+                continue
+
+            record = {"path": path, "filename": filename}
+            if size >= 0:
+                record["size"] = size
+            if not math.isnan(mtime):
+                record["mtime"] = mtime
+
+            # The checksums are only valid for the complete stat
+            if mtime_ns >= 0:
+                record.update(inode=inode, mtime_ns=mtime_ns, ctime=ctime)
+                checksum, irods_checksum = checksum_database.get(
+                    path, FileStat(inode, size, mtime, mtime_ns, ctime))
+                if checksum is not None:
+                    record["checksum"] = checksum
+                if irods_checksum is not None:
+                    record["irods_checksum"] = irods_checksum
+
+            shard.write(json.dumps(record) + "\n")
+
+    return n_files
+
+
+def read_file_list(list_file, archive_dir):
+    """Reads a list of files written by `write_file_list`, in any format.
+
+    Parameters
+    ----------
+    list_file : file object
+        An open text file with a list of files.
+    archive_dir : `str`
+        The archive of the files of a list of filenames. The archive of the
+        files of a list of paths is the one of the paths.
+
+    Returns
+    -------
+    list_format : `str`
+        The format of the list, one of `FORMATS`.
+    file_set : `SDSFileSet`
+        The files of the list, without a stat (the one in a list may be older than
+        the file). The checksums of a jsonl list are kept in the checksum
+        database, and used while the stat of a file is the one of the list.
+        Entries that are not SDS files, or not valid, are skipped.
+
+    Raises
+    ------
+    `ValueError`
+        Raised if the paths of the list are in different archives.
+    """
+
+    contents = list_file.read()
+
+    if "\0" in contents:
+        list_format = "nul"
+        entries = [path for path in contents.split("\0") if path.strip()]
+    else:
+        entries = [line.strip() for line in contents.splitlines() if line.strip()]
+        list_format = "jsonl" if entries and entries[0].startswith("{") else "names"
+
+    archives = set()
+    rows = []
+
+    for entry in entries:
+
+        try:
+            if list_format == "names":
+                rows.append(SDSFileSet.row(entry))
+                continue
+
+            record = json.loads(entry) if list_format == "jsonl" else {"path": entry}
+
+            # The stat in the list may be older than the file, and is taken again
+            archive, filename = _split_path(record["path"])
+            rows.append(SDSFileSet.row(filename))
+            archives.add(archive)
+
+            # The checksums are used while the file has the stat of the list
+            if all(key in record for key in ("inode", "size", "mtime_ns", "checksum")):
+                checksum_database.add_listed(
+                    os.path.abspath(record["path"]), record["inode"], record["size"],
+                    record["mtime_ns"], record["checksum"], record.get("irods_checksum"))
+
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.debug("Skipping entry '%s' of the file list: '%s'" % (entry, str(e)))
+
+    if len(archives) > 1:
+        raise ValueError("The files of the list are in %d different archives." % len(archives))
+    if archives:
+        archive_dir = archives.pop()
+
+    return list_format, SDSFileSet.from_rows(archive_dir, rows)
+
+
+def _split_path(path):
+    """Returns the archive and the filename of the path of an SDS file, or raises
+    a ValueError if the file is not in its directory of the archive."""
+
+    directory, filename = os.path.split(path)
+    net, sta, _, cha, quality, year, _ = filename.split(".")
+
+    sub_directory = (year, net, sta, ".".join([cha, quality]))
+    for name in reversed(sub_directory):
+        directory, parent = os.path.split(directory)
+        if parent != name:
+            raise ValueError("Not in the directory of the file.")
+
+    return directory, filename
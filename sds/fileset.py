@@ -0,0 +1,256 @@
+"""
+This module keeps the files collected from an SDS archive in columns (NumPy
+arrays) rather than as a list of SDSFile objects, so that millions of files
+take little memory and are filtered and sorted with vectorized operations.
+
+The SDSFile objects are only created when the set is iterated (e.g., by the
+rule manager), a chunk of files at a time, with the stat taken while collecting
+them.
+
+Example
+-------
+
+```
+from sds.fileset import SDSFileSet
+...
+file_set = SDSFileSet.from_rows(archive_dir, [SDSFileSet.row(filename) for filename in filenames])
+file_set = file_set.select(file_set.ordinal >= date(2020, 1, 1).toordinal()).sorted()
+for sds_file in file_set:
+    ...
+```
+"""
+
+import math
+from collections import namedtuple
+
+import numpy as np
+
+from sds.sdsfile import SDSFile, sds_file_registry
+
+
+class FileStat(namedtuple("FileStat", ["st_ino", "st_size", "st_mtime", "st_mtime_ns", "st_ctime"])):
+
+    """
+    Class FileStat
+    The fields of a stat snapshot (`os.stat_result`) used by the SDSFiles and the
+    caches, as kept in the columns of an SDSFileSet.
+    """
+
+    __slots__ = ()
+
+
+class SDSFileSet():
+
+    """
+    Class SDSFileSet
+    An immutable set of files of an SDS archive, as columns: the filename, the
+    codes of the stream, the day of the file (as a proleptic Gregorian ordinal),
+    and the inode, size, modification time (in s and ns) and change time of the
+    file. Unknown numbers are -1, unknown times are NaN, and the stat is only
+    given to the SDSFiles if it is known (the modification time in ns is not -1).
+
+    The columns are attributes of the set, and `select` and `sorted` return new
+    sets. Iterating the set, or indexing it with an `int`, returns SDSFiles.
+    """
+
+    COLUMNS = ("filename", "net", "sta", "loc", "cha", "quality", "ordinal",
+               "inode", "size", "mtime", "mtime_ns", "ctime")
+
+    DTYPES = (str, str, str, str, str, str, np.int32,
+              np.int64, np.int64, np.float64, np.int64, np.float64)
+
+    # Number of SDSFiles created (and kept alive) together while iterating
+    CHUNK_SIZE = 1024
+
+    def __init__(self, archive_dir, columns=None):
+        """Creates a set from a `dict` of columns (default empty)."""
+
+        self.archive_dir = archive_dir
+
+        if columns is None:
+            columns = {name: np.array([], dtype=dtype) for name, dtype in zip(self.COLUMNS,
+                                                                             self.DTYPES)}
+
+        for name in self.COLUMNS:
+            setattr(self, name, columns[name])
+
+        # The order of the days, sorted on the first query, or the order of the set
+        # it was selected from and the selection
+        self._days = None
+        self._parent_days = None
+
+    @staticmethod
+    def row(filename, inode=-1, size=-1, mtime=math.nan, mtime_ns=-1, ctime=math.nan):
+        """Returns the row of a file, as taken by `from_rows`.
+
+        Raises
+        ------
+        `ValueError`
+            Raised if `filename` is not a valid SDS filename.
+        """
+
+        net, sta, loc, cha, quality, _, _, ordinal = SDSFile.parse_filename(filename)
+
+        return (filename, net, sta, loc, cha, quality, ordinal,
+                inode, size, mtime, mtime_ns, ctime)
+
+    @classmethod
+    def stat_row(cls, filename, stat):
+        """Returns the row of a file with its stat snapshot (`os.stat_result`)."""
+
+        return cls.row(filename, stat.st_ino, stat.st_size, stat.st_mtime, stat.st_mtime_ns,
+                       stat.st_ctime)
+
+    @classmethod
+    def from_rows(cls, archive_dir, rows):
+        """Creates a set from a list of rows (see `row`)."""
+
+        if len(rows) == 0:
+            return cls(archive_dir)
+
+        return cls(archive_dir, {name: np.array(column, dtype=dtype)
+                                 for name, dtype, column in zip(cls.COLUMNS, cls.DTYPES,
+                                                                zip(*rows))})
+
+    @classmethod
+    def concatenate(cls, archive_dir, file_sets):
+        """Creates a set with the files of several sets, in order."""
+
+        file_sets = [file_set for file_set in file_sets if len(file_set) > 0]
+        if len(file_sets) == 0:
+            return cls(archive_dir)
+
+        return cls(archive_dir, {name: np.concatenate([getattr(file_set, name)
+                                                       for file_set in file_sets])
+                                 for name in cls.COLUMNS})
+
+    def __len__(self):
+        return len(self.filename)
+
+    def __getitem__(self, index):
+
+        if isinstance(index, (int, np.integer)):
+            return self._materialize(slice(index, index + 1 if index != -1 else None))[0]
+
+        return self.select(index)
+
+    def __iter__(self):
+
+        # Files in use together, e.g., for the bulk queries of their locations
+        for start in range(0, len(self), self.CHUNK_SIZE):
+            yield from self._materialize(slice(start, start + self.CHUNK_SIZE))
+
+    def _materialize(self, index):
+        """Returns the SDSFiles of the files in a slice."""
+
+        sds_files = []
+        for filename, inode, size, mtime, mtime_ns, ctime in zip(*[
+                getattr(self, name)[index].tolist()
+                for name in ("filename", "inode", "size", "mtime", "mtime_ns", "ctime")]):
+
+            sds_file = sds_file_registry.get(filename, self.archive_dir)
+
+            # The stat was taken while collecting the file
+            if mtime_ns >= 0:
+                sds_file.set_stats(FileStat(inode, size, mtime, mtime_ns, ctime))
+
+            sds_files.append(sds_file)
+
+        return sds_files
+
+    def select(self, index):
+        """Returns a set with the files selected by a boolean mask, an array of
+        indices, or a slice."""
+
+        # The set itself if all the files are selected, in order
+        if isinstance(index, np.ndarray) and len(index) == len(self) and (
+                index.all() if index.dtype == bool else np.all(index[1:] > index[:-1])):
+            return self
+
+        file_set = self.__class__(self.archive_dir, {name: getattr(self, name)[index]
+                                                     for name in self.COLUMNS})
+
+        # The days stay sorted through the selections of the collector
+        if self._days is not None or self._parent_days is not None:
+            file_set._parent_days = (self._sorted_days()[0], index, len(self))
+
+        return file_set
+
+    def sorted(self, reverse=False):
+        """Returns a set with the files sorted by filename."""
+
+        order = np.argsort(self.filename, kind="mergesort")
+        if reverse:
+            order = order[::-1]
+
+        return self.select(order)
+
+    def between(self, column, low, high):
+        """Returns the indices (in order) of the files whose value in a column (e.g.,
+        the day ordinal or the modification time) is in [`low`, `high`), so that
+        selecting them only copies those files.
+
+        The days are sorted on the first query (in linear time), and the sets
+        selected from this one take their order from it, so that every range of
+        days is two bisects. The other columns are compared."""
+
+        if column != "ordinal":
+            values = getattr(self, column)
+            return np.flatnonzero((values >= low) & (values < high))
+
+        order, days = self._sorted_days()
+
+        # Bounds in the type of the column, which is not converted then
+        bounds = np.array([low, high], dtype=days.dtype)
+        start, stop = np.searchsorted(days, bounds)
+        return np.sort(order[start:stop])
+
+    def _sorted_days(self):
+        """Returns the order of the days of the files, and the sorted days."""
+
+        if self._days is not None:
+            return self._days
+
+        if self._parent_days is not None:
+
+            # The files of the parent order that were selected, at their new index
+            parent_order, index, n_parent = self._parent_days
+            positions = np.full(n_parent, -1, dtype=np.int64)
+            positions[index] = np.arange(len(self))
+            order = positions[parent_order]
+            order = order[order >= 0]
+
+        elif len(self) > 0 and int(self.ordinal.max()) - int(self.ordinal.min()) < 2 ** 16:
+
+            # A stable sort of 16-bit integers is a radix sort
+            order = np.argsort((self.ordinal - self.ordinal.min()).astype(np.uint16),
+                               kind="mergesort")
+
+        else:
+            order = np.argsort(self.ordinal, kind="mergesort")
+
+        self._days = (order, self.ordinal[order])
+        self._parent_days = None
+
+        return self._days
+
+    def match(self, function):
+        """Returns the boolean mask of the files whose filename passes a function."""
+
+        return np.fromiter((function(filename) for filename in self.filename.tolist()),
+                           dtype=bool, count=len(self))
+
+    @property
+    def filenames(self):
+        """The filenames, as a `list`."""
+        return self.filename.tolist()
+
+    @property
+    def streams(self):
+        """The stream (NET.STA.LOC.CHA) of every file."""
+
+        streams = self.net
+        for column in (self.sta, self.loc, self.cha):
+            streams = np.char.add(np.char.add(streams, "."), column)
+
+        return streams
@@ -0,0 +1,231 @@
+"""
+This module caches the station metadata (inventory) used by the rules, so that
+FDSNWS is queried once per station rather than once per file.
+
+The inventory of a station is fetched with all its channels and epochs, at
+response level, and kept in memory (for the `INVENTORY_CACHE_SIZE` most recently
+used stations) and in the `INVENTORY_DB` database. After `INVENTORY_TTL`
+seconds, it is revalidated with a conditional request, so that FDSNWS only
+sends it again if it changed. The inventory of a file is selected from it, and
+shared by all the files of the same channel epoch.
+
+Example
+-------
+
+```
+from sds.inventory import inventory_cache
+...
+inventory = inventory_cache.get(sds_file)
+```
+"""
+
+import io
+import os
+import time
+import logging
+import threading
+
+from collections import OrderedDict
+
+from configuration import config
+from core.database import inventory_database
+
+
+class InventoryCache():
+
+    """
+    Class InventoryCache
+    Keeps the inventories of the most recently used `max_size` stations in memory,
+    backed by the inventory database, and revalidates them after `ttl` seconds.
+
+    It is safe to use from several threads, and a forked process starts with an
+    empty cache (the database is still shared).
+    """
+
+    # Shared by all the caches
+    logger = logging.getLogger("RuleManager")
+
+    def __init__(self, fdsnws, max_size, ttl):
+
+        self.fdsnws = fdsnws
+        self.max_size = max_size
+        self.ttl = ttl
+        self._reset()
+
+        # A child process must not inherit the lock, or the state cached by the parent
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+
+        self._lock = threading.Lock()
+
+        # (network, station) -> station entry
+        self._stations = OrderedDict()
+
+    def get(self, sds_file):
+        """Returns the inventory of the channel of a file on its day, at response
+        level, or `None` if FDSNWS has no metadata for it.
+
+        Raises
+        ------
+        `TimeoutError`
+            Raised if the rule timeout goes off while fetching the inventory.
+        """
+
+        entry = self._get_station(sds_file.net, sds_file.sta)
+        if entry["inventory"] is None:
+            return None
+
+        from obspy import UTCDateTime
+
+        starttime = UTCDateTime(sds_file.start)
+        endtime = UTCDateTime(sds_file.end)
+
+        # The channel epochs in the day identify the inventory of the file
+        epochs = tuple((str(channel.start_date), str(channel.end_date))
+                       for network in entry["inventory"]
+                       for station in network
+                       for channel in station
+                       if channel.location_code == sds_file.loc
+                       and channel.code == sds_file.cha
+                       and channel.is_active(starttime=starttime, endtime=endtime))
+        if len(epochs) == 0:
+            return None
+
+        key = (sds_file.loc, sds_file.cha, epochs)
+        with self._lock:
+            inventory = entry["epochs"].get(key)
+        if inventory is not None:
+            return inventory
+
+        # Same selection as the query of FDSNWS for the channel and day
+        inventory = entry["inventory"].select(location=sds_file.loc,
+                                              channel=sds_file.cha,
+                                              starttime=starttime,
+                                              endtime=endtime)
+        with self._lock:
+            entry["epochs"][key] = inventory
+
+        return inventory
+
+    def _get_station(self, network, station):
+        """Returns the entry of a station, from memory, from the database or from
+        FDSNWS, revalidated if it is older than the TTL."""
+
+        key = (network, station)
+
+        with self._lock:
+            entry = self._stations.get(key)
+            if entry is not None:
+                self._stations.move_to_end(key)
+
+        # Not in memory, try the database
+        if entry is None:
+            row = inventory_database.get(network, station)
+            if row is not None:
+                entry = self._new_entry(row["fetched"], row["etag"], row["last_modified"],
+                                        self._parse(row["stationxml"]))
+
+        # Missing or expired, fetch it (conditionally, if there is a copy)
+        if entry is None or time.time() - entry["fetched"] > self.ttl:
+            entry = self._fetch(network, station, entry)
+
+        with self._lock:
+            self._stations[key] = entry
+            self._stations.move_to_end(key)
+            if len(self._stations) > self.max_size:
+                self._stations.popitem(last=False)
+
+        return entry
+
+    def _fetch(self, network, station, entry):
+        """Fetches the inventory of a station from FDSNWS. If `entry` is given, it is
+        only sent again if it changed, and kept if FDSNWS cannot be reached."""
+
+        import requests
+
+        headers = dict()
+        if entry is not None and entry["etag"] is not None:
+            headers["If-None-Match"] = entry["etag"]
+        if entry is not None and entry["last_modified"] is not None:
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+        params = {
+            "network": network,
+            "station": station,
+            "level": "response",
+            "format": "fdsnxml"
+        }
+
+        try:
+            response = requests.get(self.fdsnws, params=params, headers=headers)
+            fetched = time.time()
+
+            # Not changed since the copy was fetched
+            if response.status_code == 304 and entry is not None:
+                self.logger.debug("Revalidated inventory of %s.%s" % (network, station))
+                inventory_database.touch(network, station, fetched)
+                return self._new_entry(fetched, entry["etag"], entry["last_modified"],
+                                       entry["inventory"], entry["epochs"])
+
+            # No metadata for the station, not stored
+            if response.status_code in (204, 404):
+                return self._new_entry(fetched, None, None, None)
+
+            response.raise_for_status()
+            inventory = self._parse(response.content)
+
+        # Re-raise in case this is the Rule Manager timeout going off
+        except TimeoutError:
+            raise
+
+        # Keep using the copy if there is one
+        except Exception as e:
+            if entry is not None and entry["inventory"] is not None:
+                self.logger.warning("Unable to revalidate inventory of %s.%s (%s), using the "
+                                    "cached copy." % (network, station, str(e)))
+                return entry
+            self.logger.debug("Unable to fetch inventory of %s.%s (%s)."
+                              % (network, station, str(e)))
+
+            # Expired already, to try again for the next file
+            return self._new_entry(0, None, None, None)
+
+        self.logger.debug("Fetched inventory of %s.%s" % (network, station))
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        inventory_database.put(network, station, fetched, etag, last_modified, response.content)
+
+        return self._new_entry(fetched, etag, last_modified, inventory)
+
+    @staticmethod
+    def _parse(stationxml):
+
+        # ObsPy is slow to import, and most runs never need it here
+        from obspy import read_inventory
+
+        return read_inventory(io.BytesIO(stationxml), format="STATIONXML")
+
+    @staticmethod
+    def _new_entry(fetched, etag, last_modified, inventory, epochs=None):
+
+        return {
+            "fetched": fetched,
+            "etag": etag,
+            "last_modified": last_modified,
+            "inventory": inventory,
+            # (location, channel, channel epochs) -> selected inventory
+            "epochs": epochs if epochs is not None else dict()
+        }
+
+    def clear(self):
+        """Forgets all the stations kept in memory."""
+
+        with self._lock:
+            self._stations.clear()
+
+
+inventory_cache = InventoryCache(config["FDSNWS_ADDRESS"],
+                                 config.get("INVENTORY_CACHE_SIZE", 64),
+                                 config.get("INVENTORY_TTL", 86400))
@@ -0,0 +1,271 @@
+"""
+This module resolves the coordinates of the streams of the SDS files (e.g., for
+the Dublin Core metadata), so that FDSNWS is not queried once per file.
+
+The coordinates of all the epochs of a stream are fetched from the text output
+of FDSNWS, at channel level. When a stream is missing, the missing streams of
+all the files of the run (given with `add_streams` before the run) are fetched
+together, in bulk (POST) queries of `LOCATION_BATCH_SIZE` streams over one HTTP
+session. The epochs are kept in memory and in the `LOCATION_DB` database, and
+fetched again after `LOCATION_TTL` seconds. Streams that could not be fetched
+are tried again after `LOCATION_RETRY_TTL` seconds.
+
+Example
+-------
+
+```
+from sds.location import location_resolver
+...
+location_resolver.add_streams(file_set.streams.tolist())
+...
+location = location_resolver.get(sds_file)
+```
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+
+from configuration import config
+from core.database import location_database
+
+
+class LocationResolver():
+
+    """
+    Class LocationResolver
+    Resolves the coordinates of a stream on a day, from the epochs of the streams
+    fetched in bulk from FDSNWS, cached in memory and in the location database.
+
+    It is safe to use from several threads, and a forked process starts with an
+    empty cache (the database is still shared).
+    """
+
+    # Shared by all the resolvers
+    logger = logging.getLogger("RuleManager")
+
+    def __init__(self, fdsnws, batch_size, ttl, retry_ttl=600):
+
+        self.fdsnws = fdsnws
+        self.batch_size = batch_size
+        self.ttl = ttl
+        self.retry_ttl = retry_ttl
+
+        # The streams of the files of the run
+        self._run_streams = set()
+
+        self._reset()
+
+        # A child process must not inherit the lock, the session, or the state cached by the parent
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+
+        self._lock = threading.Lock()
+        self._session = None
+
+        # stream -> (fetch time, list of epochs)
+        self._streams = dict()
+
+    @property
+    def session(self):
+        """The HTTP session, with its pooled connections, created on first use."""
+
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+
+        return self._session
+
+    def get(self, sds_file):
+        """Returns the coordinates of the stream of a file on its day, as a `dict` with
+        the ``longitude``, ``latitude`` and ``elevation``, or `None` if FDSNWS has no
+        epoch, or more than one epoch, of the stream on that day.
+
+        Raises
+        ------
+        `TimeoutError`
+            Raised if the rule timeout goes off while fetching the coordinates.
+        """
+
+        stream = self._stream(sds_file)
+
+        with self._lock:
+            cached = self._streams.get(stream)
+
+        # Fetch the streams of all the files of the run at once
+        if cached is None or time.time() - cached[0] > self.ttl:
+            self._prefetch(self._run_streams | {stream})
+            with self._lock:
+                cached = self._streams.get(stream)
+            if cached is None:
+                return None
+
+        # The epochs that overlap with the day
+        start = sds_file.start
+        end = sds_file.end
+        epochs = [epoch for epoch in cached[1]
+                  if epoch["start"] <= end and (epoch["end"] is None or epoch["end"] >= start)]
+
+        # Multiple epochs means that the location is somehow ambiguous
+        if len(epochs) != 1:
+            return None
+
+        return {
+            "longitude": epochs[0]["longitude"],
+            "latitude": epochs[0]["latitude"],
+            "elevation": epochs[0]["elevation"]
+        }
+
+    def add_streams(self, streams):
+        """Adds streams (NET.STA.LOC.CHA) of the files of the run, e.g. the `streams`
+        of the collected `SDSFileSet`. They are fetched with the first missing stream."""
+
+        self._run_streams.update(streams)
+
+    def prefetch(self, sds_files):
+        """Makes the epochs of the streams of the given files available, from the
+        database or from FDSNWS, unless they are in memory already."""
+
+        self._prefetch({self._stream(sds_file) for sds_file in sds_files})
+
+    def _prefetch(self, streams):
+
+        now = time.time()
+
+        with self._lock:
+            missing = {stream for stream in streams
+                       if stream not in self._streams
+                       or now - self._streams[stream][0] > self.ttl}
+        if not missing:
+            return
+
+        # Stored in the database
+        stored = {stream: (fetched, json.loads(epochs, object_hook=self._parse_epoch))
+                  for stream, (fetched, epochs) in location_database.get(missing).items()
+                  if now - fetched <= self.ttl}
+        with self._lock:
+            self._streams.update(stored)
+        missing = sorted(missing - set(stored))
+
+        # Fetched from FDSNWS in batches
+        for i in range(0, len(missing), self.batch_size):
+            batch = missing[i:i + self.batch_size]
+            fetched = self._fetch(batch)
+
+            # Not tried again before the retry TTL, and not stored
+            if fetched is None:
+                expired = time.time() - self.ttl + self.retry_ttl
+                with self._lock:
+                    self._streams.update({stream: (expired, []) for stream in batch})
+                continue
+
+            with self._lock:
+                self._streams.update(fetched)
+            location_database.put([(stream, fetched_time, json.dumps(list(map(self._dump_epoch,
+                                                                                epochs))))
+                                   for stream, (fetched_time, epochs) in fetched.items()])
+
+    def _fetch(self, streams):
+        """Fetches the epochs of the given streams from FDSNWS, in one bulk query.
+        Returns them as a `dict`, or `None` if they could not be fetched."""
+
+        import requests
+
+        lines = ["level=channel", "format=text"]
+        for stream in streams:
+            network, station, location, channel = stream.split(".")
+            lines.append("%s %s %s %s * *" % (network, station, location or "--", channel))
+
+        try:
+            request = self.session.post(self.fdsnws, data="\n".join(lines) + "\n")
+            fetched = time.time()
+
+            # No metadata for any of the streams
+            if request.status_code in (204, 404):
+                return {stream: (fetched, []) for stream in streams}
+
+            request.raise_for_status()
+
+        # Re-raise in case this is the Rule Manager timeout going off
+        except TimeoutError:
+            raise
+
+        # Any error just ignore, the streams are fetched again after the retry TTL
+        except requests.exceptions.RequestException as e:
+            self.logger.warning("Unable to fetch the locations of %d streams (%s)."
+                                % (len(streams), str(e)))
+            return None
+
+        self.logger.debug("Fetched the locations of %d streams" % len(streams))
+
+        # Streams not in the output have no metadata
+        epochs = {stream: (fetched, []) for stream in streams}
+        for line in request.text.split("\n"):
+
+            # Skip the header and empty lines
+            if line.startswith("#") or not line.strip():
+                continue
+
+            fields = line.split("|")
+            if len(fields) < 17:
+                continue
+
+            # Empty location codes may be written as "--"
+            if fields[2] == "--":
+                fields[2] = ""
+
+            stream = ".".join(fields[0:4])
+            if stream not in epochs:
+                continue
+
+            # Fields 4, 5, 6 are the coordinates, 15 and 16 the epoch
+            epochs[stream][1].append({
+                "latitude": float(fields[4]),
+                "longitude": float(fields[5]),
+                "elevation": float(fields[6]),
+                "start": self._parse_time(fields[15]),
+                "end": self._parse_time(fields[16]) if fields[16].strip() else None
+            })
+
+        return epochs
+
+    @staticmethod
+    def _stream(sds_file):
+        return ".".join([sds_file.net, sds_file.sta, sds_file.loc, sds_file.cha])
+
+    @staticmethod
+    def _parse_time(value):
+
+        import dateutil.parser
+
+        # All times are UTC, compared with the naive times of the files
+        return dateutil.parser.isoparse(value.strip()).replace(tzinfo=None)
+
+    @staticmethod
+    def _dump_epoch(epoch):
+
+        return dict(epoch, start=epoch["start"].isoformat(),
+                    end=epoch["end"].isoformat() if epoch["end"] is not None else None)
+
+    @classmethod
+    def _parse_epoch(cls, epoch):
+
+        epoch["start"] = cls._parse_time(epoch["start"])
+        epoch["end"] = cls._parse_time(epoch["end"]) if epoch["end"] is not None else None
+        return epoch
+
+    def clear(self):
+        """Forgets all the streams kept in memory."""
+
+        with self._lock:
+            self._streams.clear()
+
+
+location_resolver = LocationResolver(config["FDSNWS_ADDRESS"],
+                                     config.get("LOCATION_BATCH_SIZE", 500),
+                                     config.get("LOCATION_TTL", 604800),
+                                     config.get("LOCATION_RETRY_TTL", 600))
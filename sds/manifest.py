@@ -0,0 +1,249 @@
+"""
+This module keeps a manifest of the files of SDS archives in the `MANIFEST_DB`
+database, so that the collectors do not list the whole archive in every run.
+
+A refresh only lists the directories whose modification time changed since the
+previous refresh (i.e., where files were added, removed or renamed), and takes
+the stat of the files modified in the last `MANIFEST_RESTAT_DAYS` days again, as
+those may still be written to. The files of the archive are then selected with
+SQL queries on the manifest.
+
+Example
+-------
+
+```
+from sds.manifest import archive_manifest
+...
+archive_manifest.refresh(archive_dir)
+rows = archive_manifest.query(archive_dir, [("filename GLOB ?", ["NL.*"], None)])
+```
+"""
+
+import os
+import time
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+
+from configuration import config
+from core.database import manifest_database
+
+
+class ArchiveManifest():
+
+    """
+    Class ArchiveManifest
+    Refreshes and queries the manifest of the files of SDS archives
+    (YEAR/NET/STA/CHA.QUALITY/file), stored in the manifest database.
+    """
+
+    # Shared by all the manifests
+    logger = logging.getLogger("RuleManager")
+
+    # Depth of the files in the archive
+    FILE_DEPTH = 4
+
+    # Directories modified this recently may still change within the same timestamp
+    MTIME_MARGIN = 2
+
+    def __init__(self, restat_age):
+
+        self.restat_age = restat_age
+
+    @property
+    def enabled(self):
+        return manifest_database.enabled
+
+    def refresh(self, archive_dir, workers=1, full=False, accept_directory=None):
+        """Updates the manifest of an archive, listing only the directories that
+        changed (all of them if `full`), on `workers` threads. If given,
+        `accept_directory` is called with the names of the parent directories (under
+        the archive) and the name of a directory, and the directories it rejects are
+        not refreshed.
+
+        Returns the paths of the refreshed channel directories (where the files are)."""
+
+        archive = os.path.abspath(archive_dir)
+        start = time.time()
+
+        stored = manifest_database.get_directories(archive)
+        recent = manifest_database.get_recent_files(archive, start - self.restat_age)
+
+        # The known subdirectories of every directory
+        children = dict()
+        for path in stored:
+            if path != "":
+                children.setdefault(os.path.dirname(path), []).append(path)
+
+        accept_directory = accept_directory or (lambda parents, name: True)
+
+        executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+        map_function = executor.map if executor is not None else map
+
+        directories = []
+        removed_directories = set()
+        files = []
+        removed_files = []
+        n_listed = 0
+        channels = []
+
+        try:
+            level = [""]
+            for depth in range(self.FILE_DEPTH + 1):
+
+                # The stat of the directories, to find the ones that changed
+                stats = list(map_function(lambda path: self._stat(os.path.join(archive, path)),
+                                          level))
+
+                listings = []
+                for path, stat in zip(level, stats):
+
+                    if stat is None:
+                        removed_directories.add(path)
+                        continue
+
+                    # Directories that still change keep an unknown modification time
+                    mtime_ns = stat.st_mtime_ns
+                    if stat.st_mtime > start - self.MTIME_MARGIN:
+                        mtime_ns = None
+
+                    if full or stored.get(path) != stat.st_mtime_ns or mtime_ns is None:
+                        listings.append(path)
+                        directories.append((path, mtime_ns))
+
+                # Only the changed directories are listed again
+                n_listed += len(listings)
+                results = dict(zip(listings, map_function(
+                    lambda path: self._list(archive, path, depth), listings)))
+
+                next_level = []
+                for path in level:
+
+                    if path in results:
+                        subdirectories, listed_files = results[path]
+
+                        # Gone since the previous refresh
+                        known = set(children.get(path, []))
+                        removed_directories.update(known - set(subdirectories))
+                        if depth == self.FILE_DEPTH:
+                            removed_files.extend(set(manifest_database.get_files(archive, path))
+                                                 - set(row[0] for row in listed_files))
+
+                        files.extend(listed_files)
+
+                    elif path not in removed_directories:
+                        subdirectories = children.get(path, [])
+
+                        # Files that may still be written to
+                        if depth == self.FILE_DEPTH and path in recent:
+                            restat = self._restat(archive, path, recent[path])
+                            files.extend(restat[0])
+                            removed_files.extend(restat[1])
+
+                    else:
+                        continue
+
+                    parents = tuple(path.split(os.sep)) if path else ()
+                    for subdirectory in subdirectories:
+                        if accept_directory(parents, os.path.basename(subdirectory)):
+                            next_level.append(subdirectory)
+
+                        # The rejected directories are left as they are, new ones are
+                        # listed when they are first accepted
+                        elif subdirectory not in stored:
+                            directories.append((subdirectory, None))
+
+                if depth == self.FILE_DEPTH:
+                    channels = [path for path in level if path not in removed_directories]
+
+                level = next_level if depth < self.FILE_DEPTH else []
+
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        manifest_database.update(archive, directories, removed_directories, files, removed_files)
+
+        self.logger.debug("Refreshed manifest of '%s' in %.1f s: listed %d directories, "
+                          "updated %d files, removed %d files."
+                          % (archive, time.time() - start, n_listed, len(files),
+                             len(removed_files)))
+
+        return channels
+
+    @staticmethod
+    def _stat(path):
+
+        try:
+            return os.stat(path)
+        except FileNotFoundError:
+            return None
+
+    def _list(self, archive, path, depth):
+        """Lists a directory, returning the paths of its subdirectories, and the rows
+        of its files if it is a channel directory."""
+
+        subdirectories = []
+        files = []
+
+        try:
+            with os.scandir(os.path.join(archive, path)) as entries:
+                entries = list(entries)
+        except OSError as e:
+            self.logger.warning("Unable to list directory '%s': '%s'" % (path, str(e)))
+            return subdirectories, files
+
+        for entry in entries:
+
+            if depth < self.FILE_DEPTH:
+                if entry.is_dir():
+                    subdirectories.append(os.path.join(path, entry.name))
+                continue
+
+            if not entry.is_file():
+                continue
+
+            try:
+                files.append(self._row(path, entry.name, entry.stat()))
+            except (ValueError, OSError) as e:
+                self.logger.debug("Skipping file '%s' in '%s': '%s'" % (entry.name, path, str(e)))
+
+        return subdirectories, files
+
+    def _restat(self, archive, path, filenames):
+        """Takes the stat of known files again, returning their rows and the
+        filenames of the ones that are gone."""
+
+        files = []
+        removed = []
+        for filename in filenames:
+            stat = self._stat(os.path.join(archive, path, filename))
+            if stat is None:
+                removed.append(filename)
+            else:
+                files.append(self._row(path, filename, stat))
+
+        return files, removed
+
+    @staticmethod
+    def _row(path, filename, stat):
+
+        from sds.sdsfile import SDSFile
+
+        # Raises a ValueError if it is not an SDS file
+        sds_file = SDSFile(filename, "")
+        if sds_file.sub_directory != path:
+            raise ValueError("Not in the directory of the file.")
+
+        return (filename, path, sds_file.id, sds_file.start.toordinal(), stat.st_size,
+                stat.st_mtime, stat.st_ino)
+
+    def query(self, archive_dir, clauses, ordered=False):
+        """Returns the (filename, inode, size, modification time) of the files of an
+        archive that match all the (SQL condition, parameters, values) clauses, see
+        `ManifestDatabase.query`."""
+
+        return manifest_database.query(os.path.abspath(archive_dir), clauses, ordered=ordered)
+
+
+archive_manifest = ArchiveManifest(config.get("MANIFEST_RESTAT_DAYS", 2) * 86400)
@@ -1,9 +1,49 @@
+"""
+This module reads the station metadata from a local directory of StationXML
+files, as an alternative to FDSNWS for the inventory and the location of the
+SDS files (`METADATA_BACKEND` set to "stationxml").
+
+The files in `STATIONXML_DIRECTORY` are stream-parsed once per run, and their
+channel epochs are indexed per stream (network, station, location, channel) and
+start time. The inventories are read from the file of the matching epochs, for
+the `INVENTORY_CACHE_SIZE` most recently used files.
+
+Example
+-------
+
+```
+from sds.metadatafile import metadata_index
+...
+location = metadata_index.location(sds_file)
+inventory = metadata_index.inventory(sds_file)
+```
+"""
+
+import os
+import time
+import logging
+import threading
 import xml.etree.ElementTree as ET
+
+from bisect import bisect_right
+from collections import OrderedDict
+from datetime import timezone
 from hashlib import sha256
+
 import dateutil.parser
 
+from configuration import config
+from core.database import metadata_change_database
+
 
 class FDSNXMLFile():
+
+    """
+    Class FDSNXMLFile
+    The channel epochs of a StationXML file, with their coordinates, sample rate,
+    and the hash of their XML.
+    """
+
     NAMESPACE = "http://www.fdsn.org/xml/station/1"
 
     def __init__(self, filepath):
@@ -17,53 +57,361 @@ class FDSNXMLFile():
         self.parse_channels()
 
     def parse_channels(self):
+        """def FDSNXMLFile::parse_channels Extracts the channels from the file,
+        parsing it incrementally so that only one channel is in memory at a time."""
+
+        network_code = None
+        station_code = None
+
+        for event, element in ET.iterparse(self.filepath, events=("start", "end")):
+
+            tag = self._tag(element)
+
+            if event == "start":
+                if tag == "Network":
+                    network_code = element.get("code")
+                elif tag == "Station":
+                    station_code = element.get("code")
+                continue
+
+            if tag == "Channel":
+                self.channels.append(self.parse_channel(network_code, station_code, element))
+                element.clear()
+
+            # The channels of the station are not needed anymore
+            elif tag in ("Station", "Network"):
+                element.clear()
+
+    def parse_channel(self, network_code, station_code, channel):
+        """def FDSNXMLFile::parse_channel Returns the channel epoch of a Channel
+        element."""
+
+        channel_end = channel.get("endDate")
+
+        # End may be none
+        if channel_end is not None:
+            channel_end = self._parse_time(channel_end)
+
+        # Get the hash of the XML string per channel, and of its response
+        # The XML should be canonicalized
+        channel_hash = sha256(ET.tostring(channel)).hexdigest()
+        response = self._find(channel, "Response")
+        response_hash = sha256(ET.tostring(response)).hexdigest() if response is not None else None
+
+        return {
+            "net": network_code,
+            "sta": station_code,
+            "loc": channel.get("locationCode", ""),
+            "cha": channel.get("code"),
+            "start": self._parse_time(channel.get("startDate")),
+            "end": channel_end,
+            "lat": self._find_float(channel, "Latitude"),
+            "lng": self._find_float(channel, "Longitude"),
+            "elev": self._find_float(channel, "Elevation"),
+            "rate": self._find_float(channel, "SampleRate"),
+            "hash": channel_hash,
+            "response_hash": response_hash,
+            "file": self.filepath
+        }
+
+    @staticmethod
+    def _tag(element):
+
+        # Any version of the schema
+        return element.tag.rpartition("}")[2]
+
+    @classmethod
+    def _find(cls, element, tag):
+
+        for child in element:
+            if cls._tag(child) == tag:
+                return child
+
+        return None
+
+    @classmethod
+    def _find_float(cls, element, tag):
+
+        child = cls._find(element, tag)
+        return float(child.text) if child is not None else None
+
+    @staticmethod
+    def _parse_time(value):
+
+        time = dateutil.parser.parse(value)
+
+        # All times are UTC, compared with the naive times of the files
+        if time.tzinfo is not None:
+            time = time.astimezone(timezone.utc).replace(tzinfo=None)
+
+        return time
+
+
+class MetadataIndex():
+
+    """
+    Class MetadataIndex
+    Index of the channel epochs of the StationXML files in a directory, built by
+    `refresh` (or on first use), for (network, station, location, channel, time)
+    lookups.
+
+    It is safe to use from several threads, and a forked process starts with an
+    empty index.
+    """
+
+    # Shared by all the indexes
+    logger = logging.getLogger("RuleManager")
+
+    def __init__(self, directory, max_size):
+
+        self.directory = directory
+        self.max_size = max_size
+        self._reset()
+
+        # A child process must not inherit the lock, or the state cached by the parent
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+
+        self._lock = threading.Lock()
+
+        # filepath -> (stat key, channels), for the files of the last refresh
+        self._files = None
+
+        # The files that could not be parsed in the last refresh
+        self._failed = set()
+
+        # stream -> (start times, channels), sorted by start time
+        self._streams = dict()
+
+        # filepath -> parsed inventory, most recently used last
+        self._inventories = OrderedDict()
+
+    def refresh(self):
+        """Indexes the StationXML files of the directory, parsing only the files
+        that were added or changed since the last refresh.
+
+        Raises
+        ------
+        `ValueError`
+            Raised if the directory is not configured, or does not exist.
+        """
+
+        if self.directory is None or not os.path.isdir(self.directory):
+            raise ValueError("The StationXML directory '%s' does not exist, check "
+                             "STATIONXML_DIRECTORY in configuration.py." % self.directory)
+
+        with self._lock:
+            files = dict(self._files or dict())
+
+        current = dict()
+        failed = set()
+        for directory, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+
+                if not filename.lower().endswith(".xml"):
+                    continue
+
+                filepath = os.path.join(directory, filename)
+                stat = os.stat(filepath)
+                key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+                if filepath in files and files[filepath][0] == key:
+                    current[filepath] = files[filepath]
+                    continue
+
+                try:
+                    current[filepath] = (key, FDSNXMLFile(filepath).channels)
+                except (ET.ParseError, ValueError, TypeError) as e:
+                    failed.add(filepath)
+                    self.logger.warning("Unable to index StationXML file %s (%s)."
+                                        % (filepath, str(e)))
+
+        streams = dict()
+        for _, channels in current.values():
+            for channel in channels:
+                stream = ".".join([channel["net"], channel["sta"], channel["loc"], channel["cha"]])
+                streams.setdefault(stream, []).append(channel)
+
+        for stream, channels in streams.items():
+            channels.sort(key=lambda channel: channel["start"])
+            streams[stream] = ([channel["start"] for channel in channels], channels)
+
+        with self._lock:
+            # Changed files must be read again
+            for filepath in list(self._inventories):
+                if filepath not in current or current[filepath][0] != files.get(filepath, (None,))[0]:
+                    del self._inventories[filepath]
+            self._files = current
+            self._failed = failed
+            self._streams = streams
+
+        self.logger.debug("Indexed %d channel epochs from %d StationXML files"
+                          % (sum(len(channels) for _, channels in streams.values()), len(current)))
+
+    def epochs(self, network, station, location, channel, start, end):
+        """Returns the channel epochs of a stream that overlap with the interval
+        from `start` to `end`, sorted by start time."""
+
+        with self._lock:
+            indexed = self._files is not None
+        if not indexed:
+            self.refresh()
+
+        with self._lock:
+            entry = self._streams.get(".".join([network, station, location, channel]))
+        if entry is None:
+            return []
+
+        # Only the epochs that start before the end of the interval
+        starts, channels = entry
+        return [channel for channel in channels[:bisect_right(starts, end)]
+                if channel["end"] is None or channel["end"] >= start]
+
+    def detect_changes(self):
+        """Indexes the StationXML files again, and compares the hashes of the channel
+        epochs with the ones seen in the previous run, stored in the metadata change
+        database. Returns the epochs whose response changed, was added or was removed,
+        as (stream, start, end) tuples, and stores them as changes.
+
+        The first run only stores the hashes, without reporting any change.
+        """
+
+        self.refresh()
+
+        with self._lock:
+            current = {(stream, metadata_change_database.format_time(channel["start"])): channel
+                       for stream, (_, channels) in self._streams.items()
+                       for channel in channels}
+            failed = set(self._failed)
+
+        stored = metadata_change_database.get_channels()
+        first_run = len(stored) == 0
+
+        changes = []
+        updated = []
+        removed = []
+        for key in set(current) | set(stored):
+
+            channel = current.get(key)
+            row = stored.get(key)
+
+            # The file of the epoch could not be read this time, keep what was seen
+            if channel is None and row["file"] in failed:
+                continue
+
+            if channel is None:
+                removed.append(key)
+                changes.append((key[0], metadata_change_database.parse_time(row["start"]),
+                                metadata_change_database.parse_time(row["end"])))
+                continue
+
+            if row is not None and row["hash"] == channel["hash"]:
+                continue
+            updated.append((key[0], channel["start"], channel["end"], channel["hash"],
+                            channel["response_hash"], channel["file"]))
+
+            # Other changes (e.g., the end of the epoch) do not affect the derived metadata
+            if row is not None and row["response_hash"] == channel["response_hash"]:
+                continue
+
+            # The epoch before and after the change
+            end = channel["end"]
+            if row is not None:
+                stored_end = metadata_change_database.parse_time(row["end"])
+                end = None if end is None or stored_end is None else max(end, stored_end)
+            changes.append((key[0], channel["start"], end))
+
+        metadata_change_database.update_channels(updated, removed)
+
+        if first_run:
+            self.logger.info("Stored the hashes of %d channel epochs" % len(updated))
+            return []
+
+        metadata_change_database.add_changes(changes, time.time())
+        self.logger.info("Detected changes in the responses of %d channel epochs" % len(changes))
+
+        return changes
+
+    def location(self, sds_file):
+        """Returns the coordinates of the stream of a file on its day, as a `dict` with
+        the ``longitude``, ``latitude`` and ``elevation``, or `None` if there is no
+        epoch, or more than one epoch, of the stream on that day."""
+
+        epochs = self.epochs(sds_file.net, sds_file.sta, sds_file.loc, sds_file.cha,
+                             sds_file.start, sds_file.end)
+
+        # Multiple epochs means that the location is somehow ambiguous
+        if len(epochs) != 1:
+            return None
+
+        return {
+            "longitude": epochs[0]["lng"],
+            "latitude": epochs[0]["lat"],
+            "elevation": epochs[0]["elev"]
+        }
+
+    def inventory(self, sds_file):
+        """Returns the inventory of the channel of a file on its day, at response
+        level, or `None` if there is no metadata for it."""
+
+        epochs = self.epochs(sds_file.net, sds_file.sta, sds_file.loc, sds_file.cha,
+                             sds_file.start, sds_file.end)
+        if len(epochs) == 0:
+            return None
+
+        from obspy import UTCDateTime
+
+        starttime = UTCDateTime(sds_file.start)
+        endtime = UTCDateTime(sds_file.end)
+
+        # Same selection as the query of FDSNWS for the channel and day
+        inventories = [self._read(filepath).select(network=sds_file.net,
+                                                   station=sds_file.sta,
+                                                   location=sds_file.loc,
+                                                   channel=sds_file.cha,
+                                                   starttime=starttime,
+                                                   endtime=endtime)
+                       for filepath in sorted({epoch["file"] for epoch in epochs})]
+
+        # The epochs may come from several files
+        inventory = inventories[0]
+        for other in inventories[1:]:
+            inventory += other
+
+        return inventory
+
+    def _read(self, filepath):
+        """Returns the parsed inventory of a file, read once for the most recently
+        used files."""
+
+        with self._lock:
+            inventory = self._inventories.get(filepath)
+            if inventory is not None:
+                self._inventories.move_to_end(filepath)
+                return inventory
+
+        # ObsPy is slow to import, and most runs never need it here
+        from obspy import read_inventory
+
+        inventory = read_inventory(filepath, format="STATIONXML")
+
+        with self._lock:
+            self._inventories[filepath] = inventory
+            if len(self._inventories) > self.max_size:
+                self._inventories.popitem(last=False)
+
+        return inventory
+
+    def clear(self):
+        """Forgets the index and the inventories kept in memory."""
+
+        with self._lock:
+            self._files = None
+            self._streams = dict()
+            self._inventories.clear()
+
 
-        tree = ET.parse(self.filepath)
-        root = tree.getroot()
-
-        # Extract all channels
-        for network in root.findall("{%s}Network" % self.NAMESPACE):
-            for station in network.findall("{%s}Station" % self.NAMESPACE):
-                for channel in station.findall("{%s}Channel" % self.NAMESPACE):
-
-                    network_code = network.get("code")
-                    station_code = station.get("code")
-                    channel_code = channel.get("code")
-
-                    channel_start = dateutil.parser.parse(channel.get("startDate"))
-                    channel_end = channel.get("endDate")
-
-                    # End may be none
-                    if channel_end is not None:
-                        channel_end = dateutil.parser.parse(channel_end)
-
-                    # Maybe some sanity rules
-                    channel_latitude = float(
-                        channel.find("{%s}Latitude" % self.NAMESPACE).text)
-                    channel_longitude = float(
-                        channel.find("{%s}Longitude" % self.NAMESPACE).text)
-                    channel_elevation = float(
-                        channel.find("{%s}Elevation" % self.NAMESPACE).text)
-                    channel_sample_rate = float(
-                        channel.find("{%s}SampleRate" % self.NAMESPACE).text)
-
-                    # Get the hash of the XML string per channel
-                    # The XML should be canonicalized
-                    channel_hash = sha256(ET.tostring(channel)).hexdigest()
-
-                    self.channels.append({
-                        "net": network_code,
-                        "sta": station_code,
-                        "cha": channel_code,
-                        "start": channel_start,
-                        "end": channel_end,
-                        "lat": channel_latitude,
-                        "lng": channel_longitude,
-                        "elev": channel_elevation,
-                        "rate": channel_sample_rate,
-                        "hash": channel_hash
-                    })
-
-
-# Example
-FDSNXMLFile("/data/temp_archive/metadata/NL.HGN.xml")
+metadata_index = MetadataIndex(config.get("STATIONXML_DIRECTORY"),
+                               config.get("INVENTORY_CACHE_SIZE", 64))
@@ -0,0 +1,482 @@
+"""
+This module summarizes the traces of miniSEED (version 2) files by reading the
+fixed section of the data headers and their blockettes, without decoding any
+sample, as a faster replacement of the `dataselect | msi -T` pipeline.
+
+The headers of all records of a file are read at once from a memory map, with
+NumPy structured types. Files that the scanner does not support (e.g., records
+of different lengths within one file, or records without blockette 1000) raise
+a `ValueError`, so that the caller can fall back to the external tools.
+
+The record headers of the last files scanned are kept in memory, as an index of
+the records of each file, so that the records in a time window of a file (e.g.,
+the few records of a neighbouring file that cross the day boundary) can be read
+without reading the whole file.
+
+Example
+-------
+
+```
+from sds.mseed import scan_traces
+...
+traces = scan_traces([sds_file.filepath for sds_file in sds_file.neighbours],
+                     sds_file.start, sds_file.end - timedelta(microseconds=1))
+```
+"""
+
+import io
+import os
+import sys
+import math
+import mmap
+import struct
+import threading
+import numpy as np
+
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+
+# Fixed section of the data header, 48 bytes (SEED manual, chapter 8)
+_FIXED_HEADER_FIELDS = [
+    ("sequence_number", "S6"),
+    ("quality", "S1"),
+    ("reserved", "S1"),
+    ("station", "S5"),
+    ("location", "S2"),
+    ("channel", "S3"),
+    ("network", "S2"),
+    ("year", "u2"),
+    ("day", "u2"),
+    ("hour", "u1"),
+    ("minute", "u1"),
+    ("second", "u1"),
+    ("unused", "u1"),
+    ("fraction", "u2"),
+    ("samples", "u2"),
+    ("rate_factor", "i2"),
+    ("rate_multiplier", "i2"),
+    ("activity_flags", "u1"),
+    ("io_flags", "u1"),
+    ("quality_flags", "u1"),
+    ("blockettes", "u1"),
+    ("time_correction", "i4"),
+    ("data_offset", "u2"),
+    ("blockette_offset", "u2")
+]
+_FIXED_HEADER_SIZE = 48
+
+# Bytes of each record that are read to find the blockettes
+_HEADER_BYTES = 256
+
+# Maximum number of blockettes followed in a record
+_MAX_BLOCKETTES = 16
+
+_EPOCH = datetime(1970, 1, 1)
+
+# Number of files whose record index is kept in memory
+_INDEX_CACHE_SIZE = 16
+
+
+def _fixed_header_dtype(byteorder):
+    """Returns the structured type of the fixed header in the given byte order."""
+
+    return np.dtype([(name, byteorder + code if code[0] in "ui" else code)
+                     for name, code in _FIXED_HEADER_FIELDS])
+
+
+def _is_valid_time(year, day):
+    return 1900 <= year <= 2100 and 1 <= day <= 366
+
+
+def _file_layout(first_record):
+    """Returns the byte order and record length of a file, from its first record."""
+
+    # The byte order is the one that gives a sensible start time
+    for byteorder in (">", "<"):
+        year, day = struct.unpack(byteorder + "HH", first_record[20:24])
+        if _is_valid_time(year, day):
+            break
+    else:
+        raise ValueError("Not a miniSEED 2 record.")
+
+    # The record length is in blockette 1000
+    offset = struct.unpack(byteorder + "H", first_record[46:48])[0]
+    for _ in range(_MAX_BLOCKETTES):
+        if offset == 0 or offset + 8 > len(first_record):
+            break
+        blockette_type, next_offset = struct.unpack(byteorder + "HH",
+                                                    first_record[offset:offset + 4])
+        if blockette_type == 1000:
+            return byteorder, 2 ** first_record[offset + 6]
+        offset = next_offset
+
+    raise ValueError("Record without blockette 1000.")
+
+
+def _gather(headers, rows, offsets, n_bytes):
+    """Returns `n_bytes` bytes at a different offset of every record, as an
+    array of shape (records, n_bytes)."""
+
+    return headers[rows[:, None], offsets[:, None] + np.arange(n_bytes)]
+
+
+def scan_records(filepath):
+    """Reads the headers of all the records of a miniSEED file.
+
+    Parameters
+    ----------
+    filepath : `str`
+        Path of the file.
+
+    Returns
+    -------
+    records : `dict` (`str` -> `numpy.ndarray`)
+        For each record, the stream identifier (``id``), the time of the first
+        sample in microseconds since 1970 (``start``), the time after the last
+        sample (``end``, the start plus the number of samples times the sample
+        period), the sample rate in Hz (``rate``), the number of samples
+        (``samples``), and the offset of the record in the file in bytes
+        (``offset``), with the length of the records (``record_length``).
+
+    Raises
+    ------
+    `ValueError`
+        Raised if the file is not miniSEED 2, or its layout is not supported.
+    """
+
+    with open(filepath, "rb") as f:
+
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return {"id": np.array([], dtype=object),
+                    "start": np.array([], dtype=np.int64),
+                    "end": np.array([], dtype=np.int64),
+                    "rate": np.array([], dtype=np.float64),
+                    "samples": np.array([], dtype=np.int64),
+                    "offset": np.array([], dtype=np.int64),
+                    "record_length": 0}
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+
+            byteorder, record_length = _file_layout(mm[:_HEADER_BYTES])
+            if record_length < _FIXED_HEADER_SIZE or size % record_length != 0:
+                raise ValueError("Records of different lengths are not supported.")
+
+            # Copy the headers of all records out of the map
+            n_records = size // record_length
+            header_bytes = min(record_length, _HEADER_BYTES)
+            data = np.frombuffer(mm, dtype=np.uint8)
+            headers = data.reshape(n_records, record_length)[:, :header_bytes].copy()
+            del data
+
+    fixed = headers[:, :_FIXED_HEADER_SIZE].copy().view(_fixed_header_dtype(byteorder))[:, 0]
+
+    if not (np.all((fixed["year"] >= 1900) & (fixed["year"] <= 2100))
+            and np.all((fixed["day"] >= 1) & (fixed["day"] <= 366))):
+        raise ValueError("Records with different byte orders are not supported.")
+
+    # Follow the blockettes of all the records at once
+    rows = np.arange(n_records)
+    offsets = fixed["blockette_offset"].astype(np.int64)
+    lengths = np.zeros(n_records, dtype=np.int64)
+    microseconds = np.zeros(n_records, dtype=np.int64)
+    actual_rates = np.full(n_records, np.nan)
+    for _ in range(_MAX_BLOCKETTES):
+
+        active = offsets > 0
+        if not active.any():
+            break
+        if np.any(offsets[active] + 8 > header_bytes):
+            raise ValueError("Blockettes beyond the supported header size.")
+
+        offsets = np.where(active, offsets, 0)
+        blockette_types = _gather(headers, rows, offsets, 2).copy().view(byteorder + "u2")[:, 0]
+        next_offsets = _gather(headers, rows, offsets + 2, 2).copy().view(byteorder + "u2")[:, 0]
+
+        # Blockette 1000: record length
+        is_1000 = active & (blockette_types == 1000)
+        lengths[is_1000] = 2 ** headers[rows[is_1000], offsets[is_1000] + 6].astype(np.int64)
+
+        # Blockette 1001: microseconds added to the start time
+        is_1001 = active & (blockette_types == 1001)
+        microseconds[is_1001] = headers[rows[is_1001], offsets[is_1001] + 5].view(np.int8)
+
+        # Blockette 100: actual sample rate
+        is_100 = active & (blockette_types == 100)
+        actual_rates[is_100] = _gather(headers[is_100], rows[:np.count_nonzero(is_100)],
+                                       offsets[is_100] + 4, 4).copy().view(byteorder + "f4")[:, 0]
+
+        offsets = np.where(active, next_offsets, 0)
+    else:
+        if np.any(offsets > 0):
+            raise ValueError("Too many blockettes.")
+
+    if np.any(lengths != record_length):
+        raise ValueError("Records of different lengths are not supported.")
+
+    # Start time, in microseconds since 1970
+    days = ((fixed["year"].astype(np.int64) - 1970).astype("datetime64[Y]")
+            .astype("datetime64[D]").astype(np.int64) + fixed["day"] - 1)
+    seconds = ((days * 24 + fixed["hour"]) * 60 + fixed["minute"]) * 60 + fixed["second"]
+    start = seconds * 1000000 + fixed["fraction"].astype(np.int64) * 100 + microseconds
+
+    # Time correction, unless the activity flags say that it was applied already
+    apply_correction = (fixed["activity_flags"] & 0x02) == 0
+    start += np.where(apply_correction, fixed["time_correction"].astype(np.int64) * 100, 0)
+
+    # Nominal sample rate, from the factor and multiplier
+    factor = fixed["rate_factor"].astype(np.float64)
+    multiplier = fixed["rate_multiplier"].astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rate = np.select(
+            [(factor > 0) & (multiplier > 0), (factor > 0) & (multiplier < 0),
+             (factor < 0) & (multiplier > 0), (factor < 0) & (multiplier < 0)],
+            [factor * multiplier, -factor / multiplier,
+             -multiplier / factor, 1.0 / (factor * multiplier)],
+            default=0.0)
+    rate = np.where(np.isnan(actual_rates), rate, actual_rates)
+
+    def decode(field):
+        return np.char.strip(np.char.decode(fixed[field], "ascii"))
+
+    stream_id = np.char.add(np.char.add(np.char.add(decode("network"), "."),
+                                        np.char.add(decode("station"), ".")),
+                            np.char.add(np.char.add(decode("location"), "."),
+                                        decode("channel")))
+
+    # One string object per stream, shared by its records
+    stream_ids, stream = np.unique(stream_id, return_inverse=True)
+    stream_id = np.array([sys.intern(str(i)) for i in stream_ids], dtype=object)[stream]
+
+    samples = fixed["samples"].astype(np.int64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        duration = np.where(rate > 0, np.round(samples * 1e6 / rate), 0).astype(np.int64)
+
+    return {"id": stream_id,
+            "start": start,
+            "end": start + duration,
+            "rate": rate,
+            "samples": samples,
+            "offset": rows * record_length,
+            "record_length": record_length}
+
+
+_index_cache = OrderedDict()
+_index_lock = threading.Lock()
+
+
+def _reset_index_lock():
+    global _index_lock
+    _index_lock = threading.Lock()
+
+
+# A child process must not inherit the lock, the index itself is still valid
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_index_lock)
+
+
+def record_index(filepath):
+    """Returns the record headers of a miniSEED file, as `scan_records`.
+
+    The headers of the last files are kept in memory, and read again when the
+    file changes (a different inode, size or modification time).
+
+    Raises
+    ------
+    `ValueError`
+        Raised if the file is not miniSEED 2, or its layout is not supported.
+    """
+
+    stats = os.stat(filepath)
+    key = (stats.st_ino, stats.st_size, stats.st_mtime_ns)
+
+    with _index_lock:
+        cached = _index_cache.get(filepath)
+        if cached is not None and cached[0] == key:
+            _index_cache.move_to_end(filepath)
+            return cached[1]
+
+    records = scan_records(filepath)
+
+    with _index_lock:
+        _index_cache[filepath] = (key, records)
+        _index_cache.move_to_end(filepath)
+        while len(_index_cache) > _INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+
+    return records
+
+
+class RecordBuffer(io.BytesIO):
+    """miniSEED records in memory, that can be passed to the ObsPy readers
+    instead of a file name.
+
+    ObsPy reads file objects from their current position to the end, so every
+    complete read starts again from the first record. This allows a buffer to
+    be read more than once (e.g., by `MSEEDMetadata`).
+    """
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            self.seek(0)
+        return super().read(size)
+
+
+def read_records(filepath, start, end, contents=None):
+    """Reads the records of a miniSEED file with samples between two times,
+    without reading the other records.
+
+    Parameters
+    ----------
+    filepath : `str`
+        Path of the file.
+    start : `datetime.datetime`
+        Start of the time window. The records that end before it (including
+        the period of their last sample) are skipped.
+    end : `datetime.datetime`
+        End of the time window. The records that start after it are skipped.
+    contents : `bytes`, optional
+        Contents of the file, if already in memory. The records are copied
+        from it instead of being read from the file.
+
+    Returns
+    -------
+    records : `RecordBuffer`
+        The records, in the order of the file.
+
+    Raises
+    ------
+    `ValueError`
+        Raised if the file is not miniSEED 2, or its layout is not supported.
+    """
+
+    index = record_index(filepath)
+
+    window_start = (start - _EPOCH) // timedelta(microseconds=1)
+    window_end = (end - _EPOCH) // timedelta(microseconds=1)
+    selected = np.flatnonzero((index["end"] >= window_start) & (index["start"] <= window_end))
+
+    # Read the consecutive records at once
+    buffer = RecordBuffer()
+    if len(selected) == 0:
+        return buffer
+
+    # Contents of another version of the file
+    record_length = index["record_length"]
+    if contents is not None and len(contents) != len(index["offset"]) * record_length:
+        contents = None
+
+    runs = np.split(selected, np.flatnonzero(np.diff(selected) != 1) + 1)
+    if contents is not None:
+        view = memoryview(contents)
+        for run in runs:
+            offset = int(index["offset"][run[0]])
+            buffer.write(view[offset:offset + len(run) * record_length])
+    else:
+        with open(filepath, "rb") as f:
+            for run in runs:
+                f.seek(int(index["offset"][run[0]]))
+                buffer.write(f.read(len(run) * record_length))
+
+    buffer.seek(0)
+    return buffer
+
+
+def scan_traces(filepaths, start, end):
+    """Summarizes the traces of miniSEED files between two times, like
+    `dataselect -ts start -te end -Ps -szs | msi -ts start -te end -T`.
+
+    The samples are trimmed to the time window, overlapping samples are
+    removed, and contiguous records of the same stream and sample rate (with a
+    tolerance of half a sample) are merged into one trace.
+
+    Parameters
+    ----------
+    filepaths : `list` of `str`
+        Paths of the files.
+    start : `datetime.datetime`
+        Start of the time window, inclusive.
+    end : `datetime.datetime`
+        End of the time window, inclusive.
+
+    Returns
+    -------
+    traces : `list` of `dict`
+        For each trace, sorted by stream and start time, the number of samples
+        (``samples``), the sample rate in Hz (``rate``), and the times of the
+        first (``start``) and last (``end``) samples.
+
+    Raises
+    ------
+    `ValueError`
+        Raised if a file is not miniSEED 2, or its layout is not supported.
+    """
+
+    records = [record_index(filepath) for filepath in filepaths]
+    if len(records) == 0:
+        return []
+
+    stream_id = np.concatenate([r["id"] for r in records]).astype(str)
+    record_start = np.concatenate([r["start"] for r in records]).astype(np.float64)
+    rate = np.concatenate([r["rate"] for r in records])
+    samples = np.concatenate([r["samples"] for r in records])
+
+    # Records with data only (-szs)
+    keep = (samples > 0) & (rate > 0)
+    stream_id, record_start, rate, samples = (stream_id[keep], record_start[keep],
+                                              rate[keep], samples[keep])
+
+    # Trim to the samples in the window, with a tolerance of half a microsecond
+    window_start = (start - _EPOCH) // timedelta(microseconds=1)
+    window_end = (end - _EPOCH) // timedelta(microseconds=1)
+    period = 1e6 / rate
+    tolerance = 0.5 / period
+    first = np.maximum(np.ceil((window_start - record_start) / period - tolerance), 0)
+    last = np.minimum(np.floor((window_end - record_start) / period + tolerance), samples - 1)
+    keep = first <= last
+    stream_id, period = stream_id[keep], period[keep]
+    rate, first, last = rate[keep], first[keep], last[keep]
+    record_start = record_start[keep] + first * period
+    samples = (last - first + 1).astype(np.int64)
+
+    order = np.lexsort((record_start, stream_id))
+
+    # Remove the overlapping samples and merge the contiguous records
+    traces = []
+    current = None
+    for i_id, i_start, i_rate, i_period, i_samples in zip(stream_id[order].tolist(),
+                                                          record_start[order].tolist(),
+                                                          rate[order].tolist(),
+                                                          period[order].tolist(),
+                                                          samples[order].tolist()):
+
+        if (current is not None and current["id"] == i_id
+                and abs(1.0 - current["rate"] / i_rate) < 0.0001):
+
+            # Drop the samples up to the end of the trace (-Ps)
+            covered = math.floor((current["end"] + i_period / 2 - i_start) / i_period) + 1
+            if covered > 0:
+                if covered >= i_samples:
+                    continue
+                i_start += covered * i_period
+                i_samples -= covered
+
+            # Contiguous with the trace
+            if abs(i_start - (current["end"] + i_period)) <= i_period / 2:
+                current["end"] = i_start + (i_samples - 1) * i_period
+                current["samples"] += i_samples
+                continue
+
+        current = {"id": i_id,
+                   "rate": i_rate,
+                   "start": i_start,
+                   "end": i_start + (i_samples - 1) * i_period,
+                   "samples": i_samples}
+        traces.append(current)
+
+    return [{"samples": int(trace["samples"]),
+             "rate": float(trace["rate"]),
+             "start": _EPOCH + timedelta(microseconds=round(trace["start"])),
+             "end": _EPOCH + timedelta(microseconds=round(trace["end"]))}
+            for trace in traces]
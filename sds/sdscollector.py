@@ -8,14 +8,126 @@
 
 """
 
+import os
+import re
+import glob
 import logging
-from fnmatch import fnmatch
+from fnmatch import translate
 from datetime import date, datetime, timedelta
-from itertools import repeat
 import dateutil.parser as parser
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
+from configuration import config
 from sds.sdsfile import SDSFile
-from sds.filecollector import FileCollector
+from sds.fileset import SDSFileSet
+from sds.manifest import archive_manifest
+from sds.filecollector import FileCollector, DirectoryScanner
+
+
+class SDSPathFilter():
+
+    """
+    Class SDSPathFilter
+    Matches the directories and files of an SDS archive against one or more
+    filename wildcards (NET.STA.LOC.CHA.QUALITY.YEAR.DAY), so that the
+    directories that cannot hold a matching file are skipped.
+
+    The wildcards are compiled into one trie over the codes of the filenames, in
+    the order of the directories of the archive (YEAR/NET/STA/CHA.QUALITY), then
+    the location and the day. A name is matched against all the wildcards in one
+    pass, following only the branches whose code matches, and a directory matches
+    if its path leads to a branch.
+    """
+
+    # Directory levels of the archive: YEAR/NET/STA/CHA.QUALITY
+    YEAR, NETWORK, STATION, CHANNEL = range(4)
+
+    # Fields of the filename in the order of the trie
+    FIELDS = (5, 0, 1, 3, 4, 2, 6)
+
+    def __init__(self, wildcards):
+
+        self._root = self._node()
+        for wildcard in wildcards:
+
+            # Check if an SDS file was specified
+            parts = wildcard.split(".")
+            if len(parts) != 7:
+                raise ValueError("An invalid expression was submitted: %s" % wildcard)
+
+            node = self._root
+            for field in self.FIELDS:
+                node = self._child(node, parts[field])
+
+        # The branches of the directory of the last matched file
+        self._last = (None, None)
+
+    @staticmethod
+    def _node():
+
+        # The children by code, and by pattern with their compiled match (None for *)
+        return dict(), dict()
+
+    def _child(self, node, code):
+
+        codes, patterns = node
+
+        if not glob.has_magic(code):
+            return codes.setdefault(code, self._node())
+
+        if code not in patterns:
+            patterns[code] = (None if code == "*" else re.compile(translate(code)).match,
+                              self._node())
+        return patterns[code][1]
+
+    @staticmethod
+    def _follow(nodes, codes):
+        """Returns the branches reached from `nodes` by a sequence of codes."""
+
+        for code in codes:
+
+            children = []
+            for node_codes, node_patterns in nodes:
+                if code in node_codes:
+                    children.append(node_codes[code])
+                for match, child in node_patterns.values():
+                    if match is None or match(code) is not None:
+                        children.append(child)
+
+            if not children:
+                return children
+            nodes = children
+
+        return nodes
+
+    def match_directory(self, parents, name):
+        """Whether the directory `name`, in the directories `parents` under the root of
+        the archive, may hold a matching file."""
+
+        codes = list(parents) + [name]
+        if len(codes) > self.CHANNEL:
+            codes[self.CHANNEL:] = codes[self.CHANNEL].split(".")
+            if len(codes) != self.CHANNEL + 2:
+                return False
+
+        return len(self._follow([self._root], codes)) > 0
+
+    def match_file(self, filename):
+        """Whether the file `filename` matches."""
+
+        parts = filename.split(".")
+        if len(parts) != 7:
+            return False
+
+        # Files are matched directory by directory, in the order of FIELDS
+        directory = (parts[5], parts[0], parts[1], parts[3], parts[4])
+        last_directory, nodes = self._last
+        if directory != last_directory:
+            nodes = self._follow([self._root], directory)
+            self._last = (directory, nodes)
+
+        return len(nodes) > 0 and len(self._follow(nodes, (parts[2], parts[6]))) > 0
 
 
 class SDSFileCollector(FileCollector):
@@ -23,81 +135,185 @@ class SDSFileCollector(FileCollector):
     """
     Class SDSFileCollector
     Used for collecting files from an SDS archive based on time and/or filename
+
+    The archive is walked on the first use of `files` (or streamed with
+    `iter_files`), listing the directories on `workers` threads. The filters on
+    the filenames given before are applied while walking it, skipping the
+    directories that cannot hold a matching file, and the other filters are
+    applied to the collected files. The filters given after filter the
+    collected files.
+
+    The files are collected as an `SDSFileSet`, in columns, and the filters on
+    the times and streams of the files are vectorized on those columns.
+
+    With a `manifest` (by default if `MANIFEST_DB` is configured), the archive is
+    not walked: the manifest of the archive is refreshed, and the filters given
+    before are queried on it.
     """
 
-    files = []
+    # Number of files collected in a chunk while walking the archive
+    CHUNK_SIZE = 1024
 
-    def __init__(self, archive_dir):
-        """Initialize a file collector class."""
+    def __init__(self, archive_dir, workers=None, ordered=False, manifest=None, full_refresh=False):
+        """Initialize a file collector class. The files are collected in a
+        deterministic order if `ordered` is set. With `full_refresh`, all the
+        directories of the manifest are listed again."""
 
         # Initialize logger
         self.logger = logging.getLogger("RuleManager")
+        self.logger.debug("Initializing the %s." % self.__class__.__name__)
+
+        # Unlike other collectors, the files are only collected when needed
+        self._initialized = datetime.now()
+        self.archive_dir = archive_dir
+        self.workers = workers or config.get("COLLECTOR_WORKERS", 1)
+        self.ordered = ordered
+        self.manifest = archive_manifest.enabled if manifest is None else manifest
+        self.full_refresh = full_refresh
+        self._files = None
+
+        # Filters for the walk of the archive
+        self._path_filters = []
+        self._file_filters = []
+
+        # Or the clauses of the query of the manifest
+        self._queries = []
+
+    @property
+    def files(self):
+        """The collected files as an `SDSFileSet`, collected on first use."""
+
+        if self._files is None:
+            self._files = SDSFileSet.concatenate(self.archive_dir, self._iter_sets())
+            self.logger.debug("Found %d files." % len(self._files))
+
+        return self._files
+
+    @files.setter
+    def files(self, files):
+        self._files = files
+
+    def _filter(self, path_filter=None, file_filter=None, query=None):
+        """Filters the files by name with an `SDSPathFilter`, by a (SQL condition,
+        parameters, values) `query` clause on the manifest, and/or by a function of
+        an `SDSFileSet` returning the mask (or the indices) of the files to keep.
+
+        Before the archive is walked, the path filter skips the directories (in a
+        walk or in the refresh of the manifest) and the files, and the query selects
+        the files of the manifest; both may select more files than the file filter,
+        which is applied to the collected files. After, the file filter is applied,
+        or the path filter if there is none."""
+
+        if self._files is None:
+            if path_filter is not None:
+                self._path_filters.append(path_filter)
+            if self.manifest and query is not None:
+                self._queries.append(query)
+            if file_filter is not None:
+                self._file_filters.append(file_filter)
+            return
+
+        if file_filter is not None:
+            self.files = self.files.select(file_filter(self.files))
+        elif path_filter is not None:
+            self.files = self.files.select(self.files.match(path_filter.match_file))
+        self.logger.debug("Found %d files." % len(self.files))
 
-        # Collects all filenames
-        super().__init__(archive_dir)
+    def _accept_directory(self, parents, name):
 
-        # Process filenames
-        sds_files = []
-        for filename in self.files:
-            try:
-                sds_files.append(SDSFile(filename, self.archive_dir))
-            except Exception as e:
-                self.logger.debug("Unable to parse file '%s' as SDSFile: '%s'" % (filename,
-                                                                                  str(e)))
-        self.files = sds_files
+        return all(path_filter.match_directory(parents, name) for path_filter in self._path_filters)
 
-    def _collect_from_date(self, i_date, mode="file_name"):
-        """
-        Collects SDS files for a particular date, based on file's name or on
-        file's modification time
-        """
+    def _accept_file(self, parents, name):
 
-        # Parse provided date if necessary
-        if not isinstance(i_date, datetime) and not isinstance(i_date, date):
-            i_date = parser.parse(i_date)
+        return all(path_filter.match_file(name) for path_filter in self._path_filters)
 
-        if mode == "file_name":
+    def iter_files(self):
+        """Yields the SDSFiles that pass the filters as they are found, walking the
+        archive (YEAR/NET/STA/CHA.QUALITY/file) if it was not walked yet. The stat of
+        the files is taken while walking."""
 
-            # Extract the julian day and year
-            day = i_date.strftime("%j")
-            year = i_date.strftime("%Y")
-            self.logger.debug("Searching files whose name's date is '%s.%s'" % (year, day))
+        for file_set in self.iter_file_sets():
+            yield from file_set
 
-            # Filter by day and year
-            files = list(filter(lambda x: (x.day == day and x.year == year), self.files))
+    def iter_file_sets(self):
+        """Yields the files that pass the filters as `SDSFileSet` chunks as they are
+        found, or the collected files if the archive was walked already."""
 
-        elif mode == "mod_time":
+        if self._files is not None:
+            yield self._files
+            return
 
-            # Extract start and end of the date
-            date_start = datetime(i_date.year, i_date.month, i_date.day)
-            date_end = date_start + timedelta(days=1)
-            self.logger.debug("Searching files modified between '%s' and '%s'" % (date_start,
-                                                                                  date_end))
+        yield from self._iter_sets()
 
-            # Filter by modification time
-            files = list(filter(lambda x: (x.modified >= date_start and x.modified < date_end),
-                                self.files))
+    def _iter_sets(self):
+        """Yields the files that pass the filters as `SDSFileSet` chunks, from the
+        manifest or from a walk of the archive."""
 
-        else:
-            raise ValueError("Unsupported mode %s requested to find files." % mode)
+        if self.manifest:
+            yield self._select(self._query_manifest())
+            return
+
+        self.logger.debug("Collecting files from '%s' with %d filename filters on %d threads."
+                          % (self.archive_dir, len(self._path_filters), self.workers))
+
+        rows = []
+        scanner = DirectoryScanner(workers=self.workers, ordered=self.ordered)
+        for parents, entry in scanner.scan(self.archive_dir,
+                                           accept_directory=self._accept_directory,
+                                           accept_file=self._accept_file,
+                                           file_depth=SDSPathFilter.CHANNEL + 1,
+                                           stat=True):
 
-        self.logger.debug("Found %d files using '%s' mode." % (len(files), mode))
-        return files
+            # The stat was taken by the scanner rather than by the rules
+            try:
+                row = SDSFileSet.stat_row(entry.name, entry.stat())
+            except Exception as e:
+                self.logger.debug("Unable to parse file '%s' as SDSFile: '%s'"
+                                  % (entry.name, str(e)))
+                continue
+
+            # The file would not be found through its name
+            net, sta, _, cha, quality, year, _ = entry.name.split(".")
+            if parents != (year, net, sta, ".".join([cha, quality])):
+                self.logger.debug("Skipping file '%s' found in '%s'"
+                                  % (entry.name, os.path.join(*parents)))
+                continue
+
+            rows.append(row)
+            if len(rows) == self.CHUNK_SIZE:
+                yield self._select(SDSFileSet.from_rows(self.archive_dir, rows))
+                rows = []
+
+        yield self._select(SDSFileSet.from_rows(self.archive_dir, rows))
+
+    def _query_manifest(self):
+        """Returns the files of the refreshed manifest of the archive that match the
+        queries."""
+
+        directories = archive_manifest.refresh(self.archive_dir, workers=self.workers,
+                                               full=self.full_refresh,
+                                               accept_directory=self._accept_directory)
 
-    def _collect_from_wildcards(self, filename):
-        """Collects SDS files based on a filename that allows wildcards."""
+        # Only in the directories that pass the path filters, as in a walk
+        queries = list(self._queries)
+        if self._path_filters:
+            queries.append(("directory IN (SELECT value FROM {values})", [], directories))
 
-        # Check if an SDS file was specified
-        if len(filename.split(".")) != 7:
-            raise ValueError("An invalid expression was submitted: %s" % filename)
+        self.logger.debug("Querying the manifest of '%s' with %d clauses."
+                          % (self.archive_dir, len(queries)))
 
-        self.logger.debug("Searching files whose name fits in '%s'" % filename)
+        # The names in the manifest are valid, and the stat is taken again when needed
+        rows = archive_manifest.query(self.archive_dir, queries, ordered=self.ordered)
+        return SDSFileSet.from_rows(self.archive_dir, [SDSFileSet.row(*row) for row in rows
+                                                       if self._accept_file(None, row[0])])
 
-        # Take the basename and map to SDSFile
-        files = list(filter(lambda x: fnmatch(x.filename, filename), self.files))
+    def _select(self, file_set):
+        """Returns the files of a set that pass the file filters."""
 
-        self.logger.debug("Found %d files for this filename/wildcard." % len(files))
-        return files
+        for file_filter in self._file_filters:
+            file_set = file_set.select(file_filter(file_set))
+
+        return file_set
 
     def filter_from_wildcards_array(self, wildcards_array):
         """Filters SDS files based on an array of filenames that allow
@@ -105,14 +321,7 @@ class SDSFileCollector(FileCollector):
         wildcards."""
 
         self.logger.debug("Searching files for a list of %d filenames/wildcards" % len(wildcards_array))
-
-        # Aggregate files found for each wildcards combination
-        collected_files = list()
-        for wildcards in wildcards_array:
-            collected_files += self._collect_from_wildcards(wildcards)
-        self.files = list(set(collected_files))
-
-        self.logger.debug("Found %d unique files in total." % len(self.files))
+        self._filter(path_filter=SDSPathFilter(wildcards_array))
 
     def filter_finished_files(self, tolerance):
         """Filters all SDS files with modification timestamp older than last
@@ -124,11 +333,12 @@ class SDSFileCollector(FileCollector):
         self.logger.debug("Searching for files modified before %s" % timestamp.isoformat())
 
         # Select files by modification date
-        self.files = list(filter(lambda f: f.modified < timestamp, self.files))
-        self.logger.debug("Found %d files." % len(self.files))
+        self._filter(file_filter=lambda x: x.between("mtime", -np.inf, timestamp.timestamp()),
+                     query=("mtime < ?", [timestamp.timestamp()], None))
 
     def filter_from_date_range(self, i_date, days, mode="file_name"):
-        """Filters files from a range of dates;
+        """Filters files from a range of dates, based on file's name or on
+        file's modification time;
             if days > 0: [date, date + N - 1]
             if days == 0: nothing
             if days < 0: [date - N, date - 1]
@@ -138,8 +348,6 @@ class SDSFileCollector(FileCollector):
         if not isinstance(i_date, datetime) and not isinstance(i_date, date):
             i_date = parser.parse(i_date)
 
-        collected_files = list()
-
         # Go over every day in increasing order, skipping "date" if days is negative
         if days > 0:
             start = 0
@@ -147,10 +355,37 @@ class SDSFileCollector(FileCollector):
         else:
             start = days
             stop = 0
-        for day in range(start, stop):
-            collected_files += self._collect_from_date(i_date + timedelta(days=day), mode=mode)
+        dates = [i_date + timedelta(days=day) for day in range(start, stop)]
+
+        if mode == "file_name":
+
+            # Filter by day and year
+            self.logger.debug("Searching files whose name's date is in %d days" % len(dates))
+            if len(dates) == 0:
+                return self._filter(file_filter=self._select_none, query=("0", [], None))
+            first = dates[0].toordinal()
+            self._filter(path_filter=SDSPathFilter([x.strftime("*.*.*.*.*.%Y.%j") for x in dates]),
+                         file_filter=lambda x: x.between("ordinal", first, first + len(dates)),
+                         query=("ordinal >= ? AND ordinal < ?", [first, first + len(dates)], None))
 
-        self.files = collected_files
+        elif mode == "mod_time":
+
+            # Extract start and end of the range
+            if len(dates) == 0:
+                return self._filter(file_filter=self._select_none, query=("0", [], None))
+            date_start = datetime(dates[0].year, dates[0].month, dates[0].day)
+            date_end = date_start + timedelta(days=len(dates))
+            self.logger.debug("Searching files modified between '%s' and '%s'" % (date_start,
+                                                                                  date_end))
+
+            # Filter by modification time
+            self._filter(file_filter=lambda x: x.between("mtime", date_start.timestamp(),
+                                                         date_end.timestamp()),
+                         query=("mtime >= ? AND mtime < ?",
+                                [date_start.timestamp(), date_end.timestamp()], None))
+
+        else:
+            raise ValueError("Unsupported mode %s requested to find files." % mode)
 
     def filter_from_past_days(self, days, mode="file_name"):
         """Filters files from N days in the past: [today - N, yesterday]"""
@@ -161,11 +396,119 @@ class SDSFileCollector(FileCollector):
     def filter_from_file_list(self, file_list):
         """Filter files that are in a list of filenames."""
 
-        self.files = list(filter(lambda x: x.filename in file_list, self.files))
+        # Other names cannot be SDS files
+        file_list = [filename for filename in file_list if len(filename.split(".")) == 7]
+        self._filter(path_filter=SDSPathFilter([glob.escape(filename) for filename in file_list]),
+                     query=("filename IN (SELECT value FROM {values})", [], file_list))
+
+    def filter_from_file_set(self, file_set):
+        """Takes the files of an `SDSFileSet` (e.g., read from a list written by the
+        collector) as the files of the archive, without walking it, and filters them
+        with the filters given before. The stat of the files is taken (as in a walk)
+        if it is not in the set, and the files that do not exist are skipped. After the files
+        are collected, keeps the collected files that are in the set."""
+
+        if self._files is not None:
+            self.files = self.files.select(np.isin(self.files.filename, file_set.filename))
+            self.logger.debug("Found %d files." % len(self.files))
+            return
+
+        self.logger.debug("Collecting %d listed files on %d threads."
+                          % (len(file_set), self.workers))
+
+        # Like the walk, but only of the listed files
+        file_set = self._stat_files(file_set)
+        if self._path_filters:
+            file_set = file_set.select(file_set.match(lambda x: self._accept_file(None, x)))
+
+        self.files = self._select(file_set)
+
+    def _stat_files(self, file_set):
+        """Returns the files of a set with their stat, taking it (on `workers`
+        threads) for the files without one, and without the files that do not exist."""
+
+        unknown = np.flatnonzero(file_set.mtime_ns < 0)
+        if len(unknown) == 0:
+            return file_set
+
+        def stat(filename):
+            try:
+                return os.stat(SDSFile(filename, file_set.archive_dir).filepath)
+            except FileNotFoundError:
+                return None
+
+        if self.workers > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                stats = list(executor.map(stat, file_set.filename[unknown].tolist()))
+        else:
+            stats = [stat(filename) for filename in file_set.filename[unknown].tolist()]
+
+        columns = {name: getattr(file_set, name).copy() for name in SDSFileSet.COLUMNS}
+        exists = np.ones(len(file_set), dtype=bool)
+        for index, stat in zip(unknown.tolist(), stats):
+            if stat is None:
+                exists[index] = False
+                continue
+            columns["inode"][index] = stat.st_ino
+            columns["size"][index] = stat.st_size
+            columns["mtime"][index] = stat.st_mtime
+            columns["mtime_ns"][index] = stat.st_mtime_ns
+            columns["ctime"][index] = stat.st_ctime
+
+        return SDSFileSet(file_set.archive_dir, columns).select(exists)
+
+    def filter_from_metadata_changes(self, changes):
+        """Filters the SDS files whose stream and day overlap with a change of the
+        channel epochs, given as (stream, start, end) tuples (end may be None)."""
+
+        self.logger.debug("Searching files for %d changed channel epochs" % len(changes))
+
+        epochs = dict()
+        for stream, start, end in changes:
+            epochs.setdefault(stream, []).append((start, end))
+
+        # Only the directories of the streams, then the days of the epochs
+        self._filter(path_filter=SDSPathFilter([glob.escape(stream) + ".*.*.*"
+                                                for stream in epochs
+                                                if len(stream.split(".")) == 4]),
+                     file_filter=lambda x: self._select_epochs(x, epochs),
+                     query=("stream IN (SELECT value FROM {values})", [], list(epochs)))
+
+    @staticmethod
+    def _select_none(file_set):
+        return np.zeros(len(file_set), dtype=bool)
+
+    @staticmethod
+    def _select_epochs(file_set, epochs):
+        """Returns the mask of the files whose stream and day overlap with one of
+        the (start, end) epochs of their stream."""
+
+        mask = np.zeros(len(file_set), dtype=bool)
+
+        # The files of every stream, from the sorted streams
+        streams = file_set.streams
+        order = np.argsort(streams, kind="mergesort")
+        streams = streams[order]
+
+        for stream, stream_epochs in epochs.items():
+
+            indices = order[np.searchsorted(streams, stream, side="left"):
+                            np.searchsorted(streams, stream, side="right")]
+            ordinals = file_set.ordinal[indices]
+
+            for start, end in stream_epochs:
+
+                # The days that start before the end of the epoch, and end after its start
+                selected = ordinals >= start.toordinal()
+                if end is not None:
+                    last = end.toordinal() + (end != datetime.fromordinal(end.toordinal()))
+                    selected &= ordinals < last
+                mask[indices[selected]] = True
+
+        return mask
 
     def sort_files(self, order):
         """Sort files by filename."""
         self.logger.debug("Sorting files by filename (%s)" % order)
-        self.files = sorted(self.files, key=lambda sdsfile: sdsfile.filename,
-                            reverse=(order == "desc"))
+        self.files = self.files.sorted(reverse=(order == "desc"))
         self.logger.debug("Sorting finished")
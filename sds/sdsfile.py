@@ -9,17 +9,25 @@
 """
 
 import os
-import requests
 import subprocess
 import base64
 import logging
+import sys
 import ctypes
+import threading
+import weakref
 
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from hashlib import sha256
 from zlib import adler32
 
-from obspy import read_inventory, UTCDateTime
 from configuration import config
+from core.database import checksum_database
+
+
+# Marks a stat snapshot that has not been taken yet (`None` means that the file does not exist)
+_NOT_STATTED = object()
 
 
 class SDSFile():
@@ -48,39 +56,68 @@ class SDSFile():
         Day of the year, in DDD format (i.e., it goes from "001" to "366").
     """
 
+    # Millions of these are held by the collector, so they do not have a __dict__
+    __slots__ = ("net", "sta", "loc", "cha", "quality", "year", "day", "archive_root",
+                 "_ordinal", "_stats", "_checksum", "_irods_checksum", "_inventory",
+                 "_traces", "_location", "__weakref__")
+
+    # Shared by all the files
+    logger = logging.getLogger("RuleManager")
+
     # Save some configuration to the class
     irods_root = config["IRODS_ROOT"]
     fdsnws = config["FDSNWS_ADDRESS"]
     s3_prefix = config["S3"]["PREFIX"]
 
+    # Size of the chunks in which the file is read to compute checksums
+    checksum_chunk_size = 1024 * 1024
+
     def __init__(self, filename, archive_root):
         """
         Create a filestream from a given filename
         """
 
-        try:
-            # Extract stream identification
-            (self.net,
-             self.sta,
-             self.loc,
-             self.cha,
-             self.quality,
-             self.year,
-             self.day) = filename.split(".")
-        except ValueError:
-            raise ValueError("Invalid SDS file submitted.")
+        # Extract stream identification
+        (self.net,
+         self.sta,
+         self.loc,
+         self.cha,
+         self.quality,
+         self.year,
+         self.day,
+         self._ordinal) = self.parse_filename(filename)
 
         self.archive_root = archive_root
 
-        # Initialize logger
-        self.logger = logging.getLogger("RuleManager")
-
         # Initialize costly properties
+        self._stats = _NOT_STATTED
         self._checksum = None
+        self._irods_checksum = None
         self._inventory = None
         self._traces = None
         self._location = None
 
+    @staticmethod
+    def parse_filename(filename):
+        """
+        def SDSFile::parse_filename
+        Returns the codes, year and day of an SDS filename, followed by the day as a
+        proleptic Gregorian ordinal, or raises a ValueError if it is not valid
+        """
+
+        try:
+            # The codes are shared by many files
+            net, sta, loc, cha, quality, year, day = map(sys.intern, filename.split("."))
+
+            day_of_year = int(day)
+            if not 1 <= day_of_year <= 366:
+                raise ValueError()
+            ordinal = date(int(year), 1, 1).toordinal() + day_of_year - 1
+        except ValueError:
+            raise ValueError("Invalid SDS file submitted.")
+
+        return net, sta, loc, cha, quality, year, day, ordinal
+
     # Returns the filename
     @property
     def filename(self):
@@ -178,12 +215,12 @@ class SDSFile():
     # Returns start time of file
     @property
     def start(self):
-        return datetime.strptime(self.year + " " + self.day, "%Y %j")
+        return datetime.fromordinal(self._ordinal)
 
     # Returns end time of file
     @property
     def end(self):
-        return self.start + timedelta(days=1)
+        return datetime.fromordinal(self._ordinal + 1)
 
     # Start for dataselect pruning (start is INCLUSIVE)
     @property
@@ -198,27 +235,97 @@ class SDSFile():
     # Returns list of files neighbouring a file
     @property
     def neighbours(self):
-        return filter(lambda x: os.path.isfile(x.filepath), [self.previous, self, self.next])
+        return filter(lambda x: x.stats is not None, [self.previous, self, self.next])
+
+    def neighbour_sources(self, end=None):
+        """
+        def SDSFile::neighbour_sources
+        Returns the sources of the data of this day for the ObsPy readers: this file, and the
+        records of the previous and next files that overlap with the day (or until `end`),
+        without reading the rest of those files. The files are taken from the waveform cache
+        if it is enabled
+        """
+
+        from sds.mseed import read_records, RecordBuffer
+
+        end = end or self.end
+
+        sources = []
+        for neighbour in self.neighbours:
+
+            # None if the cache is disabled, or the file does not fit
+            contents = waveform_cache.read(neighbour)
+
+            if neighbour is self:
+                sources.append(self.filepath if contents is None else RecordBuffer(contents))
+                continue
+
+            try:
+                records = read_records(neighbour.filepath, self.start, end, contents=contents)
+            except ValueError as e:
+                self.logger.debug("Unable to index %s (%s), reading the whole file."
+                                  % (neighbour.filename, str(e)))
+                sources.append(neighbour.filepath)
+                continue
+
+            # No records of the neighbour in the day
+            if records.getbuffer().nbytes > 0:
+                sources.append(records)
+
+        return sources
 
     @property
     def stats(self):
-        try:
-            return os.stat(self.filepath)
-        except FileNotFoundError:
-            return None
+        """
+        def SDSFile::stats
+        Returns a snapshot of the stat of the file, or None if it does not exist.
+        The snapshot is taken on first access, call `invalidate` after changing the file.
+        """
+
+        if self._stats is _NOT_STATTED:
+            try:
+                self._stats = os.stat(self.filepath)
+            except FileNotFoundError:
+                self._stats = None
+
+        return self._stats
+
+    def set_stats(self, stats):
+        """
+        def SDSFile::set_stats
+        Sets the stat snapshot of the file to one taken elsewhere (e.g., while
+        walking the archive), unless a snapshot was taken already
+        """
+
+        if self._stats is _NOT_STATTED:
+            self._stats = stats
+
+    def invalidate(self):
+        """
+        def SDSFile::invalidate
+        Drops the cached stat snapshot and the properties computed from the
+        file contents, after the file was modified, moved or deleted.
+        """
+
+        self._stats = _NOT_STATTED
+        self._checksum = None
+        self._irods_checksum = None
+        self._traces = None
 
     def get_stat(self, enum):
 
+        stats = self.stats
+
         # Check if none and propagate
-        if self.stats is None:
+        if stats is None:
             return None
 
         if enum == "size":
-            return self.stats.st_size
+            return stats.st_size
         elif enum == "created":
-            return datetime.fromtimestamp(self.stats.st_ctime)
+            return datetime.fromtimestamp(stats.st_ctime)
         elif enum == "modified":
-            return datetime.fromtimestamp(self.stats.st_mtime)
+            return datetime.fromtimestamp(stats.st_mtime)
 
     @property
     def size(self):
@@ -246,13 +353,71 @@ class SDSFile():
         if self.stats is None:
             return None
 
-        checksum = None
-        with open(self.filepath, "rb") as f:
-            checksum = adler32(f.read()) & 0xffffffff
-            checksum = ctypes.c_int32(checksum).value
-        self._checksum = checksum
+        self._compute_checksums(irods=False)
         return self._checksum
 
+    @property
+    def irods_checksum(self):
+        """
+        def SDSFile::irods_checksum
+        Calculates the SHA-256 checksum for a given file, in the form used by
+        iRODS ("sha2:" followed by the base64 encoded digest)
+        """
+
+        if self._irods_checksum is not None:
+            return self._irods_checksum
+
+        if self.stats is None:
+            return None
+
+        self._compute_checksums(irods=True)
+        return self._irods_checksum
+
+    def _compute_checksums(self, irods=False):
+        """Reads the file once, in chunks of `checksum_chunk_size` bytes, and
+        computes its Adler-32 checksum and, if `irods` is `True`, its SHA-256
+        checksum, so that memory use does not grow with the size of the file.
+
+        The checksums are taken from the checksum database instead if the file
+        did not change since they were cached, and cached otherwise."""
+
+        path = os.path.abspath(self.filepath)
+        stats = self.stats
+
+        # Use the cached checksums if they are all there
+        checksum, irods_checksum = checksum_database.get(path, stats)
+        if checksum is not None and (irods_checksum is not None or not irods):
+            self._checksum = checksum
+            self._irods_checksum = irods_checksum
+            return
+
+        checksum = 1
+        irods_checksum = sha256() if irods else None
+
+        # The contents of the file may be in memory already
+        contents = waveform_cache.peek(self)
+        if contents is not None:
+            checksum = adler32(contents, checksum)
+            if irods_checksum is not None:
+                irods_checksum.update(contents)
+        else:
+            buffer = bytearray(self.checksum_chunk_size)
+            view = memoryview(buffer)
+            with open(self.filepath, "rb", buffering=0) as f:
+                while True:
+                    n_bytes = f.readinto(buffer)
+                    if not n_bytes:
+                        break
+                    checksum = adler32(view[:n_bytes], checksum)
+                    if irods_checksum is not None:
+                        irods_checksum.update(view[:n_bytes])
+
+        self._checksum = ctypes.c_int32(checksum & 0xffffffff).value
+        if irods_checksum is not None:
+            self._irods_checksum = "sha2:" + base64.b64encode(irods_checksum.digest()).decode()
+
+        checksum_database.add(path, stats, self._checksum, self._irods_checksum)
+
     @property
     def query_string_txt(self):
 
@@ -308,12 +473,32 @@ class SDSFile():
     def traces(self):
         """
         def SDSFile::traces
-        Returns a list of traces
+        Returns a list of traces, read from the record headers of the file and its neighbours
         """
 
         if self._traces is not None:
             return self._traces
 
+        # Read the record headers, NumPy is only imported when needed
+        from sds.mseed import scan_traces
+
+        neighbours = list(map(lambda x: x.filepath, self.neighbours))
+        try:
+            self._traces = scan_traces(neighbours, self.start,
+                                       self.end - timedelta(microseconds=1))
+        except ValueError as e:
+            self.logger.debug("Unable to scan %s (%s), using dataselect and msi."
+                              % (self.filename, str(e)))
+            self._traces = self._msi_traces(neighbours)
+
+        return self._traces
+
+    def _msi_traces(self, neighbours):
+        """
+        def SDSFile::_msi_traces
+        Returns a list of traces, using dataselect and msi
+        """
+
         def parse_msi_output(line):
             """Parse the MSI output."""
 
@@ -338,7 +523,7 @@ class SDSFile():
             "-Ps",
             "-szs",
             "-o", "-",
-        ] + list(map(lambda x: x.filepath, self.neighbours)), stdout=subprocess.PIPE)
+        ] + neighbours, stdout=subprocess.PIPE)
 
         lines = subprocess.check_output([
             "msi",
@@ -356,8 +541,7 @@ class SDSFile():
         dataselect.wait()
 
         # Skip first header & final line
-        self._traces = list(map(parse_msi_output, lines[1:-1]))
-        return self._traces
+        return list(map(parse_msi_output, lines[1:-1]))
 
     @property
     def is_pressure_channel(self):
@@ -375,17 +559,23 @@ class SDSFile():
         if self._inventory is not None:
             return self._inventory
 
-        # Query our FDSNWS Webservice for the station location
-        request = os.path.join(self.fdsnws, self.query_string_xml)
+        # Read from the local StationXML files
+        if config.get("METADATA_BACKEND", "fdsnws") == "stationxml":
+            from sds.metadatafile import metadata_index
+            self._inventory = metadata_index.inventory(self)
+            return self._inventory
+
+        # The inventory of the whole station is fetched once, and shared by the channel epochs
+        from sds.inventory import inventory_cache
 
         try:
-            self._inventory = read_inventory(request)
+            self._inventory = inventory_cache.get(self)
 
         # Re-raise in case this is the Rule Manager timeout going off
         except TimeoutError:
             raise
 
-        # Deal with an Exception from read_inventory
+        # Deal with an Exception from the inventory
         except Exception:
             return None
 
@@ -401,39 +591,27 @@ class SDSFile():
         if self._location is not None:
             return self._location
 
-        # Query our FDSNWS Webservice for the station location
-        try:
-            request = requests.get(os.path.join(self.fdsnws, self.query_string_txt))
-        except requests.exceptions.RequestException:
-            return None
-
-        # Any error just ignore
-        if request.status_code != 200:
-            return None
-
-        lines = request.text.split("\n")
-
-        # Multiple lines means that the location is somehow ambiguous
-        if len(lines) != 3:
-            return None
+        # Read from the local StationXML files
+        if config.get("METADATA_BACKEND", "fdsnws") == "stationxml":
+            from sds.metadatafile import metadata_index
+            self._location = metadata_index.location(self)
+            return self._location
 
-        # Some magic parsing: fields 4, 5, 6 on the 2nd line
-        (latitude, longitude, elevation) = lines[1].split("|")[4:7]
+        # The locations of all the streams of the run are fetched at once
+        from sds.location import location_resolver
 
-        self._location = {
-            "longitude": float(longitude),
-            "latitude": float(latitude),
-            "elevation": float(elevation)
-        }
+        self._location = location_resolver.get(self)
         return self._location
 
     @property
     def psd_bins(self):
         """Return 48 times starting at the start of the SDSFile with 30 minute increments."""
 
+        from obspy import UTCDateTime
         return map(UTCDateTime, map(lambda x: self.start + timedelta(minutes=(30 * x)), range(48)))
 
-    def prune(self, cut_boundaries=True, remove_overlap=False, repack=False, record_length=4096):
+    def prune(self, cut_boundaries=True, remove_overlap=False, repack=False, record_length=4096,
+              engine="dataselect"):
         """Preprocess file using IRIS dataselect and msrepack, and saves the resulting file
         with the quality indicator set to Q.
 
@@ -458,6 +636,14 @@ class SDSFile():
             Whether or not to repack records using msrepack. (default `False`)
         `record_length` : `int`
             Size of record to repack if `repack` is `True`. (default 4096)
+        `engine` : `str`
+            Whether to prune with the IRIS tools ("dataselect") or in this
+            process with ObsPy ("obspy"). (default "dataselect")
+
+        Returns
+        -------
+        `SDSFile`
+            The pruned file, with the quality indicator set to Q.
 
         """
         # Record length within some bounds
@@ -468,9 +654,8 @@ class SDSFile():
         if record_length & (record_length - 1) != 0:
             raise ValueError("Record length is not is a power of two")
 
-        # Create a phantom SDSFile with a different quality idenfier
-        quality_file = SDSFile(self.filename, self.archive_root)
-        quality_file.quality = "Q"
+        # The SDSFile with a different quality idenfier
+        quality_file = sds_file_registry.get(self.custom_quality_filename("Q"), self.archive_root)
 
         # Create directories for the pruned file (quality Q)
         if not os.path.exists(quality_file.directory):
@@ -479,6 +664,27 @@ class SDSFile():
         # Get neighbours
         neighbours = list(map(lambda x: x.filepath, self.neighbours))
 
+        if engine == "dataselect":
+            self._prune_dataselect(quality_file, neighbours, cut_boundaries, remove_overlap,
+                                   repack, record_length)
+        elif engine == "obspy":
+            self._prune_obspy(quality_file, neighbours, cut_boundaries, remove_overlap,
+                              repack, record_length)
+        else:
+            raise ValueError("Unknown pruning engine %s" % engine)
+
+        # Check that quality file has been created
+        if quality_file.stats is not None:
+            self.logger.debug("Created pruned file %s" % quality_file.filename)
+        else:
+            raise Exception("Pruned file %s has not been created!" % quality_file.filename)
+
+        return quality_file
+
+    def _prune_dataselect(self, quality_file, neighbours, cut_boundaries, remove_overlap,
+                          repack, record_length):
+        """Prunes the file with `dataselect` and `msrepack`, see `prune`."""
+
         # Define dataselect arguments
         # -Ps prunes to sample level
         # -Q set quality indicator to Q
@@ -523,7 +729,12 @@ class SDSFile():
         dataselect.stdout.close()
 
         # Wait for child processes to terminate
-        if dataselect.wait() != 0 or (repack and msrepack.wait() != 0):
+        failed = dataselect.wait() != 0 or (repack and msrepack.wait() != 0)
+
+        # The pruned file was (re)written, possibly in place
+        quality_file.invalidate()
+
+        if failed:
             if repack:
                 raise Exception(("Unable to prune file "
                                  "(dataselect returned %s, msrepack returned %s)")
@@ -532,16 +743,75 @@ class SDSFile():
                 raise Exception("Unable to prune file (dataselect returned %s)"
                                 % (str(dataselect.returncode)))
 
-        # Check that quality file has been created
-        if os.path.exists(quality_file.filepath):
-            self.logger.debug("Created pruned file %s" % quality_file.filename)
+    def _prune_obspy(self, quality_file, neighbours, cut_boundaries, remove_overlap,
+                     repack, record_length):
+        """Prunes the file in this process with ObsPy, see `prune`.
+
+        Unlike `dataselect`, all the records are encoded again, with the length
+        of the original records unless `repack` is `True`. Overlapping samples
+        are removed by `Stream.merge`, which keeps the samples of the later trace
+        (as `-Ps`). Otherwise, only the traces covered by another one, e.g.
+        duplicated records, are removed (as `-Pe`). Traces of the same stream with
+        different sample rates are pruned separately.
+        """
+
+        from obspy import read, Stream, UTCDateTime
+
+        # Read all the neighbours before writing, the file may be pruned in place
+        # Without cutting at the day boundaries, the neighbours are read entirely
+        stream = Stream()
+        for source in (self.neighbour_sources() if cut_boundaries else neighbours):
+            stream += read(source, format="MSEED")
+
+        # Cut file at the day boundaries if requested (both INCLUSIVE)
+        if cut_boundaries:
+            stream.trim(UTCDateTime(self.start), UTCDateTime(self.end) - 1e-6,
+                        nearest_sample=False)
+
+        # Stream.merge does not merge traces with different sample rates
+        groups = dict()
+        for trace in stream:
+            groups.setdefault((trace.id, trace.stats.sampling_rate), Stream()).append(trace)
+
+        stream = Stream()
+        for group in groups.values():
+
+            # Remove the overlaps at the sample level, and split the traces at the gaps
+            if remove_overlap:
+                group.merge(method=1)
+                stream += group.split()
+                continue
+
+            # Remove the traces within the time span of a previous one, the longest first
+            end = None
+            for trace in sorted(group, key=lambda x: (x.stats.starttime, -x.stats.npts)):
+                if end is not None and trace.stats.endtime <= end:
+                    continue
+                stream.append(trace)
+                end = trace.stats.endtime
+
+        # Remove traces with 0 samples (may result in empty pruned files), and sort
+        stream.traces = [trace for trace in stream if trace.stats.npts > 0]
+        stream.sort()
+
+        # Write to a temporary file, and replace the pruned file when complete
+        temporary_path = quality_file.filepath + ".tmp"
+        if len(stream) == 0:
+            open(temporary_path, "wb").close()
         else:
-            raise Exception("Pruned file %s has not been created!" % quality_file.filename)
+            for trace in stream:
+                trace.stats.mseed.dataquality = "Q"
+            stream.write(temporary_path, format="MSEED",
+                         reclen=record_length if repack else None)
+        os.replace(temporary_path, quality_file.filepath)
+
+        # The pruned file was (re)written, possibly in place
+        quality_file.invalidate()
 
     def _get_adjacent_file(self, direction):
         """Private function that returns adjacent SDSFile based on direction."""
 
-        new_date = self.start + timedelta(days=direction)
+        new_date = date.fromordinal(self._ordinal + direction)
 
         # The year and day may change
         new_year = new_date.strftime("%Y")
@@ -557,7 +827,191 @@ class SDSFile():
             new_day
         ])
 
-        return SDSFile(new_filename, self.archive_root)
+        return sds_file_registry.get(new_filename, self.archive_root)
 
     def __str__(self):
         return "%s (%s)" % (self.filename, self.modified)
+
+
+class SDSFileRegistry():
+
+    """
+    Class SDSFileRegistry
+    Resolves a filename and archive root to a single shared SDSFile, so that the
+    properties it caches (stat, checksums, traces, ...) are shared by all the
+    users of the file, e.g., by the neighbours of consecutive days of a stream.
+
+    Files still in use elsewhere are found through weak references, and the
+    `max_size` most recently requested files are kept alive by the registry
+    itself, so its memory is bounded. It is safe to use from several threads,
+    and a forked process starts with an empty registry.
+    """
+
+    def __init__(self, max_size):
+
+        self.max_size = max_size
+        self._reset()
+
+        # A child process must not inherit the lock, or the state cached by the parent
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+
+        self._lock = threading.Lock()
+
+        # (filename, archive root) -> SDSFile
+        self._files = weakref.WeakValueDictionary()
+        self._recent = OrderedDict()
+
+    def get(self, filename, archive_root):
+        """Returns the SDSFile for a filename in an archive, creating it if needed.
+
+        Raises
+        ------
+        `ValueError`
+            Raised if `filename` is not a valid SDS filename.
+        """
+
+        key = (filename, archive_root)
+
+        with self._lock:
+
+            sds_file = self._files.get(key)
+            if sds_file is None:
+                sds_file = SDSFile(filename, archive_root)
+                self._files[key] = sds_file
+
+            # Keep the most recently requested files alive
+            self._recent[key] = sds_file
+            self._recent.move_to_end(key)
+            if len(self._recent) > self.max_size:
+                self._recent.popitem(last=False)
+
+        return sds_file
+
+    def files(self):
+        """Returns all the files still in use."""
+
+        with self._lock:
+            return list(self._files.values())
+
+    def clear(self):
+        """Forgets all the files, e.g. at the end of a run."""
+
+        with self._lock:
+            self._files.clear()
+            self._recent.clear()
+
+    def __len__(self):
+        return len(self._files)
+
+
+class WaveformCache():
+
+    """
+    Class WaveformCache
+    Keeps the contents of the most recently read files in memory, up to `max_bytes`, so
+    that the consecutive days of a stream, processed in order, read every file from the
+    disk once, although the file is read as the next day, the day itself and the previous
+    day. A file is identified by its path and stat snapshot (inode, size and modification
+    time), so a file that changed is read again.
+
+    A `max_bytes` of 0 disables the cache. It is safe to use from several threads, and a
+    forked process starts with an empty cache.
+    """
+
+    def __init__(self, max_bytes):
+
+        self.max_bytes = max_bytes
+        self._reset()
+
+        # A child process must not inherit the lock, or the state cached by the parent
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+
+        self._lock = threading.Lock()
+
+        # filepath -> (stat signature, contents)
+        self._files = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def read(self, sds_file):
+        """Returns the contents of a file, from memory if possible, or None if the file
+        does not exist or does not fit in the cache."""
+
+        stats = sds_file.stats
+        if stats is None or self.max_bytes == 0 or stats.st_size > self.max_bytes:
+            return None
+
+        key = sds_file.filepath
+        signature = (stats.st_ino, stats.st_size, stats.st_mtime_ns)
+
+        with self._lock:
+            cached = self._files.get(key)
+            if cached is not None and cached[0] == signature:
+                self._files.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+
+        with open(sds_file.filepath, "rb") as f:
+            contents = f.read()
+
+        with self._lock:
+
+            # Replace the contents of a file that changed
+            cached = self._files.pop(key, None)
+            if cached is not None:
+                self.size -= len(cached[1])
+
+            self._files[key] = (signature, contents)
+            self.size += len(contents)
+
+            # Evict the least recently read files
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self._files.popitem(last=False)
+                self.size -= len(evicted)
+
+        return contents
+
+    def peek(self, sds_file):
+        """Returns the contents of a file if they are in memory, or None, without reading
+        the file nor counting a hit or a miss."""
+
+        stats = sds_file.stats
+        if stats is None or self.max_bytes == 0:
+            return None
+
+        with self._lock:
+            cached = self._files.get(sds_file.filepath)
+            if cached is not None and cached[0] == (stats.st_ino, stats.st_size, stats.st_mtime_ns):
+                return cached[1]
+
+        return None
+
+    def report(self):
+        """Returns a summary of the use of the cache, to be logged."""
+
+        with self._lock:
+            lookups = self.hits + self.misses
+            return ("Waveform cache: %d hits, %d misses (%.1f%% hit rate), %d files, %.1f MB"
+                    % (self.hits, self.misses, 100 * self.hits / lookups if lookups else 0,
+                       len(self._files), self.size / 1024 ** 2))
+
+    def clear(self):
+        """Forgets all the files, and resets the hit and miss counts."""
+
+        with self._lock:
+            self._files.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+
+
+sds_file_registry = SDSFileRegistry(config.get("SDS_FILE_REGISTRY_SIZE", 1024))
+waveform_cache = WaveformCache(config.get("WAVEFORM_CACHE_BYTES", 0))
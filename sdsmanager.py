@@ -4,12 +4,19 @@
 Script that runs the rules for managing the SDS archive.
 """
 
+import time
 import logging
 import argparse
 
 import core.logger
 from core.rulemanager import RuleManager
+from core.plan import write_plan, read_plan
+from core.database import metadata_change_database
+from sds.sdsfile import sds_file_registry, waveform_cache
 from sds.sdscollector import SDSFileCollector
+from sds.filelist import read_file_list
+from sds.metadatafile import metadata_index
+from sds.location import location_resolver
 import rules.sdsrules as sdsrules
 import conditions.sdsconditions as sdsconditions
 
@@ -34,51 +41,135 @@ def main():
                                   "within quotes (in the case of more than one string, any file "
                                   "that matches at least one of them is collected)"))
         parser.add_argument("--from_file",
-                            help="files to collect, listed in a text file or stdin '-'",
+                            help=("files to collect, listed in a text file or stdin '-' "
+                                  "(filenames, or the paths of the files written by collector.py "
+                                  "--format nul or jsonl, which are not looked up in the archive)"),
                             type=argparse.FileType("r"))
         parser.add_argument("--collect_finished",
                             help=("collect all files with modification date older that last "
                                   "midnight plus the given number of minutes"),
                             type=int)
+        parser.add_argument("--collect_metadata_changes",
+                            help=("detect the changes of the responses in the StationXML "
+                                  "files, and collect the files of the changed channel epochs "
+                                  "(including the changes detected in the given number of "
+                                  "previous days)"),
+                            type=int)
+        parser.add_argument("--scan_workers",
+                            help=("number of threads listing the directories of the archive "
+                                  "(defaults to the value in configuration.py, or 1)"),
+                            type=int)
+        parser.add_argument("--manifest",
+                            help=("how to find the files of the archive: walk it, or query its "
+                                  "manifest after refreshing the changed directories, or all "
+                                  "of them with 'full' (defaults to the manifest if "
+                                  "MANIFEST_DB is set in configuration.py)"),
+                            choices=["walk", "manifest", "full"])
         parser.add_argument("--sort",
                             help=("whether (and how) to sort collected files "
                                   "by name before processing them "
                                   "(defaults to none)"),
                             choices=["none", "asc", "desc"],
                             default="none")
+        parser.add_argument("--process_derived",
+                            help=("process the files created by the rules (e.g. pruned Q files) "
+                                  "with the rest of the sequence, in the same run"),
+                            action="store_true")
+        plan_group = parser.add_mutually_exclusive_group()
+        plan_group.add_argument("--plan",
+                                help=("only evaluate the rule conditions and write the plan of "
+                                      "rules that would be executed, with their expected cost, "
+                                      "to a file or stdout '-'"),
+                                type=argparse.FileType("w"))
+        plan_group.add_argument("--execute-plan",
+                                help=("execute the rules listed in a plan file, without "
+                                      "collecting files or checking conditions again"),
+                                type=argparse.FileType("r"))
         parsedargs = vars(parser.parse_args())
 
+        # Set up rules
+        RM = RuleManager()
+        RM.load_rules(sdsrules, sdsconditions, parsedargs["ruleseq"])
+
+        # Index the StationXML files once, before the rules and outside of their timeout
+        if config.get("METADATA_BACKEND", "fdsnws") == "stationxml":
+            if config.get("STATIONXML_DIRECTORY") is None:
+                return print("STATIONXML_DIRECTORY must be configured in configuration.py to "
+                             "use the stationxml METADATA_BACKEND")
+            metadata_index.refresh()
+
+        # Execute a previously written plan
+        if parsedargs["execute_plan"] is not None:
+            with parsedargs["execute_plan"] as plan_file:
+                plan = read_plan(plan_file,
+                                 lambda filename: sds_file_registry.get(filename, parsedargs["dir"]))
+            location_resolver.add_streams(entry["item"].id for entry in plan)
+            RM.execute_plan(plan)
+            if waveform_cache.max_bytes > 0:
+                logger.info(waveform_cache.report())
+            return logger.info("Finished SDS Manager execution.")
+
         # Check collection parameters
         if (parsedargs["collect_wildcards"] is None
             and parsedargs["from_file"] is None
-            and parsedargs["collect_finished"] is None):
+            and parsedargs["collect_finished"] is None
+            and parsedargs["collect_metadata_changes"] is None):
             return print("Files to collect need to be specified using "
-                         "--collect_wildcards, --from_file, and/or --collect_finished")
-
-        # Set up rules
-        RM = RuleManager()
-        RM.load_rules(sdsrules, sdsconditions, parsedargs["ruleseq"])
+                         "--collect_wildcards, --from_file, --collect_finished, "
+                         "and/or --collect_metadata_changes")
+        if (parsedargs["collect_metadata_changes"] is not None
+            and not metadata_change_database.enabled):
+            return print("METADATA_CHANGE_DB must be configured in configuration.py to use "
+                         "--collect_metadata_changes")
+        if (parsedargs["collect_metadata_changes"] is not None
+            and config.get("STATIONXML_DIRECTORY") is None):
+            return print("STATIONXML_DIRECTORY must be configured in configuration.py to use "
+                         "--collect_metadata_changes")
 
         # Collect files
-        file_collector = SDSFileCollector(parsedargs["dir"])
+        manifest = parsedargs["manifest"]
+        file_collector = SDSFileCollector(parsedargs["dir"], workers=parsedargs["scan_workers"],
+                                          manifest=None if manifest is None else manifest != "walk",
+                                          full_refresh=manifest == "full")
 
         if parsedargs["collect_wildcards"] is not None:
             file_collector.filter_from_wildcards_array(parsedargs["collect_wildcards"])
         if parsedargs["from_file"] is not None:
-            filename_list = []
             with parsedargs["from_file"] as list_file:
-                for line in list_file:
-                    filename_list.append(line.strip())
-            file_collector.filter_from_file_list(filename_list)
+                list_format, file_set = read_file_list(list_file, parsedargs["dir"])
+
+            # Filenames are looked up in the archive, listed paths are taken as they are
+            if list_format == "names":
+                file_collector.filter_from_file_list(file_set.filenames)
+            else:
+                file_collector.filter_from_file_set(file_set)
         if parsedargs["collect_finished"] is not None:
             file_collector.filter_finished_files(parsedargs["collect_finished"])
+        if parsedargs["collect_metadata_changes"] is not None:
+            since = time.time() - parsedargs["collect_metadata_changes"] * 86400
+            metadata_index.detect_changes()
+            file_collector.filter_from_metadata_changes(metadata_change_database.get_changes(since))
 
         # Sort files alphabetically
         if parsedargs["sort"] != "none":
             file_collector.sort_files(parsedargs["sort"])
 
+        # The coordinates of the streams of all the files are fetched together
+        location_resolver.add_streams(file_collector.files.streams.tolist())
+
+        # Only write the plan of the sequence of rules
+        if parsedargs["plan"] is not None:
+            with parsedargs["plan"] as plan_file:
+                n_items, total_cost = write_plan(RM.plan(file_collector.files), plan_file)
+            logger.info("Planned rules for %d of %d files, expected cost %.1f s."
+                        % (n_items, len(file_collector.files), total_cost))
+            return logger.info("Finished SDS Manager execution.")
+
         # Apply the sequence of rules on files
-        RM.sequence(file_collector.files)
+        RM.sequence(file_collector.files, process_derived=parsedargs["process_derived"])
+
+        if waveform_cache.max_bytes > 0:
+            logger.info(waveform_cache.report())
 
         logger.info("Finished SDS Manager execution.")
 
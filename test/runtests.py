@@ -1,12 +1,18 @@
 #!/usr/bin/env python3
 
+import io
 import os
+import json
 import sys
+import shutil
+import tempfile
 import unittest
+import requests
+import numpy as np
 
 from datetime import datetime, timedelta
 from unittest.mock import patch, PropertyMock
-from obspy import read_inventory
+from obspy import read, read_inventory, Stream, Trace, UTCDateTime
 
 CWD = os.path.abspath(os.path.dirname(__file__))
 
@@ -14,12 +20,21 @@ CWD = os.path.abspath(os.path.dirname(__file__))
 sys.path.append(os.path.dirname(CWD))
 from core.rulemanager import RuleManager
 
-from sds.sdscollector import SDSFileCollector
+from sds.sdscollector import SDSFileCollector, SDSPathFilter
+from sds.filecollector import DirectoryScanner
 
 # Modules
 from modules.irodsmanager import irodsSession
 from modules.psdcollector import psdCollector
-from sds.sdsfile import SDSFile
+from sds.sdsfile import SDSFile, WaveformCache
+from sds.inventory import InventoryCache
+from sds.location import LocationResolver
+from sds.metadatafile import MetadataIndex
+from sds.manifest import ArchiveManifest
+from sds.fileset import SDSFileSet
+from sds.filelist import write_file_list, read_file_list
+from sds.mseed import scan_traces
+from core.database import MetadataChangeDatabase, ManifestDatabase, checksum_database
 
 # Cleanup
 sys.path.pop()
@@ -133,6 +148,76 @@ class TestRuleManager(unittest.TestCase):
         # Assert the exception
         self.assertEqual("Invalid SDS file submitted.", str(ex.exception.args[0]))
 
+    def test_mseed_scanner(self):
+
+        """
+        def test_mseed_scanner
+        tests the trace summary read from the record headers against the traces read by ObsPy
+        """
+
+        # Neighbours are D files, only the Q file is read
+        sds_file = self.createSDSFile("NL.HGN.02.BHZ.Q.2019.022")
+        self.assertEqual(sds_file.traces, [{
+            "samples": 3456000,
+            "rate": 40.0,
+            "start": datetime(2019, 1, 22, 0, 0, 0, 19538),
+            "end": datetime(2019, 1, 22, 23, 59, 59, 994538)
+        }])
+
+        # Gap within the day, and samples after the day boundary cut
+        sds_file = self.createSDSFile("NL.HGN.02.BHZ.D.2019.021")
+        self.assertEqual(sds_file.traces, [{
+            "samples": 1518,
+            "rate": 40.0,
+            "start": datetime(2019, 1, 21, 15, 9, 44, 344538),
+            "end": datetime(2019, 1, 21, 15, 10, 22, 269538)
+        }, {
+            "samples": 329209,
+            "rate": 40.0,
+            "start": datetime(2019, 1, 21, 21, 42, 49, 794538),
+            "end": datetime(2019, 1, 21, 23, 59, 59, 994538)
+        }])
+        self.assertFalse(sds_file.continuous)
+
+    def test_mseed_record_index(self):
+
+        """
+        def test_mseed_record_index
+        tests that only the records of the neighbours within the day are read
+        """
+
+        # Only the last record of the previous file crosses the day boundary
+        sources = self.SDSReal.neighbour_sources()
+        self.assertEqual([source.getbuffer().nbytes for source in sources], [512])
+
+        # Same samples as read from the whole file, more than once
+        expected = read(self.SDSReal.previous.filepath, starttime=UTCDateTime(self.SDSReal.start))
+        for _ in range(2):
+            stream = read(sources[0], starttime=UTCDateTime(self.SDSReal.start))
+            self.assertEqual(stream[0].stats.starttime, expected[0].stats.starttime)
+            self.assertEqual(list(stream[0].data), list(expected[0].data))
+
+    def test_waveform_cache(self):
+
+        """
+        def test_waveform_cache
+        tests that a file is read once from the disk, and files too large are not kept
+        """
+
+        sds_file = self.createSDSFile("NL.HGN.02.BHZ.D.2019.021")
+        with open(sds_file.filepath, "rb") as f:
+            expected = f.read()
+
+        cache = WaveformCache(1024 * 1024)
+        self.assertEqual(cache.read(sds_file), expected)
+        self.assertEqual(cache.read(sds_file), expected)
+        self.assertEqual((cache.hits, cache.misses, cache.size), (1, 1, 414720))
+
+        # The file is larger than the cache
+        cache = WaveformCache(1024)
+        self.assertIsNone(cache.read(sds_file))
+        self.assertEqual(cache.size, 0)
+
     def test_rule_exception(self):
 
         """
@@ -380,6 +465,43 @@ class TestRuleManager(unittest.TestCase):
 
        self.SDSReal.prune()
 
+    def test_prune_obspy(self):
+
+        """
+        def test_prune_obspy
+        tests that the files pruned with ObsPy have the traces of the original files in the day
+        """
+
+        archive = os.path.join(tempfile.mkdtemp(), "SDS")
+        shutil.copytree(os.path.join(CWD, "data", "SDS"), archive)
+
+        # A duplicated record, and a sample rate change after a gap
+        header = {"network": "NL", "station": "TST", "location": "02", "channel": "BHZ"}
+        trace = Trace(np.arange(4000, dtype=np.int32), header=dict(
+            header, sampling_rate=40.0, starttime=UTCDateTime(2019, 1, 24, 1)))
+        other = Trace(np.arange(2000, dtype=np.int32), header=dict(
+            header, sampling_rate=20.0, starttime=UTCDateTime(2019, 1, 24, 5)))
+        sds_file = SDSFile("NL.TST.02.BHZ.D.2019.024", archive)
+        os.makedirs(sds_file.directory)
+        Stream([trace, trace.slice(trace.stats.starttime + 10, trace.stats.starttime + 20),
+                other]).write(sds_file.filepath, format="MSEED", reclen=512)
+
+        filenames = ["NL.HGN.02.BHZ.D.2019.021", "NL.HGN.02.BHZ.D.2019.023", sds_file.filename]
+        for filename in filenames:
+            sds_file = SDSFile(filename, archive)
+            expected = scan_traces([neighbour.filepath for neighbour in sds_file.neighbours],
+                                   sds_file.start, sds_file.end - timedelta(microseconds=1))
+            for remove_overlap in [True, False]:
+                quality_file = sds_file.prune(remove_overlap=remove_overlap, engine="obspy")
+                self.assertEqual(quality_file.traces, expected)
+
+                # Without the duplicated record
+                self.assertEqual(len(read(quality_file.filepath)), len(expected))
+
+        self.assertEqual([x["rate"] for x in expected], [40.0, 20.0])
+
+        shutil.rmtree(os.path.dirname(archive))
+
     def test_PID(self):
 
         is_new, pid = irodsSession.assignPID(self.SDSReal)
@@ -431,6 +553,364 @@ class TestRuleManager(unittest.TestCase):
 
         map(testSegment, enumerate(result))
 
+    def test_inventory_cache(self):
+
+        """
+        def test_inventory_cache
+        tests that the inventory of a station is fetched once for all its files
+        """
+
+        with open(os.path.join(CWD, "data/inventory.xml"), "rb") as f:
+            stationxml = f.read()
+
+        # Mock the FDSNWS response to avoid HTTP request
+        with patch("requests.get") as mock_get:
+
+            mock_get.return_value.status_code = 200
+            mock_get.return_value.content = stationxml
+            mock_get.return_value.headers = {"ETag": "\"1\""}
+
+            cache = InventoryCache("http://localhost/fdsnws/station/1/query", 16, 3600)
+            inventories = [cache.get(self.createSDSFile("NL.HGN.02.BHZ.D.2019.%03d" % day))
+                           for day in range(1, 4)]
+
+            # Channel without metadata, or before the epoch of the channel
+            self.assertIsNone(cache.get(self.createSDSFile("NL.HGN.02.BHN.D.2019.001")))
+            self.assertIsNone(cache.get(self.createSDSFile("NL.HGN.02.BHZ.D.2009.115")))
+
+        # Shared by the files of the same channel epoch
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(inventories[0].get_contents()["channels"], ["NL.HGN.02.BHZ"])
+        self.assertIs(inventories[1], inventories[0])
+        self.assertIs(inventories[2], inventories[0])
+
+    def test_location_resolver(self):
+
+        """
+        def test_location_resolver
+        tests that the coordinates of several streams are fetched in one request
+        """
+
+        text = "\n".join([
+            "#Network|Station|Location|Channel|Latitude|Longitude|Elevation|Depth|Azimuth|"
+            "Dip|SensorDescription|Scale|ScaleFreq|ScaleUnits|SampleRate|StartTime|EndTime",
+            "NL|HGN|02|BHZ|50.764|5.9317|135.0|4.0|0|-90|STS-2|1|1|M/S|40|2009-04-27T00:00:00|",
+            "NL|HGN|02|BHN|50.764|5.9317|135.0|4.0|0|0|STS-2|1|1|M/S|40|2009-04-27T00:00:00|"
+            "2019-01-02T00:00:00",
+            "NL|HGN|02|BHN|50.764|5.9317|136.0|4.0|0|0|STS-2|1|1|M/S|40|2019-01-02T00:00:00|"
+        ])
+
+        # Mock the FDSNWS response to avoid HTTP request
+        with patch("requests.Session.post") as mock_post:
+
+            mock_post.return_value.status_code = 200
+            mock_post.return_value.text = text
+
+            resolver = LocationResolver("http://localhost/fdsnws/station/1/query", 500, 3600)
+            sds_files = [self.createSDSFile(filename) for filename in [
+                "NL.HGN.02.BHZ.D.2019.001",
+                "NL.HGN.02.BHN.D.2019.001",
+                "NL.HGN.02.BHN.D.2019.003"
+            ]]
+            resolver.prefetch(sds_files)
+            locations = [resolver.get(sds_file) for sds_file in sds_files]
+
+            # Stream without metadata
+            self.assertIsNone(resolver.get(self.createSDSFile("NL.HGN.02.HHZ.D.2019.001")))
+
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertEqual(locations[0], {"longitude": 5.9317, "latitude": 50.764, "elevation": 135.0})
+
+        # Two epochs overlap with the day of the change
+        self.assertIsNone(locations[1])
+        self.assertEqual(locations[2]["elevation"], 136.0)
+
+        # The streams of the run are fetched together, and not again after a failure
+        with patch("requests.Session.post") as mock_post:
+
+            mock_post.side_effect = requests.exceptions.ConnectionError("down")
+
+            resolver = LocationResolver("http://localhost/fdsnws/station/1/query", 500, 3600)
+            resolver.add_streams(["NL.HGN.02.BHZ", "NL.HGN.02.BHN"])
+            for filename in ["NL.HGN.02.BHZ.D.2019.001", "NL.HGN.02.BHN.D.2019.001"]:
+                self.assertIsNone(resolver.get(self.createSDSFile(filename)))
+
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertIn("NL HGN 02 BHN * *", mock_post.call_args[1]["data"])
+
+
+    def test_metadata_index(self):
+
+        """
+        def test_metadata_index
+        tests the lookups of the channel epochs in a directory of StationXML files
+        """
+
+        index = MetadataIndex(os.path.join(CWD, "data"), 16)
+
+        sds_file = self.createSDSFile("NL.HGN.02.BHZ.D.2019.001")
+        self.assertEqual(index.location(sds_file),
+                         {"longitude": 5.9317, "latitude": 50.764, "elevation": 135.0})
+        self.assertEqual(index.inventory(sds_file).get_contents()["channels"], ["NL.HGN.02.BHZ"])
+
+        # Channel without metadata, or before the epoch of the channel
+        for filename in ["NL.HGN.02.BHN.D.2019.001", "NL.HGN.02.BHZ.D.2009.115"]:
+            self.assertIsNone(index.location(self.createSDSFile(filename)))
+            self.assertIsNone(index.inventory(self.createSDSFile(filename)))
+
+        # The directory must be configured
+        with self.assertRaises(ValueError):
+            MetadataIndex(None, 16).refresh()
+
+
+    def test_metadata_changes(self):
+
+        """
+        def test_metadata_changes
+        tests that only the channel epochs with a different response are changed
+        """
+
+        directory = tempfile.mkdtemp()
+        filepath = os.path.join(directory, "inventory.xml")
+        shutil.copy(os.path.join(CWD, "data/inventory.xml"), filepath)
+
+        database = MetadataChangeDatabase()
+        database.filename = os.path.join(directory, "changes.db")
+
+        with patch("sds.metadatafile.metadata_change_database", database):
+
+            index = MetadataIndex(directory, 16)
+
+            # The first run only stores the hashes
+            self.assertEqual(index.detect_changes(), [])
+            self.assertEqual(database.count(), 1)
+
+            with open(filepath) as f:
+                stationxml = f.read()
+
+            # Closing the epoch does not change the response
+            stationxml = stationxml.replace('startDate="2009-04-27T00:00:00"',
+                                            'startDate="2009-04-27T00:00:00" '
+                                            'endDate="2030-01-01T00:00:00"', 1)
+            with open(filepath, "w") as f:
+                f.write(stationxml)
+            self.assertEqual(index.detect_changes(), [])
+
+            with open(filepath, "w") as f:
+                f.write(stationxml.replace("<Value>3912450000</Value>", "<Value>1</Value>", 1))
+            self.assertEqual(index.detect_changes(), [
+                ("NL.HGN.02.BHZ", datetime(2009, 4, 27), datetime(2030, 1, 1))
+            ])
+
+        # Only the files of the changed epoch are affected
+        sds_file = self.createSDSFile("NL.HGN.02.BHZ.D.2019.001")
+        self.assertIsNotNone(database.get_last_change(sds_file.id, sds_file.start, sds_file.end))
+        sds_file = self.createSDSFile("NL.HGN.02.BHZ.D.2009.115")
+        self.assertIsNone(database.get_last_change(sds_file.id, sds_file.start, sds_file.end))
+
+        database.disconnect()
+        shutil.rmtree(directory)
+
+
+    def test_directory_scanner(self):
+
+        """
+        def test_directory_scanner
+        tests that the parallel scan finds the same files, in the same order if ordered
+        """
+
+        def scan(workers, ordered):
+            scanner = DirectoryScanner(workers=workers, ordered=ordered)
+            return [os.path.join(*parents, entry.name)
+                    for parents, entry in scanner.scan(os.path.join(CWD, "data"))]
+
+        serial = scan(1, True)
+        self.assertIn(os.path.join("SDS", "2019", "NL", "HGN", "BHZ.Q",
+                                   "NL.HGN.02.BHZ.Q.2019.022"), serial)
+        self.assertEqual(scan(4, True), serial)
+        self.assertEqual(sorted(scan(4, False)), sorted(serial))
+
+    def test_path_filter(self):
+
+        """
+        def test_path_filter
+        tests that the wildcards are matched field by field, and the directories with their parents
+        """
+
+        path_filter = SDSPathFilter(["NL.HGN.*.BH?.D.2019.*", "NA.SABA.*.[!B]HZ.D.2019.00?",
+                                     "NL.HGN.02.BHZ.Q.2019.022"])
+
+        self.assertTrue(path_filter.match_file("NL.HGN.02.BHZ.D.2019.022"))
+        self.assertTrue(path_filter.match_file("NA.SABA..HHZ.D.2019.001"))
+        self.assertTrue(path_filter.match_file("NL.HGN.02.BHZ.Q.2019.022"))
+        self.assertFalse(path_filter.match_file("NL.HGN.02.BHZ.Q.2019.023"))
+        self.assertFalse(path_filter.match_file("NA.SABA..BHZ.D.2019.001"))
+        self.assertFalse(path_filter.match_file("NA.SABA..HHZ.D.2019.010"))
+        self.assertFalse(path_filter.match_file("NA.HGN.02.BHZ.D.2019.022"))
+        self.assertFalse(path_filter.match_file("NL.HGN.02.BHZ.D.2019"))
+
+        # Not the station of the other network
+        self.assertTrue(path_filter.match_directory((), "2019"))
+        self.assertTrue(path_filter.match_directory(("2019",), "NA"))
+        self.assertTrue(path_filter.match_directory(("2019", "NL"), "HGN"))
+        self.assertFalse(path_filter.match_directory(("2019", "NA"), "HGN"))
+        self.assertTrue(path_filter.match_directory(("2019", "NL", "HGN"), "BHN.D"))
+        self.assertTrue(path_filter.match_directory(("2019", "NL", "HGN"), "BHZ.Q"))
+        self.assertFalse(path_filter.match_directory(("2019", "NL", "HGN"), "BHN.Q"))
+        self.assertFalse(path_filter.match_directory(("2019", "NL", "HGN"), "BHZ"))
+
+    def test_file_set(self):
+
+        """
+        def test_file_set
+        tests that the collected files are kept in columns, and become SDSFiles with their stat
+        """
+
+        collector = SDSFileCollector(os.path.join(CWD, "data", "SDS"), manifest=False)
+        collector.filter_from_date_range(datetime(2019, 1, 22), 2)
+        collector.sort_files("desc")
+
+        self.assertIsInstance(collector.files, SDSFileSet)
+        self.assertEqual(collector.files.filenames, ["NL.HGN.02.BHZ.Q.2019.022",
+                                                     "NL.HGN.02.BHZ.D.2019.023"])
+        self.assertEqual(list(collector.files.streams), ["NL.HGN.02.BHZ"] * 2)
+
+        # The stat taken while walking is kept
+        sds_file = collector.files[0]
+        self.assertIsInstance(sds_file, SDSFile)
+        self.assertEqual(sds_file.size, os.stat(sds_file.filepath).st_size)
+        self.assertEqual(sds_file.modified, datetime.fromtimestamp(os.stat(sds_file.filepath).st_mtime))
+        self.assertEqual([x.filename for x in collector.files], collector.files.filenames)
+
+        # Filtered in columns after the walk
+        collector.filter_finished_files(0)
+        self.assertEqual(len(collector.files), 2)
+        collector.filter_from_file_list(["NL.HGN.02.BHZ.D.2019.023"])
+        self.assertEqual(collector.files.filenames, ["NL.HGN.02.BHZ.D.2019.023"])
+
+        # Ranges of days, also in the sets selected from a set (by range, mask and order)
+        file_set = SDSFileSet.from_rows("/archive", [SDSFileSet.row("NL.HGN.02.BHZ.D.2019.%03d" % day)
+                                                     for day in [5, 3, 4, 1, 3, 2]])
+        first = datetime(2019, 1, 1).toordinal()
+        self.assertEqual(list(file_set.between("ordinal", first + 2, first + 4)), [1, 2, 4])
+        self.assertIs(file_set.select(file_set.between("ordinal", first, first + 5)), file_set)
+
+        selected = file_set.select(file_set.between("ordinal", first + 1, first + 4))
+        self.assertEqual(list(selected.between("ordinal", first + 3, first + 5)), [1])
+        selected = selected.select(selected.size < 0).sorted(reverse=True)
+        self.assertEqual(selected.filenames, ["NL.HGN.02.BHZ.D.2019.004", "NL.HGN.02.BHZ.D.2019.003",
+                                              "NL.HGN.02.BHZ.D.2019.003", "NL.HGN.02.BHZ.D.2019.002"])
+        self.assertEqual(list(selected.between("ordinal", first + 2, first + 3)), [1, 2])
+
+    def test_archive_manifest(self):
+
+        """
+        def test_archive_manifest
+        tests that the manifest follows the added and removed files, and finds the same files as a walk
+        """
+
+        directory = tempfile.mkdtemp()
+        archive = os.path.join(directory, "SDS")
+        shutil.copytree(os.path.join(CWD, "data/SDS"), archive)
+        channel = os.path.join(archive, "2019", "NL", "HGN", "BHZ.D")
+
+        database = ManifestDatabase()
+        database.filename = os.path.join(directory, "manifest.db")
+
+        manifest = ArchiveManifest(0)
+        manifest.MTIME_MARGIN = 0
+
+        def collect(**kwargs):
+            collector = SDSFileCollector(archive, **kwargs)
+            collector.filter_from_wildcards_array(["NL.HGN.*.BHZ.D.2019.*"])
+            return sorted(x.filename for x in collector.files)
+
+        with patch("sds.manifest.manifest_database", database), \
+             patch("sds.sdscollector.archive_manifest", manifest):
+
+            walked = collect(manifest=False)
+            self.assertIn("NL.HGN.02.BHZ.D.2019.021", walked)
+            self.assertEqual(collect(manifest=True), walked)
+
+            # Only in the changed directory
+            shutil.copy(os.path.join(channel, "NL.HGN.02.BHZ.D.2019.023"),
+                        os.path.join(channel, "NL.HGN.02.BHZ.D.2019.022"))
+            os.remove(os.path.join(channel, "NL.HGN.02.BHZ.D.2019.021"))
+            manifest.refresh(archive)
+            rows = manifest.query(archive, [("filename GLOB ?", ["*.D.2019.02?"], None)],
+                                  ordered=True)
+            self.assertEqual([row[0] for row in rows],
+                             ["NL.HGN.02.BHZ.D.2019.022", "NL.HGN.02.BHZ.D.2019.023"])
+
+            self.assertEqual(collect(manifest=True), collect(manifest=False))
+
+        database.disconnect()
+        shutil.rmtree(directory)
+
+    def test_file_list(self):
+
+        """
+        def test_file_list
+        tests that the lists written by the collector are read back without walking the archive
+        """
+
+        archive = os.path.join(CWD, "data", "SDS")
+        collector = SDSFileCollector(archive, manifest=False)
+        collector.filter_from_wildcards_array(["NL.HGN.*.BHZ.*.2019.*"])
+        filenames = sorted(collector.files.filenames)
+
+        def write(list_format, n_shards=1):
+            list_files = [io.StringIO() for _ in range(n_shards)]
+            write_file_list(collector.iter_file_sets(), list_files, list_format)
+            return [io.StringIO(list_file.getvalue()) for list_file in list_files]
+
+        for list_format in ["names", "nul", "jsonl"]:
+            read_format, file_set = read_file_list(write(list_format)[0], "/elsewhere")
+            self.assertEqual(read_format, list_format)
+            self.assertEqual(sorted(file_set.filenames), filenames)
+            self.assertEqual(file_set.archive_dir,
+                             "/elsewhere" if list_format == "names" else archive)
+
+            # The stat in a list is not trusted
+            self.assertFalse((file_set.mtime_ns >= 0).any())
+
+        # Invalid lines are skipped
+        read_format, file_set = read_file_list(io.StringIO(
+            write("jsonl")[0].getvalue() + '{"path": \n["path"]\n"path"\n{}\n'), archive)
+        self.assertEqual(sorted(file_set.filenames), filenames)
+
+        # The listed checksums are used while the file has the listed stat
+        path = os.path.join(archive, "2019", "NL", "HGN", "BHZ.D", "NL.HGN.02.BHZ.D.2019.021")
+        stats = os.stat(path)
+        record = {"path": path, "inode": stats.st_ino, "size": stats.st_size,
+                  "mtime_ns": stats.st_mtime_ns, "checksum": 1234}
+        with patch.dict(checksum_database._listed, clear=True), \
+                patch.object(checksum_database, "filename", None):
+            read_file_list(io.StringIO(json.dumps(record) + "\n"), archive)
+            self.assertEqual(checksum_database.get(path, stats), (1234, None))
+            self.assertEqual(checksum_database.get(path, os.stat(CWD)), (None, None))
+
+        # The files of a stream are in the same shard
+        shards = [read_file_list(shard, archive)[1] for shard in write("jsonl", 3)]
+        self.assertEqual(sorted(sum([x.filenames for x in shards], [])), filenames)
+        self.assertEqual(sum(1 for x in shards if len(x) > 0), 1)
+
+        # Taken as the files of the archive, with the filters given before
+        _, file_set = read_file_list(write("nul")[0], archive)
+        file_set = SDSFileSet.concatenate(archive, [file_set, SDSFileSet.from_rows(
+            archive, [SDSFileSet.row("NL.HGN.02.BHZ.D.2019.001")])])
+        listed = SDSFileCollector(archive, manifest=False)
+        listed.filter_from_wildcards_array(["*.*.*.*.D.*.*"])
+        with patch("sds.sdscollector.DirectoryScanner") as scanner:
+            listed.filter_from_file_set(file_set)
+            self.assertEqual(sorted(listed.files.filenames),
+                             ["NL.HGN.02.BHZ.D.2019.021", "NL.HGN.02.BHZ.D.2019.023"])
+            scanner.assert_not_called()
+
+        # The stat is taken for the files without one
+        sds_file = listed.files[0]
+        self.assertEqual(sds_file.size, os.stat(sds_file.filepath).st_size)
+
 
 if __name__ == "__main__":
     unittest.main()